@@ -3,420 +3,204 @@
 
 import os
 import sys
-import json
-import re
 import time
 import platform
-import subprocess
-import gzip
 from datetime import datetime
 
+_STARTED_AT = time.perf_counter()  # 启动计时起点（导入 Qt 之前）
+
 from PySide6 import QtCore, QtGui, QtWidgets
-import requests
 
-# -----------------------------
-# 应用常量与资源
-# -----------------------------
-APP_NAME = "CloudLight燕山大学校园网认证程序2.9"
-DEFAULT_CONFIG = {
-    "user": "",
-    "pwd": "",
-    "type": "校园网",
-
-    # 周期性检测（按 ping 判断是否有网）
-    "check_host": "www.baidu.com",     # 主：百度
-    "fallback_check_host": "223.5.5.5",# 备：阿里 AliDNS
-    "tertiary_check_host": "119.29.29.29",  # 第三：腾讯 DNS
-    "ping_timeout_ms": 1500,
-    "check_interval_sec": 30.0,             # 周期检测间隔（秒）
-
-    # 登录成功后的二次校验（留空/0 则回退到上面的目标与超时）
-    "post_login_check_host": "",
-    "post_login_fallback_host": "",
-    "post_login_tertiary_host": "",
-    "post_login_ping_timeout_ms": 0,
-
-    # 重连等待
-    "reconnect_wait_sec": 5.0,
-
-    # 程序行为
-    "auto_start_monitor": True,
-    "auto_start_with_windows": False,
-
-    # 日志保留
-    "max_log_lines": 1000
-}
-
-def appdata_dir():
-    base = os.environ.get("APPDATA") or os.path.expanduser("~")
-    path = os.path.join(base, APP_NAME)
-    os.makedirs(path, exist_ok=True)
-    return path
-
-def config_path():
-    return os.path.join(appdata_dir(), "config.json")
-
-def load_config():
-    path = config_path()
-    if os.path.exists(path):
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            for k, v in DEFAULT_CONFIG.items():
-                data.setdefault(k, v)
-            return data
-        except Exception:
-            pass
-    return DEFAULT_CONFIG.copy()
+from campus_core import (
+    APP_NAME, DEFAULT_CONFIG, config_path, load_config, save_config, resource_path,
+    Monitor, ConfigWatcher, ProbeHistory, LogRecord, format_log_record, dump_journal,
+    ControlServer, control_address, control_client
+)
 
-def save_config(cfg: dict):
-    with open(config_path(), "w", encoding="utf-8") as f:
-        json.dump(cfg, f, ensure_ascii=False, indent=2)
+ICON_PATH = resource_path("app.ico")
+_ICON = None
 
-def resource_path(rel: str) -> str:
-    if hasattr(sys, "_MEIPASS"):
-        return os.path.join(sys._MEIPASS, rel)
-    return os.path.join(os.path.dirname(os.path.abspath(__file__)), rel)
+def app_icon():
+    """程序图标只加载一次（ico 文件较大），窗口、托盘与气泡提示共用同一个 QIcon"""
+    global _ICON
+    if _ICON is None:
+        _ICON = QtGui.QIcon(ICON_PATH)
+    return _ICON
 
-ICON_PATH = resource_path("app.ico")
+# -----------------------------
+# 启动计时：各步骤相对进程启动（导入 Qt 之前）的耗时，首次检测完成后写入日志
+# -----------------------------
+class StartupProfile():
+    STEPS = (
+        ('imports', '导入'),
+        ('tray', '托盘'),
+        ('core', '监控线程'),
+        ('first_probe', '首次检测开始'),
+        ('first_result', '首次检测完成'),
+    )
+
+    def __init__(self, started_at=None):
+        self.started_at = _STARTED_AT if started_at is None else started_at
+        self.marks = {}  # 步骤 -> 秒
+
+    def mark(self, step):
+        """只记录每个步骤第一次发生的时刻"""
+        self.marks.setdefault(step, time.perf_counter() - self.started_at)
+
+    def report(self):
+        parts = [f"{name} {self.marks[step] * 1000:.0f} ms" for step, name in self.STEPS if step in self.marks]
+        return "启动耗时：" + " / ".join(parts)
 
 # -----------------------------
-# 原有登录逻辑（增强：安全解析 + 认证前先下线）
+# Qt 事件循环适配：把 Monitor 的 call_later / add_reader / call_soon_threadsafe 落到 worker 线程的 QTimer / QSocketNotifier / 排队信号上
 # -----------------------------
-class Main():
-    def __init__(self):
-        self.services = {
-            '校园网': '%e6%a0%a1%e5%9b%ad%e7%bd%91',
-            '中国移动': '%E4%B8%AD%E5%9B%BD%E7%A7%BB%E5%8A%A8',
-            '中国联通': '%e4%b8%ad%e5%9b%bd%e8%81%94%e9%80%9a',
-            '中国电信': '%e4%b8%ad%e5%9b%bd%e7%94%b5%e4%bf%a1',
-            '0': '%e6%a0%a1%e5%9b%ad%e7%bd%91',
-            '1': '%E4%B8%AD%E5%9B%BD%E7%A7%BB%E5%8A%A8',
-            '2': '%e4%b8%ad%e5%9b%bd%e8%81%94%e9%80%9a',
-            '3': '%e4%b8%ad%e5%9b%bd%e7%94%b5%e4%bf%a1'
-        }
-        self.url = 'http://auth.ysu.edu.cn/eportal/InterFace.do?method='
-        self.header = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/64.0.3282.140 Safari/537.36 Edge/17.17134',
-            'Accept-Encoding': 'gzip, deflate'
-        }
-        self.isLogined = None
-        self.alldata = None
-
-    # —— 安全解析：JSON —— #
-    def _json_from_response(self, res):
-        """
-        安全解析 JSON：
-        1) 优先 res.json()
-        2) 若失败，检查 gzip 头（1F 8B），尝试手动解压再解析
-        3) 再失败则按 UTF-8 严格解析
-        """
-        try:
-            return res.json()
-        except Exception:
-            data = res.content
-            if len(data) >= 2 and data[0] == 0x1F and data[1] == 0x8B:
-                try:
-                    decompressed = gzip.decompress(data)
-                    return json.loads(decompressed.decode('utf-8'))
-                except Exception:
-                    pass
-            return json.loads(data.decode('utf-8', errors='strict'))
-
-    # —— 安全解析：文本（用于从 HTML 中提取 queryString） —— #
-    def _text_from_response(self, res):
-        try:
-            return res.text
-        except Exception:
-            pass
-        data = res.content
-        try:
-            if len(data) >= 2 and data[0] == 0x1F and data[1] == 0x8B:
-                return gzip.decompress(data).decode('utf-8', errors='replace')
-            return data.decode('utf-8', errors='replace')
-        except Exception:
-            return ''
+class _QtCall(QtCore.QObject):
+    """一次延迟调用；回调连接到本对象的槽，保证在 owner 所在线程执行"""
+    def __init__(self, owner, delay_sec, callback):
+        super().__init__(owner)
+        self._callback = callback
+        self._done = False
+        self._timer = QtCore.QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._fire)
+        self._timer.start(int(max(0.0, delay_sec) * 1000))
 
-    def tst_net(self):
-        """是否已通过校园网认证（不代表外网可达）"""
-        res = requests.get('http://10.11.0.1', headers=self.header, timeout=5)
-        self.isLogined = ('success.jsp' in res.url)
-        return self.isLogined
+    @QtCore.Slot()
+    def _fire(self):
+        self._done = True
+        self.deleteLater()
+        self._callback()
+
+    def cancel(self):
+        if not self._done:
+            self._done = True
+            self._timer.stop()
+            self.deleteLater()
+
+class _QtReader(QtCore.QObject):
+    def __init__(self, owner, fd, callback):
+        super().__init__(owner)
+        self._callback = callback
+        self._notifier = QtCore.QSocketNotifier(fd, QtCore.QSocketNotifier.Read, self)
+        self._notifier.activated.connect(self._on_activated)
 
-    def _try_logout_once(self):
-        """无论是否在线，都尝试获取 userIndex 并调用 logout，失败忽略。"""
-        try:
-            if self.alldata is None:
-                try:
-                    res_info = requests.get('http://10.11.0.1/eportal/InterFace.do?method=getOnlineUserInfo', timeout=5)
-                    self.alldata = self._json_from_response(res_info)
-                except Exception:
-                    self.alldata = None
-
-            user_index = None
-            if isinstance(self.alldata, dict):
-                user_index = self.alldata.get('userIndex')
-
-            if user_index:
-                res = requests.post(self.url + 'logout', headers=self.header,
-                                    data={'userIndex': user_index}, timeout=8)
-                _ = self._json_from_response(res)
-        except Exception:
-            pass
-        finally:
-            self.alldata = None
+    @QtCore.Slot()
+    def _on_activated(self):
+        self._callback()
 
-    def login(self, user, pwd, type, code=''):
-        # 1) 无论是否在线，先“尝试下线”一次
-        self._try_logout_once()
+    def close(self):
+        self._notifier.setEnabled(False)
+        self.deleteLater()
 
-        # 2) 刷新状态
-        if self.isLogined is None:
-            try:
-                self.tst_net()
-            except Exception:
-                self.isLogined = False
-
-        # 3) 执行登录流程
-        if user == '' or pwd == '':
-            return (False, '用户名或密码为空')
-
-        # 3.1 先拿 queryString
-        res = requests.get('http://10.11.0.1', headers=self.header, timeout=5)
-        html = self._text_from_response(res)
-        query = re.findall(r"href='.*?\?(.*?)'", html, re.S)
-        if not query:
-            query = re.findall(r'href="[^"]+\?([^"]+)"', html, re.S)
-        query_string = query[0] if query else ''
-
-        # 3.2 提交
-        self.data = {
-            'userId': user,
-            'password': pwd,
-            'service': self.services.get(type, self.services['校园网']),
-            'operatorPwd': '',
-            'operatorUserId': '',
-            'validcode': code,
-            'passwordEncrypt': 'False',
-            'queryString': query_string
-        }
-        res = requests.post(self.url + 'login', headers=self.header, data=self.data, timeout=8)
-        login_json = self._json_from_response(res)
-        self.userindex = login_json.get('userIndex')
-        self.info = login_json.get('message', '')
-        if login_json.get('result') == 'success':
-            self.isLogined = True
-            return (True, '认证成功')
-        else:
-            self.isLogined = False
-            return (False, self.info)
-
-    def get_alldata(self):
-        res = requests.get('http://10.11.0.1/eportal/InterFace.do?method=getOnlineUserInfo', timeout=5)
-        self.alldata = self._json_from_response(res)
-        return self.alldata
-
-    def logout(self):
-        if self.alldata is None:
-            self.get_alldata()
-        user_index = None
-        if isinstance(self.alldata, dict):
-            user_index = self.alldata.get('userIndex')
-        if not user_index:
-            user_index = ''
-        res = requests.post(self.url + 'logout', headers=self.header,
-                            data={'userIndex': user_index}, timeout=8)
-        logout_json = self._json_from_response(res)
-        self.info = logout_json.get('message', '')
-        if logout_json.get('result') == 'success':
-            self.isLogined = False
-            return (True, '下线成功')
-        else:
-            return (False, self.info)
+class _QtPoster(QtCore.QObject):
+    """其他线程投递的回调：经排队连接在 owner 所在线程执行"""
+    posted = QtCore.Signal(object)
+
+    def __init__(self, owner):
+        super().__init__(owner)
+        self.posted.connect(self._run, QtCore.Qt.QueuedConnection)
+
+    @QtCore.Slot(object)
+    def _run(self, call):
+        call()
+
+class QtLoop():
+    def __init__(self, owner: QtCore.QObject):
+        self._owner = owner
+        self._readers = {}
+        self._poster = _QtPoster(owner)
+
+    def call_later(self, delay_sec, callback):
+        return _QtCall(self._owner, delay_sec, callback)
+
+    def call_soon_threadsafe(self, callback, *args):
+        self._poster.posted.emit(lambda: callback(*args))
+
+    def add_reader(self, fd, callback):
+        self.remove_reader(fd)
+        self._readers[fd] = _QtReader(self._owner, fd, callback)
+
+    def remove_reader(self, fd):
+        reader = self._readers.pop(fd, None)
+        if reader is not None:
+            reader.close()
 
 # -----------------------------
-# 监控 worker（QTimer 驱动，按 ping 三级检测）
+# 监控 worker：Monitor 状态机的 Qt 外壳，运行在独立 QThread 中，通过信号通知界面
 # -----------------------------
 class MonitorWorker(QtCore.QObject):
-    log = QtCore.Signal(str)
+    logBatch = QtCore.Signal(list)         # [LogRecord, ...]，按批跨线程投递
     runningChanged = QtCore.Signal(bool)
+    scheduleChanged = QtCore.Signal(dict)  # ProbeScheduler.snapshot()
+    phaseChanged = QtCore.Signal(dict)     # phase_snapshot()
+    statusChanged = QtCore.Signal(dict)    # status_snapshot()，供本机控制接口
 
     def __init__(self, cfg_getter):
         super().__init__()
         self._cfg_getter = cfg_getter
-        self._main = Main()
-        self._running = False
-        self._timer = QtCore.QTimer(self)
-        self._timer.setSingleShot(False)
-        self._timer.timeout.connect(self._tick)
+        self.history = ProbeHistory(self._raw_samples())  # 界面线程只读查询，内部加锁
+        self._monitor = Monitor(
+            cfg_getter, QtLoop(self),
+            on_log_batch=self.logBatch.emit,
+            on_running=self.runningChanged.emit,
+            on_schedule=self.scheduleChanged.emit,
+            on_phase=self.phaseChanged.emit,
+            on_status=self.statusChanged.emit,
+            history=self.history
+        )
 
     @QtCore.Slot()
     def start(self):
-        if self._running:
-            return
-        self._running = True
-        self.runningChanged.emit(True)
-        self._apply_interval_from_cfg()
-        self._timer.start()
-        self.log.emit(self._ts() + "监控已启动")
-        QtCore.QTimer.singleShot(0, self._tick)
+        self._monitor.start()
 
     @QtCore.Slot()
     def stop(self):
-        if not self._running:
-            return
-        self._running = False
-        self._timer.stop()
-        self.runningChanged.emit(False)
-        self.log.emit(self._ts() + "监控已停止")
+        self._monitor.stop()
 
-    def _ts(self):
-        return datetime.now().strftime("[%Y-%m-%d %H:%M:%S] ")
+    @QtCore.Slot()
+    def probe_now(self):
+        self._monitor.probe_now()
 
-    def _apply_interval_from_cfg(self):
-        cfg = self._cfg_getter()
-        try:
-            interval_sec = float(cfg.get("check_interval_sec", 30.0))
-        except Exception:
-            interval_sec = 30.0
-        interval_sec = max(1.0, interval_sec)
-        self._timer.setInterval(int(interval_sec * 1000))
-
-    def _ping_once(self, host, timeout_ms):
-        """静默 ping：Windows 下不弹出终端窗口"""
-        system = platform.system().lower()
-        if 'windows' in system:
-            cmd = ['ping', '-n', '1', '-w', str(int(timeout_ms)), host]
-            CREATE_NO_WINDOW = 0x08000000
-            si = subprocess.STARTUPINFO()
-            si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-            try:
-                proc = subprocess.run(
-                    cmd,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    timeout=(int(timeout_ms) / 1000.0 + 1),
-                    creationflags=CREATE_NO_WINDOW,
-                    startupinfo=si
-                )
-                return proc.returncode == 0
-            except Exception:
-                return False
-        else:
-            cmd = ['ping', '-c', '1', host]
-            try:
-                proc = subprocess.run(
-                    cmd,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    timeout=(int(timeout_ms) / 1000.0 + 1)
-                )
-                return proc.returncode == 0
-            except Exception:
-                return False
-
-    def _ping_chain_ok(self, hosts, timeout_ms):
-        """
-        依次按 hosts 进行 ping；任一成功即判定可达。
-        返回：(是否可达, 命中的 host 或最后一个尝试的 host)
-        """
-        tried = None
-        for h in hosts:
-            h = (h or '').strip()
-            if not h:
-                continue
-            # 跳过重复 host
-            if tried == h:
-                continue
-            tried = h
-            if self._ping_once(h, timeout_ms):
-                return True, h
-        # 全部失败：返回最后尝试的 host（用于日志）
-        return False, tried
-
-    def _sleep_with_cancel(self, sec):
-        """可中断睡眠，停止时能快速退出等待。"""
-        end = time.time() + max(0.0, float(sec))
-        while self._running and time.time() < end:
-            time.sleep(min(0.1, end - time.time()))
+    @QtCore.Slot()
+    def reauth_now(self):
+        self._monitor.reauth_now()
 
     @QtCore.Slot()
-    def _tick(self):
-        if not self._running:
-            return
-        self._apply_interval_from_cfg()
-        cfg = self._cfg_getter()
+    def publish_status(self):
+        """在 worker 线程里取一次当前状态，经 statusChanged 发出（其他线程不直接读 Monitor）"""
+        self.statusChanged.emit(self._monitor.status_snapshot())
 
-        # 读取检测参数（三级链：主→备→第三）
-        primary = (cfg.get("check_host") or "www.baidu.com").strip()
-        fallback = (cfg.get("fallback_check_host") or "223.5.5.5").strip()
-        tertiary = (cfg.get("tertiary_check_host") or "119.29.29.29").strip()
+    def _raw_samples(self):
         try:
-            tout = int(cfg.get("ping_timeout_ms", 1500))
+            return int(self._cfg_getter().get("history_raw_samples", 21600))
         except Exception:
-            tout = 1500
+            return 21600
 
-        # 1) 先按三级 ping 检测外网是否可达
-        ok, hit = self._ping_chain_ok([primary, fallback, tertiary], tout)
-        if ok:
-            self.log.emit(self._ts() + f"网络正常 | ping {hit} 成功")
-            return
+    @QtCore.Slot(dict)
+    def reload(self, old_cfg):
+        """配置已更新：只把变化的部分交给监控，不重启"""
+        self._monitor.reload(old_cfg)
+        # 曲线样本归 worker 所有，监控是否在运行都按新容量原地调整
+        self.history.resize(self._raw_samples())
 
-        # 2) 不通则尝试认证（认证前先下线的逻辑在 Main.login() 内部已实现）
-        self.log.emit(self._ts() + f"外网不通（{primary} / {fallback} / {tertiary} 均失败），尝试认证校园网...")
-        try:
-            state, info = self._main.login(
-                user=cfg.get("user", ""),
-                pwd=cfg.get("pwd", ""),
-                type=cfg.get("type", "校园网")
-            )
-            self.log.emit(self._ts() + f"认证结果：{info}")
-        except Exception as e:
-            self.log.emit(self._ts() + f"认证异常：{e}")
-            return
+    @property
+    def running(self):
+        return self._monitor.running
 
-        # 3) 若认证成功但外网仍不通 → 持续重试直到通或停止（三级 ping）
-        if state:
-            post_primary   = (cfg.get("post_login_check_host") or primary).strip()
-            post_fallback  = (cfg.get("post_login_fallback_host") or fallback).strip()
-            post_tertiary  = (cfg.get("post_login_tertiary_host") or tertiary).strip()
-            post_tout = int(cfg.get("post_login_ping_timeout_ms") or tout)
-            wait_sec = float(cfg.get("reconnect_wait_sec", 5.0))
-
-            while self._running:
-                self.log.emit(self._ts() + f"认证成功，3 秒后检查外网连通性（{post_primary} / {post_fallback} / {post_tertiary}）...")
-                self._sleep_with_cancel(3.0)
-                if not self._running:
-                    break
-
-                ok2, hit2 = self._ping_chain_ok([post_primary, post_fallback, post_tertiary], post_tout)
-                if ok2:
-                    self.log.emit(self._ts() + f"外网连通性正常（{hit2} 可达）")
-                    break  # 成功，结束重试
-
-                # 外网不通 → 下线并重试
-                self.log.emit(self._ts() + "外网仍不可达，执行下线并重试认证...")
-                try:
-                    self._main.logout()
-                except Exception as e:
-                    self.log.emit(self._ts() + f"下线异常：{e}")
-
-                self.log.emit(self._ts() + f"等待 {wait_sec} 秒后再重试认证...")
-                self._sleep_with_cancel(wait_sec)
-                if not self._running:
-                    break
-
-                try:
-                    state2, info2 = self._main.login(
-                        user=cfg.get("user", ""),
-                        pwd=cfg.get("pwd", ""),
-                        type=cfg.get("type", "校园网")
-                    )
-                    self.log.emit(self._ts() + f"重试认证结果：{info2}")
-                except Exception as e:
-                    self.log.emit(self._ts() + f"重试认证异常：{e}")
-                    continue
-            return
+    def phase_snapshot(self):
+        return self._monitor.phase_snapshot()
+
+    def schedule_snapshot(self):
+        return self._monitor.schedule_snapshot()
+
+    def metrics_snapshot(self):
+        return self._monitor.metrics_snapshot()
+
+    def session_snapshot(self):
+        return self._monitor.session_snapshot()
+
+    def portal_snapshot(self):
+        return self._monitor.portal_snapshot()
 
 # -----------------------------
 # 设置对话框（加入主/备/第三 ping 目标 & 日志限量）
@@ -425,7 +209,7 @@ class SettingsDialog(QtWidgets.QDialog):
     def __init__(self, cfg: dict, parent=None):
         super().__init__(parent)
         self.setWindowTitle("设置")
-        self.setWindowIcon(QtGui.QIcon(ICON_PATH))
+        self.setWindowIcon(app_icon())
         self.setModal(True)
         self.cfg = cfg.copy()
 
@@ -452,6 +236,25 @@ class SettingsDialog(QtWidgets.QDialog):
         self.sp_ping_timeout.setSingleStep(100)
         self.sp_ping_timeout.setValue(int(self.cfg.get("ping_timeout_ms", 1500)))
 
+        self.cmb_probe_mode = QtWidgets.QComboBox()
+        self.cmb_probe_mode.addItem("同时探测（首个成功即返回）", "parallel")
+        self.cmb_probe_mode.addItem("依次探测", "serial")
+        idx = self.cmb_probe_mode.findData(self.cfg.get("probe_mode", "parallel"))
+        if idx >= 0:
+            self.cmb_probe_mode.setCurrentIndex(idx)
+
+        self.cmb_probe_engine = QtWidgets.QComboBox()
+        self.cmb_probe_engine.addItem("进程内探测（ICMP / TCP / HTTP）", "socket")
+        self.cmb_probe_engine.addItem("系统 ping 命令", "ping")
+        idx = self.cmb_probe_engine.findData(self.cfg.get("probe_engine", "socket"))
+        if idx >= 0:
+            self.cmb_probe_engine.setCurrentIndex(idx)
+
+        target_tip = ("支持：主机名/IP（ICMP）、tcp://主机:端口、"
+                      "http://主机/generate_204（返回 204 视为出网）、ping://主机（系统 ping）")
+        for ed in (self.ed_host, self.ed_fallback, self.ed_tertiary):
+            ed.setToolTip(target_tip)
+
         self.sp_interval = QtWidgets.QDoubleSpinBox()
         self.sp_interval.setRange(0.01, 86400.0)
         self.sp_interval.setDecimals(2)
@@ -473,6 +276,8 @@ class SettingsDialog(QtWidgets.QDialog):
         self.ed_post_host = QtWidgets.QLineEdit(self.cfg.get("post_login_check_host", ""))
         self.ed_post_fallback = QtWidgets.QLineEdit(self.cfg.get("post_login_fallback_host", ""))
         self.ed_post_tertiary = QtWidgets.QLineEdit(self.cfg.get("post_login_tertiary_host", ""))
+        for ed in (self.ed_post_host, self.ed_post_fallback, self.ed_post_tertiary):
+            ed.setToolTip(target_tip)
         self.sp_post_timeout = QtWidgets.QSpinBox()
         self.sp_post_timeout.setRange(0, 20000)  # 0 表示回退到 ping_timeout_ms
         self.sp_post_timeout.setSingleStep(100)
@@ -483,6 +288,8 @@ class SettingsDialog(QtWidgets.QDialog):
         self.chk_auto_monitor.setChecked(bool(self.cfg.get("auto_start_monitor", True)))
         self.chk_boot = QtWidgets.QCheckBox("开机自启")
         self.chk_boot.setChecked(bool(self.cfg.get("auto_start_with_windows", False)))
+        self.chk_events = QtWidgets.QCheckBox("网卡 / 地址 / 路由变化时立即检测（仅 Linux）")
+        self.chk_events.setChecked(bool(self.cfg.get("event_driven_check", True)))
 
         # 布局到表单
         form.addRow("账号：", self.ed_user)
@@ -492,6 +299,8 @@ class SettingsDialog(QtWidgets.QDialog):
         form.addRow("检测目标（备）：", self.ed_fallback)
         form.addRow("检测目标（第三）：", self.ed_tertiary)
         form.addRow("ping 超时（毫秒）：", self.sp_ping_timeout)
+        form.addRow("探测方式：", self.cmb_probe_mode)
+        form.addRow("探测实现：", self.cmb_probe_engine)
         form.addRow("检测间隔（秒）：", self.sp_interval)
         form.addRow("重连时等待时间（秒）：", self.sp_reconnect_wait)
         form.addRow("日志最多保留行数：", self.sp_max_lines)
@@ -501,6 +310,7 @@ class SettingsDialog(QtWidgets.QDialog):
         form.addRow("登录后 ping 超时（毫秒，0=沿用）：", self.sp_post_timeout)
         form.addRow("", self.chk_auto_monitor)
         form.addRow("", self.chk_boot)
+        form.addRow("", self.chk_events)
 
         # 放入可滚动区域
         form_widget = QtWidgets.QWidget()
@@ -533,6 +343,8 @@ class SettingsDialog(QtWidgets.QDialog):
         self.cfg["fallback_check_host"] = self.ed_fallback.text().strip() or "223.5.5.5"
         self.cfg["tertiary_check_host"] = self.ed_tertiary.text().strip() or "119.29.29.29"
         self.cfg["ping_timeout_ms"] = int(self.sp_ping_timeout.value())
+        self.cfg["probe_mode"] = self.cmb_probe_mode.currentData()
+        self.cfg["probe_engine"] = self.cmb_probe_engine.currentData()
         self.cfg["check_interval_sec"] = float(self.sp_interval.value())
         self.cfg["reconnect_wait_sec"] = float(self.sp_reconnect_wait.value())
         self.cfg["max_log_lines"] = int(self.sp_max_lines.value())
@@ -543,35 +355,261 @@ class SettingsDialog(QtWidgets.QDialog):
         # 关键：写回两个行为设置
         self.cfg["auto_start_monitor"] = bool(self.chk_auto_monitor.isChecked())
         self.cfg["auto_start_with_windows"] = bool(self.chk_boot.isChecked())
+        self.cfg["event_driven_check"] = bool(self.chk_events.isChecked())
         return self.cfg
 
 
+# -----------------------------
+# 日志模型：LogRecord 环形缓冲，追加与淘汰均为 O(1)；配合 QListView 只绘制可见行
+# -----------------------------
+class LogRingModel(QtCore.QAbstractListModel):
+    LEVEL_COLORS = {'WARN': QtGui.QColor(176, 112, 0), 'ERROR': QtGui.QColor(192, 32, 32)}
+
+    def __init__(self, capacity=1000, parent=None):
+        super().__init__(parent)
+        self._cap = max(1, int(capacity))
+        self._buf = []    # LogRecord；未满时顺序追加，满后从 _head 处覆盖最旧的记录
+        self._head = 0
+        self._count = 0
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else self._count
+
+    def record(self, row):
+        return self._buf[(self._head + row) % len(self._buf)]
+
+    def line(self, row):
+        return format_log_record(self.record(row))
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self._count:
+            return None
+        if role == QtCore.Qt.DisplayRole:
+            return self.line(index.row())  # 只有可见行会被格式化
+        if role == QtCore.Qt.ForegroundRole:
+            return self.LEVEL_COLORS.get(self.record(index.row()).level)
+        if role == QtCore.Qt.ToolTipRole:
+            rec = self.record(index.row())
+            return f"{rec.level} | 阶段：{rec.phase or '-'}"
+        return None
+
+    def capacity(self):
+        return self._cap
+
+    def append(self, rec):
+        self.extend([rec])
+
+    def extend(self, records):
+        """成批追加：一次插入通知（满时再加一次淘汰通知），每条记录 O(1)"""
+        records = list(records)[-self._cap:]
+        k = len(records)
+        if not k:
+            return
+        root = QtCore.QModelIndex()
+        # 1) 先填满空位
+        free = min(self._cap - self._count, k)
+        if free:
+            self.beginInsertRows(root, self._count, self._count + free - 1)
+            self._buf.extend(records[:free])
+            self._count += free
+            self.endInsertRows()
+        rest = records[free:]
+        if not rest:
+            return
+        # 2) 已满：淘汰最旧的 r 条，再把新记录写入腾出的槽位
+        r = len(rest)
+        self.beginRemoveRows(root, 0, r - 1)
+        start = self._head
+        self._head = (self._head + r) % self._cap
+        self._count -= r
+        self.endRemoveRows()
+        self.beginInsertRows(root, self._count, self._count + r - 1)
+        for i, rec in enumerate(rest):
+            self._buf[(start + i) % self._cap] = rec
+        self._count += r
+        self.endInsertRows()
+
+    def set_capacity(self, capacity):
+        """修改上限：只保留最新的 capacity 条"""
+        capacity = max(1, int(capacity))
+        if capacity == self._cap:
+            return
+        self.beginResetModel()
+        records = [self.record(i) for i in range(self._count)][-capacity:]
+        self._buf = records
+        self._head = 0
+        self._count = len(records)
+        self._cap = capacity
+        self.endResetModel()
+
+    def clear(self):
+        self.beginResetModel()
+        self._buf = []
+        self._head = 0
+        self._count = 0
+        self.endResetModel()
+
+# -----------------------------
+# 探测历史曲线：平均 RTT 折线 + 不可达时段红色底纹；按控件宽度向 ProbeHistory 取合适分辨率
+# -----------------------------
+class HistoryChart(QtWidgets.QWidget):
+    RANGES = (
+        ("10 分钟", 600),
+        ("1 小时", 3600),
+        ("1 天", 86400),
+        ("7 天", 7 * 86400),
+        ("30 天", 30 * 86400),
+        ("1 年", 365 * 86400),
+    )
+    RESOLUTION_NAMES = {'raw': '逐次', 'minute': '每分钟', 'hour': '每小时', 'day': '每天'}
+    MARGIN_LEFT, MARGIN_TOP, MARGIN_RIGHT, MARGIN_BOTTOM = 56, 8, 8, 18
+
+    summaryChanged = QtCore.Signal(str)
+
+    def __init__(self, history, parent=None):
+        super().__init__(parent)
+        self._history = history
+        self._span = 3600
+        self._end = time.time()
+        self._resolution = 'raw'
+        self._points = []
+        self._widths = {name: width for name, width, _ in ProbeHistory.TIERS}
+        self.setMinimumHeight(110)
+        self._refresh_timer = QtCore.QTimer(self)
+        self._refresh_timer.setInterval(2000)
+        self._refresh_timer.timeout.connect(self.refresh)
+
+    def set_span(self, span_sec):
+        self._span = float(span_sec)
+        self.refresh()
+
+    def showEvent(self, event):
+        self._refresh_timer.start()
+        self.refresh()
+        super().showEvent(event)
+
+    def hideEvent(self, event):
+        self._refresh_timer.stop()  # 窗口隐藏到托盘时不做任何查询与绘制
+        super().hideEvent(event)
+
+    @QtCore.Slot()
+    def refresh(self):
+        if not self.isVisible():
+            return
+        self._end = time.time()
+        plot_w = max(50, self.width() - self.MARGIN_LEFT - self.MARGIN_RIGHT)
+        self._resolution, self._points = self._history.query(self._end - self._span, self._end, max_points=plot_w * 2)
+        total = sum(p[1] for p in self._points)
+        okn = sum(p[2] for p in self._points)
+        rtt_sum = sum(p[3] * p[2] for p in self._points if p[2])
+        if total:
+            avg = f"，平均 {rtt_sum / okn:.0f} ms" if okn else ""
+            text = (f"{self.RESOLUTION_NAMES.get(self._resolution, '')} · {total} 次检测 · "
+                    f"可达 {okn * 100.0 / total:.2f}%{avg}")
+        else:
+            text = "暂无检测记录"
+        self.summaryChanged.emit(text)
+        self.update()
+
+    @staticmethod
+    def _nice_ceiling(value):
+        """纵轴上限取 10 / 20 / 50 / 100 / 200 / 500 …… 中不小于 value 的最小值"""
+        top = 10.0
+        while top < value:
+            top *= 2.5 if str(int(top))[0] == '2' else 2
+        return top
+
+    def paintEvent(self, event):
+        p = QtGui.QPainter(self)
+        p.setRenderHint(QtGui.QPainter.Antialiasing)
+        pal = self.palette()
+        p.fillRect(self.rect(), pal.base())
+        plot = self.rect().adjusted(self.MARGIN_LEFT, self.MARGIN_TOP, -self.MARGIN_RIGHT, -self.MARGIN_BOTTOM)
+        p.setPen(QtGui.QPen(pal.mid().color()))
+        p.drawRect(plot)
+        if not self._points or plot.width() <= 0:
+            return
+
+        t0 = self._end - self._span
+        sx = plot.width() / self._span
+        rtts = [pt[5] for pt in self._points if pt[5] == pt[5]]
+        ymax = self._nice_ceiling(max(rtts) if rtts else 0.0)
+        sy = plot.height() / ymax
+
+        def x_of(ts):
+            return plot.left() + (ts - t0) * sx
+
+        p.save()
+        p.setClipRect(plot)
+
+        # 不可达：按失败比例画红色底纹
+        bucket_w = max(1.0, self._widths.get(self._resolution, 0) * sx)
+        for ts, count, okn, _, _, _ in self._points:
+            if okn < count:
+                alpha = int(60 + 160 * (count - okn) / count)
+                p.fillRect(QtCore.QRectF(x_of(ts), plot.top(), bucket_w, plot.height()),
+                           QtGui.QColor(220, 50, 50, alpha))
+
+        # 平均 RTT 折线；桶内最小 / 最大值画成浅色范围
+        band = QtGui.QColor(pal.highlight().color())
+        band.setAlpha(50)
+        line = QtGui.QPainterPath()
+        pen_down = False
+        for ts, count, okn, avg, lo, hi in self._points:
+            if okn == 0 or avg != avg:
+                pen_down = False
+                continue
+            x = x_of(ts) + (bucket_w / 2 if self._resolution != 'raw' else 0)
+            y = plot.bottom() - avg * sy
+            if self._resolution != 'raw' and hi > lo:
+                p.fillRect(QtCore.QRectF(x_of(ts), plot.bottom() - hi * sy, bucket_w, (hi - lo) * sy), band)
+            if pen_down:
+                line.lineTo(x, y)
+            else:
+                line.moveTo(x, y)
+                pen_down = True
+        p.setPen(QtGui.QPen(pal.highlight().color(), 1.5))
+        p.drawPath(line)
+        p.restore()
+
+        # 坐标标注
+        p.setPen(pal.text().color())
+        fm = p.fontMetrics()
+        p.drawText(QtCore.QRectF(0, plot.top() - 2, self.MARGIN_LEFT - 4, fm.height()),
+                   QtCore.Qt.AlignRight, f"{ymax:g} ms")
+        p.drawText(QtCore.QRectF(0, plot.bottom() - fm.height() + 2, self.MARGIN_LEFT - 4, fm.height()),
+                   QtCore.Qt.AlignRight, "0")
+        fmt = "%H:%M" if self._span <= 6 * 3600 else "%m-%d %H:%M"
+        p.drawText(QtCore.QRectF(plot.left(), plot.bottom() + 2, plot.width(), fm.height()),
+                   QtCore.Qt.AlignLeft, datetime.fromtimestamp(t0).strftime(fmt))
+        p.drawText(QtCore.QRectF(plot.left(), plot.bottom() + 2, plot.width(), fm.height()),
+                   QtCore.Qt.AlignRight, datetime.fromtimestamp(self._end).strftime(fmt))
+
 # -----------------------------
 # 主窗口（含日志裁剪）
 # -----------------------------
 class MainWindow(QtWidgets.QMainWindow):
-    def __init__(self):
+    configReloaded = QtCore.Signal(dict)  # 修改前的配置；跨线程排队交给 worker.reload
+
+    # 启动分三步：托盘 → 配置 / 界面 / 监控线程（随即开始第一次检测）→ 注册表同步、配置文件监视。
+    # 开机自启时系统最忙，托盘先出现，与第一次检测无关的工作往后放
+    DEFERRED_INIT_MS = 2000
+
+    def __init__(self, profile=None, exit_after_profile=False):
         super().__init__()
+        self.profile = profile or StartupProfile()
+        self._exit_after_profile = exit_after_profile
+        self._startup_reported = False
+        self.cfg = None
+        self.worker = None
+        self.config_watcher = None
+        self.control_server = None
         self.setWindowFlag(QtCore.Qt.Tool)  # 不在任务栏显示
         self.setWindowTitle(APP_NAME)
-        self.setWindowIcon(QtGui.QIcon(ICON_PATH))
+        self.setWindowIcon(app_icon())
         self.resize(780, 460)
 
-        self.log_view = QtWidgets.QTextEdit()
-        self.log_view.setReadOnly(True)
-        self.setCentralWidget(self.log_view)
-
-        tb = QtWidgets.QToolBar()
-        self.addToolBar(QtCore.Qt.TopToolBarArea, tb)
-        self.btn_start = QtGui.QAction("开始", self)
-        self.btn_stop = QtGui.QAction("停止", self)
-        self.btn_settings = QtGui.QAction("设置", self)
-        tb.addAction(self.btn_start)
-        tb.addAction(self.btn_stop)
-        tb.addSeparator()
-        tb.addAction(self.btn_settings)
-
-        self.tray = QtWidgets.QSystemTrayIcon(QtGui.QIcon(ICON_PATH), self)
+        self.tray = QtWidgets.QSystemTrayIcon(app_icon(), self)
         self.tray.setToolTip(APP_NAME)
         self.tray.activated.connect(self.on_tray_activated)
 
@@ -581,64 +619,208 @@ class MainWindow(QtWidgets.QMainWindow):
         menu.addSeparator()
         self.act_settings = menu.addAction("设置")
         self.act_exit = menu.addAction("退出程序")
+        for act in (self.act_start, self.act_stop, self.act_settings):
+            act.setEnabled(False)  # 监控线程建好后再启用
         self.tray.setContextMenu(menu)
         self.tray.show()
-
-        self.btn_start.triggered.connect(self.start_monitor)
-        self.btn_stop.triggered.connect(self.stop_monitor)
-        self.btn_settings.triggered.connect(self.open_settings)
-        self.act_start.triggered.connect(self.start_monitor)
-        self.act_stop.triggered.connect(self.stop_monitor)
-        self.act_settings.triggered.connect(self.open_settings)
         self.act_exit.triggered.connect(self.exit_app)
+        self.hide()  # 初始隐藏，只在托盘
+        QtCore.QTimer.singleShot(0, self._init_core)
 
+    def _init_core(self):
+        """第二步（托盘已显示）：读取配置，建界面与监控线程，并立即开始第一次检测"""
+        self.profile.mark('tray')
         self.cfg = load_config()
+        self._build_window()
+        self._apply_log_limit()
 
         self.worker = MonitorWorker(self.get_config)
+        self.setCentralWidget(self._build_central(self.worker.history))
         self.worker_thread = QtCore.QThread(self)
         self.worker.moveToThread(self.worker_thread)
-        self.worker.log.connect(self.append_log)
+        self.worker.logBatch.connect(self.append_logs)
         self.worker.runningChanged.connect(self.on_running_changed)
+        self.worker.scheduleChanged.connect(self.on_schedule_changed)
+        self.worker.phaseChanged.connect(self.on_phase_changed)
+        self.configReloaded.connect(self.worker.reload)
         self.worker_thread.start()
+        self.profile.mark('core')
 
-        if self.cfg.get("auto_start_monitor", True):
-            QtCore.QTimer.singleShot(500, self.start_monitor)
+        self.act_start.triggered.connect(self.start_monitor)
+        self.act_stop.triggered.connect(self.stop_monitor)
+        self.act_settings.triggered.connect(self.open_settings)
+        self.act_settings.setEnabled(True)
+        self.on_running_changed(False)
 
+        if self.cfg.get("auto_start_monitor", True):
+            self.start_monitor()
+        else:
+            self._report_startup()
+        QtCore.QTimer.singleShot(self.DEFERRED_INIT_MS, self._init_deferred)
+
+    def _init_deferred(self):
+        """第三步：与第一次检测无关的工作"""
+        # 配置文件被外部修改（或另一处保存）时自动热加载
+        if self.cfg.get("config_watch", True):
+            self.config_watcher = ConfigWatcher(config_path(), QtLoop(self), self.on_config_file_changed)
+            self.config_watcher.start()
         self.apply_autostart(self.cfg.get("auto_start_with_windows", False))
-        self.hide()  # 初始隐藏，只在托盘
+        if self.cfg.get("control_api", True):
+            self._start_control_server()
+
+    def _start_control_server(self):
+        """本机控制 / 状态接口：命令排队交给监控线程，状态由 worker 直接推送（publish 线程安全）"""
+        def command(slot):
+            def invoke(account):
+                if slot in ("probe_now", "reauth_now") and not self.worker.running:
+                    return "监控未运行"
+                QtCore.QMetaObject.invokeMethod(self.worker, slot, QtCore.Qt.QueuedConnection)
+            return invoke
+        slots = {'probe': "probe_now", 'reauth': "reauth_now", 'start': "start", 'stop': "stop"}
+        server = ControlServer(control_address(self.cfg), {cmd: command(slot) for cmd, slot in slots.items()})
+        try:
+            server.start()
+        except OSError as e:
+            self.append_log(f"本机控制接口未启动：{e}", 'WARN')
+            return
+        self.worker.statusChanged.connect(lambda snap: server.publish(None, snap), QtCore.Qt.DirectConnection)
+        # 初始状态也走信号：排队让 worker 自己发一次，不在界面线程读监控状态
+        QtCore.QMetaObject.invokeMethod(self.worker, "publish_status", QtCore.Qt.QueuedConnection)
+        self.control_server = server
+
+    def _report_startup(self):
+        if self._startup_reported:
+            return
+        self._startup_reported = True
+        text = self.profile.report()
+        self.append_log(text)
+        if self._exit_after_profile:
+            print(text, flush=True)
+            self.exit_app()
+
+    def _build_window(self):
+        self.log_model = LogRingModel(1000, self)
+        self.log_view = QtWidgets.QListView()
+        self.log_view.setModel(self.log_model)
+        self.log_view.setUniformItemSizes(True)  # 行高一致，滚动与布局不遍历全部行
+        self.log_view.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.log_view.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.log_view.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAsNeeded)
+        act_copy = QtGui.QAction("复制", self.log_view)
+        act_copy.setShortcut(QtGui.QKeySequence.Copy)
+        act_copy.setShortcutContext(QtCore.Qt.WidgetShortcut)
+        act_copy.triggered.connect(self.copy_selected_logs)
+        self.log_view.addAction(act_copy)
+        self.log_view.setContextMenuPolicy(QtCore.Qt.ActionsContextMenu)
+
+        self.lbl_phase = QtWidgets.QLabel("")
+        self.lbl_schedule = QtWidgets.QLabel("未启动")
+        self.statusBar().addPermanentWidget(self.lbl_phase)
+        self.statusBar().addPermanentWidget(self.lbl_schedule)
+
+        tb = QtWidgets.QToolBar()
+        self.addToolBar(QtCore.Qt.TopToolBarArea, tb)
+        self.btn_start = QtGui.QAction("开始", self)
+        self.btn_stop = QtGui.QAction("停止", self)
+        self.btn_settings = QtGui.QAction("设置", self)
+        tb.addAction(self.btn_start)
+        tb.addAction(self.btn_stop)
+        tb.addSeparator()
+        tb.addAction(self.btn_settings)
+        self.btn_start.triggered.connect(self.start_monitor)
+        self.btn_stop.triggered.connect(self.stop_monitor)
+        self.btn_settings.triggered.connect(self.open_settings)
 
     def get_config(self):
         return self.cfg
 
+    def _build_central(self, history):
+        """上方日志，下方探测历史曲线（可拖动分隔条调整高度）"""
+        self.chart = HistoryChart(history)
+        self.cmb_range = QtWidgets.QComboBox()
+        for text, span in HistoryChart.RANGES:
+            self.cmb_range.addItem(text, span)
+        self.cmb_range.setCurrentIndex(1)
+        self.cmb_range.currentIndexChanged.connect(
+            lambda i: self.chart.set_span(self.cmb_range.itemData(i)))
+        lbl_summary = QtWidgets.QLabel("")
+        self.chart.summaryChanged.connect(lbl_summary.setText)
+
+        bar = QtWidgets.QHBoxLayout()
+        bar.setContentsMargins(4, 2, 4, 0)
+        bar.addWidget(QtWidgets.QLabel("延迟 / 可达性："))
+        bar.addWidget(self.cmb_range)
+        bar.addStretch(1)
+        bar.addWidget(lbl_summary)
+        panel = QtWidgets.QWidget()
+        v = QtWidgets.QVBoxLayout(panel)
+        v.setContentsMargins(0, 0, 0, 0)
+        v.setSpacing(2)
+        v.addLayout(bar)
+        v.addWidget(self.chart)
+
+        splitter = QtWidgets.QSplitter(QtCore.Qt.Vertical)
+        splitter.addWidget(self.log_view)
+        splitter.addWidget(panel)
+        splitter.setStretchFactor(0, 3)
+        splitter.setStretchFactor(1, 1)
+        return splitter
+
     @QtCore.Slot(bool)
     def on_running_changed(self, running: bool):
+        if not running:
+            self.lbl_schedule.setText("未启动")
         self.btn_start.setEnabled(not running)
         self.act_start.setEnabled(not running)
         self.btn_stop.setEnabled(running)
         self.act_stop.setEnabled(running)
 
-    def _trim_logs(self):
-        """裁剪 QTextEdit 仅保留配置中的最多行数，避免越用越卡。"""
-        max_lines = int(self.cfg.get("max_log_lines", 1000))
-        doc = self.log_view.document()
-        block_count = doc.blockCount()
-        if block_count <= max_lines:
-            return
-        # 删除最早的多余行
-        extra = block_count - max_lines
-        cursor = QtGui.QTextCursor(doc)
-        cursor.beginEditBlock()
-        cursor.movePosition(QtGui.QTextCursor.Start)
-        for _ in range(extra):
-            cursor.select(QtGui.QTextCursor.BlockUnderCursor)
-            cursor.removeSelectedText()
-            cursor.deleteChar()  # 删除换行
-        cursor.endEditBlock()
-
-    @QtCore.Slot(str)
-    def append_log(self, s: str):
-        self.log_view.append(s)
-        self._trim_logs()
+    @QtCore.Slot(dict)
+    def on_schedule_changed(self, snap: dict):
+        """状态栏显示调度状态与下次检测时间"""
+        if 'first_result' not in self.profile.marks:
+            self.profile.mark('first_result')  # 每轮结束时排期，第一次排期即首次检测完成
+            self._report_startup()
+        text = f"调度：{snap.get('state_name', '')}"
+        if snap.get('next_fire_at'):
+            nxt = datetime.fromtimestamp(snap['next_fire_at']).strftime("%H:%M:%S")
+            text += f" | 下次检测 {nxt}（{snap.get('next_delay_sec', 0):.1f} 秒后）"
+        if snap.get('state') in ('backoff', 'retry', 'rejected'):
+            text += f" | 退避第 {snap.get('backoff_level')} 次"
+        self.lbl_schedule.setText(text)
+
+    @QtCore.Slot(dict)
+    def on_phase_changed(self, snap: dict):
+        phase = snap.get('phase')
+        if phase == 'probe':
+            self.profile.mark('first_probe')
+        self.lbl_phase.setText("" if phase in ('idle', 'stopped') else f"阶段：{snap.get('phase_name', '')}")
+
+    def _apply_log_limit(self):
+        """按配置调整日志环形缓冲的上限"""
+        try:
+            max_lines = int(self.cfg.get("max_log_lines", 1000))
+        except Exception:
+            max_lines = 1000
+        self.log_model.set_capacity(max_lines)
+
+    @QtCore.Slot(list)
+    def append_logs(self, records: list):
+        """一批记录只触发一次插入与一次重绘"""
+        bar = self.log_view.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum()
+        self.log_model.extend(records)
+        if at_bottom:
+            self.log_view.scrollToBottom()
+
+    def append_log(self, message: str, level='INFO'):
+        self.append_logs([LogRecord(time.time(), level, '', message)])
+
+    def copy_selected_logs(self):
+        rows = sorted(i.row() for i in self.log_view.selectionModel().selectedIndexes())
+        if rows:
+            text = "\n".join(self.log_model.line(r) for r in rows)
+            QtWidgets.QApplication.clipboard().setText(text)
 
     def on_tray_activated(self, reason):
         if reason == QtWidgets.QSystemTrayIcon.Trigger:  # 单击托盘图标
@@ -664,43 +846,53 @@ class MainWindow(QtWidgets.QMainWindow):
         dlg = SettingsDialog(self.cfg, self)
         if dlg.exec() == QtWidgets.QDialog.Accepted:
             new_cfg = dlg.get_config()
-            was_running = self.act_stop.isEnabled()
+            old_cfg = self.cfg
 
             self.apply_autostart(new_cfg.get("auto_start_with_windows", False))
 
             self.cfg = new_cfg
             save_config(self.cfg)
+            self._apply_log_limit()
 
-            self.append_log(self.ts() + "已保存设置")
+            self.append_log("已保存设置")
             self.show_message("设置已保存")
-
-            if was_running:
-                self.stop_monitor()
-                QtCore.QTimer.singleShot(150, self.start_monitor)
+            self.configReloaded.emit(old_cfg)
+
+    def on_config_file_changed(self, new_cfg):
+        if new_cfg == self.cfg:
+            return  # 本程序自己保存触发的变化
+        old_cfg = self.cfg
+        self.cfg = new_cfg
+        if new_cfg.get("auto_start_with_windows") != old_cfg.get("auto_start_with_windows"):
+            self.apply_autostart(new_cfg.get("auto_start_with_windows", False))
+        self._apply_log_limit()
+        self.append_log("检测到配置文件变化，已重新读取")
+        self.configReloaded.emit(old_cfg)
 
     def apply_autostart(self, enabled: bool):
+        """同步注册表中的开机自启项；已与设置一致时只读不写"""
         if platform.system().lower().startswith("win"):
             try:
                 import winreg
                 run_key = r"Software\Microsoft\Windows\CurrentVersion\Run"
-                with winreg.OpenKey(winreg.HKEY_CURRENT_USER, run_key, 0, winreg.KEY_ALL_ACCESS) as key:
+                with winreg.OpenKey(winreg.HKEY_CURRENT_USER, run_key, 0,
+                                    winreg.KEY_QUERY_VALUE | winreg.KEY_SET_VALUE) as key:
                     app_key = APP_NAME
+                    try:
+                        current = winreg.QueryValueEx(key, app_key)[0]
+                    except FileNotFoundError:
+                        current = None
                     if enabled:
                         exe_path = sys.executable if getattr(sys, 'frozen', False) else os.path.abspath(sys.argv[0])
-                        winreg.SetValueEx(key, app_key, 0, winreg.REG_SZ, f'"{exe_path}"')
-                    else:
-                        try:
-                            winreg.DeleteValue(key, app_key)
-                        except FileNotFoundError:
-                            pass
+                        if current != f'"{exe_path}"':
+                            winreg.SetValueEx(key, app_key, 0, winreg.REG_SZ, f'"{exe_path}"')
+                    elif current is not None:
+                        winreg.DeleteValue(key, app_key)
             except Exception as e:
-                self.append_log(self.ts() + f"设置开机自启失败：{e}")
+                self.append_log(f"设置开机自启失败：{e}", 'ERROR')
 
     def show_message(self, text: str):
-        self.tray.showMessage(APP_NAME, text, QtGui.QIcon(ICON_PATH), 2000)
-
-    def ts(self):
-        return datetime.now().strftime("[%Y-%m-%d %H:%M:%S] ")
+        self.tray.showMessage(APP_NAME, text, app_icon(), 2000)
 
     def closeEvent(self, event: QtGui.QCloseEvent):
         # 点击关闭仅最小化到托盘
@@ -710,10 +902,14 @@ class MainWindow(QtWidgets.QMainWindow):
 
     def exit_app(self):
         # 优雅退出
-        QtCore.QMetaObject.invokeMethod(self.worker, "stop", QtCore.Qt.QueuedConnection)
+        if self.worker is not None:
+            QtCore.QMetaObject.invokeMethod(self.worker, "stop", QtCore.Qt.QueuedConnection)
         QtCore.QTimer.singleShot(100, self._final_quit)
 
     def _final_quit(self):
+        if self.control_server is not None:
+            self.control_server.stop()
+            self.control_server = None
         if hasattr(self, "worker_thread"):
             self.worker_thread.quit()
             self.worker_thread.wait(2000)
@@ -723,11 +919,21 @@ class MainWindow(QtWidgets.QMainWindow):
 # 入口
 # -----------------------------
 def main():
+    if sys.argv[1:2] == ["journal"]:
+        dump_journal(sys.argv[2:])
+        return
+    if sys.argv[1:2] == ["ctl"]:
+        control_client(sys.argv[2:])
+        return
+    # --startup-profile：首次检测完成后把启动耗时打印到标准输出并退出（测量开机启动用）
+    profile_only = "--startup-profile" in sys.argv[1:]
+    profile = StartupProfile()
+    profile.mark('imports')
     app = QtWidgets.QApplication(sys.argv)
     app.setQuitOnLastWindowClosed(False)
-    app.setWindowIcon(QtGui.QIcon(ICON_PATH))
+    app.setWindowIcon(app_icon())
 
-    w = MainWindow()
+    w = MainWindow(profile, exit_after_profile=profile_only)
     sys.exit(app.exec())
 
 if __name__ == "__main__":
@@ -0,0 +1,261 @@
+# fake_eportal.py
+# -*- coding: utf-8 -*-
+"""
+本地模拟认证门户：模拟 10.11.0.1 与 eportal/InterFace.do 的行为，用于在校外测量认证流程性能。
+
+  GET  /                                   未认证：返回带 queryString 链接的页面；已认证：302 到 success.jsp
+  GET  /eportal/success.jsp                认证成功页
+  POST /eportal/InterFace.do?method=login  校验账号、密码与 queryString
+  POST /eportal/InterFace.do?method=logout 按 userIndex 下线
+  GET  /eportal/InterFace.do?method=getOnlineUserInfo
+  GET  /generate_204                       已认证返回 204，未认证 302 到门户（充当“外网”探测目标）
+
+可配置：响应延迟、失败率（返回 500）、会话有效期、JSON 压缩方式。
+
+单独运行：python bench/fake_eportal.py --port 8080 --latency-ms 30
+"""
+
+import argparse
+import gzip
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeEportal():
+    def __init__(self, host='127.0.0.1', port=0, user='test', pwd='test',
+                 latency_ms=0, fail_rate=0.0, session_ttl_sec=0, gzip_mode='none'):
+        """
+        gzip_mode：none = 不压缩；header = 带 Content-Encoding: gzip；
+                   raw = 压缩但不声明编码（模拟门户返回裸 gzip，走 _json_from_response 的回退分支）
+        session_ttl_sec：>0 时会话到期后自动掉线
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.pwd = pwd
+        self.latency_ms = latency_ms
+        self.fail_rate = fail_rate
+        self.session_ttl_sec = session_ttl_sec
+        self.gzip_mode = gzip_mode
+        self.query_string = ('wlanuserip=10.0.0.2&wlanacname=YSU-NAS&ssid=&nasip=10.11.0.1'
+                             '&mac=02fc00000001&t=wireless-v2&url=http%3A%2F%2Fwww.msftconnecttest.com')
+        self._lock = threading.Lock()
+        self._online_since = None
+        self.user_index = None
+        self.counts = {}
+        self._httpd = None
+
+    # —— 状态 —— #
+    @property
+    def base_url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def is_online(self):
+        with self._lock:
+            return self._online_locked()
+
+    def _online_locked(self):
+        if self._online_since is None:
+            return False
+        if self.session_ttl_sec > 0 and time.monotonic() - self._online_since > self.session_ttl_sec:
+            self._online_since = None
+            self.user_index = None
+            return False
+        return True
+
+    def set_online(self, online=True):
+        with self._lock:
+            if online:
+                self._online_since = time.monotonic()
+                self.user_index = self.user_index or os.urandom(8).hex()
+            else:
+                self._online_since = None
+                self.user_index = None
+
+    def expire(self):
+        """模拟门户侧会话被踢下线"""
+        self.set_online(False)
+
+    def reset_counts(self):
+        with self._lock:
+            self.counts = {}
+
+    def total_requests(self):
+        with self._lock:
+            return sum(self.counts.values())
+
+    def _count(self, key):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    # —— 启停 —— #
+    def start(self):
+        portal = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # 支持 keep-alive
+            disable_nagle_algorithm = True  # 头与正文分两次写，避免与延迟 ACK 叠加出 40ms 停顿
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                portal._handle(self)
+
+            def do_POST(self):
+                portal._handle(self)
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name='fake-eportal', daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+    # —— 请求处理 —— #
+    def _handle(self, req):
+        parts = urlsplit(req.path)
+        query = parse_qs(parts.query)
+        body = b''
+        length = int(req.headers.get('Content-Length') or 0)
+        if length:
+            body = req.rfile.read(length)
+        form = {k: v[0] for k, v in parse_qs(body.decode('utf-8', 'replace')).items()}
+
+        key = parts.path
+        if parts.path.endswith('InterFace.do'):
+            key = 'method=' + (query.get('method') or [''])[0]
+        self._count(key)
+
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000.0)
+        if self.fail_rate and random.random() < self.fail_rate:
+            self._send(req, 500, b'Internal Server Error', 'text/plain')
+            return
+
+        if parts.path == '/generate_204':
+            if self.is_online():
+                self._send(req, 204, b'')
+            else:
+                self._redirect(req, self.base_url + '/')
+            return
+        if parts.path == '/':
+            if self.is_online():
+                self._redirect(req, f'{self.base_url}/eportal/success.jsp?userIndex={self.user_index}')
+            else:
+                html = (f"<script>top.self.location.href='{self.base_url}/eportal/index.jsp?"
+                        f"{self.query_string}'</script>")
+                self._send(req, 200, html.encode('utf-8'), 'text/html; charset=utf-8')
+            return
+        if parts.path == '/eportal/success.jsp':
+            self._send(req, 200, '<html>认证成功</html>'.encode('utf-8'), 'text/html; charset=utf-8')
+            return
+        if parts.path == '/eportal/InterFace.do':
+            method = key[len('method='):]
+            if method == 'login' and req.command == 'POST':
+                self._json(req, self._login(form))
+                return
+            if method == 'logout' and req.command == 'POST':
+                self._json(req, self._logout(form))
+                return
+            if method == 'getOnlineUserInfo':
+                self._json(req, self._online_info())
+                return
+        self._send(req, 404, b'Not Found', 'text/plain')
+
+    def _login(self, form):
+        if form.get('userId') != self.user or form.get('password') != self.pwd:
+            return {'result': 'fail', 'message': '用户名或密码错误', 'userIndex': None}
+        if form.get('queryString') != self.query_string:
+            return {'result': 'fail', 'message': '认证参数无效，请重新打开认证页面', 'userIndex': None}
+        with self._lock:
+            if self._online_locked():
+                return {'result': 'fail', 'message': '用户已在线', 'userIndex': self.user_index}
+            self._online_since = time.monotonic()
+            self.user_index = os.urandom(8).hex()
+            return {'result': 'success', 'message': '', 'userIndex': self.user_index}
+
+    def _logout(self, form):
+        with self._lock:
+            if not self._online_locked() or form.get('userIndex') != self.user_index:
+                return {'result': 'fail', 'message': '用户不在线或 userIndex 无效'}
+            self._online_since = None
+            self.user_index = None
+        return {'result': 'success', 'message': '下线成功'}
+
+    def _online_info(self):
+        with self._lock:
+            if not self._online_locked():
+                return {'result': 'fail', 'message': '用户不在线', 'userIndex': None}
+            left = None
+            if self.session_ttl_sec > 0:
+                left = int(self.session_ttl_sec - (time.monotonic() - self._online_since))
+            return {
+                'result': 'success',
+                'userIndex': self.user_index,
+                'userName': self.user,
+                'userId': self.user,
+                'service': '校园网',
+                'onlineTime': int(time.monotonic() - self._online_since),
+                'maxLeftTime': left,
+            }
+
+    # —— 响应工具 —— #
+    def _json(self, req, obj):
+        data = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+        headers = {}
+        if self.gzip_mode in ('header', 'raw'):
+            data = gzip.compress(data)
+            if self.gzip_mode == 'header':
+                headers['Content-Encoding'] = 'gzip'
+        self._send(req, 200, data, 'application/json; charset=utf-8', headers)
+
+    def _redirect(self, req, location):
+        self._send(req, 302, b'', None, {'Location': location})
+
+    def _send(self, req, code, body, ctype=None, headers=None):
+        req.send_response(code)
+        if ctype:
+            req.send_header('Content-Type', ctype)
+        for k, v in (headers or {}).items():
+            req.send_header(k, v)
+        req.send_header('Content-Length', str(len(body)))
+        req.end_headers()
+        if body:
+            req.wfile.write(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟认证门户')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--user', default='test')
+    parser.add_argument('--pwd', default='test')
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    parser.add_argument('--session-ttl-sec', type=float, default=0)
+    parser.add_argument('--gzip', choices=['none', 'header', 'raw'], default='none')
+    args = parser.parse_args()
+    portal = FakeEportal(args.host, args.port, args.user, args.pwd, args.latency_ms,
+                         args.fail_rate, args.session_ttl_sec, args.gzip).start()
+    print(f'模拟门户已启动：{portal.base_url}（账号 {args.user} / 密码 {args.pwd}）')
+    print(f'配置 portal_url / auth_url 为 {portal.base_url}，检测目标为 {portal.base_url}/generate_204')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        portal.stop()
+
+
+if __name__ == '__main__':
+    main()
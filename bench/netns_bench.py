@@ -0,0 +1,513 @@
+# netns_bench.py
+# -*- coding: utf-8 -*-
+"""
+端到端掉线恢复计时：在 Linux 网络命名空间里搭一套“校园网”，让 MonitorWorker 跑在其中，
+注入故障后测量检测与恢复耗时，超过目标值即判定失败（退出码 1），用于发现监控反应速度的退化。
+需要 root（或 CAP_NET_ADMIN / CAP_SYS_ADMIN）与 iproute2；netem 场景另需内核 sch_netem 模块，缺失时跳过。
+
+  sudo python bench/netns_bench.py                       # 全部场景，各 3 轮
+  sudo python bench/netns_bench.py --only expire link-down --rounds 10 --json netns.json
+  sudo python bench/netns_bench.py --target-scale 2      # 较慢的机器上放宽目标
+
+拓扑（三个命名空间，用完即删，不改动本机网络）：
+  <prefix>-client  eth0 10.11.0.2/24，默认路由经 10.11.0.1；运行 MonitorWorker（子进程）
+  <prefix>-net     cl0 10.11.0.1/24：模拟门户（fake_eportal.py，80 端口）兼网关，开启转发；up0 172.31.0.1/30
+  <prefix>-inet    eth0 172.31.0.2/30 + 198.18.0.1~3：“外网”检测目标，/generate_204 已认证返回 204，未认证 302 到门户
+
+检测耗时（detect）从注入故障起算，恢复耗时（recover）从下列计时起点起算。
+场景：
+  expire       门户踢下线；从踢下线起计时
+  link-down    踢下线并断开客户端网卡，2 秒后恢复网卡与默认路由；从网卡恢复起计时（应由网络事件立即触发检测）
+  blackhole    上游路由黑洞 4 秒（门户仍显示已认证）；从解除起计时，期间不应认证
+  portal-5xx   踢下线且门户全部返回 500 持续 4 秒；从门户恢复起计时
+  netem-delay  客户端链路双向加 100±20ms 延迟后踢下线
+  netem-loss   客户端链路双向 10% 丢包后踢下线
+"""
+
+import argparse
+import ctypes
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from fake_eportal import FakeEportal  # noqa: E402
+from recovery_bench import summarize  # noqa: E402
+
+CLONE_NEWNET = 0x40000000
+PORTAL_IP = '10.11.0.1'
+CLIENT_IP = '10.11.0.2'
+TARGET_IPS = ('198.18.0.1', '198.18.0.2', '198.18.0.3')
+
+# 客户端监控配置：间隔取小，让每轮测量在几秒内结束
+CLIENT_CFG = {
+    'user': 'test',
+    'pwd': 'test',
+    'portal_url': f'http://{PORTAL_IP}',
+    'auth_url': f'http://{PORTAL_IP}',
+    'check_host': f'http://{TARGET_IPS[0]}/generate_204',
+    'fallback_check_host': f'http://{TARGET_IPS[1]}/generate_204',
+    'tertiary_check_host': f'http://{TARGET_IPS[2]}/generate_204',
+    'probe_engine': 'socket',
+    'ping_timeout_ms': 1000,
+    'check_interval_sec': 2.0,
+    'steady_interval_sec': 2.0,
+    'fast_recheck_sec': 0.5,
+    'portal_backoff_max_sec': 4.0,
+    'post_login_check_delay_sec': 0.2,
+    'reconnect_wait_sec': 1.0,
+    'http_connect_timeout_sec': 1.0,
+    'http_read_timeout_sec': 2.0,
+    'http_post_timeout_sec': 2.0,
+    'portal_deadline_sec': 6.0,
+    'portal_breaker_failures': 0,  # 5xx 场景测的是退避后的恢复，不让熔断冷却时间掺进来
+    'event_driven_check': True,
+    'journal_enabled': False,
+    'metrics_port': 0,
+    'dns_cache': False,
+    'session_refresh': False,
+}
+
+
+# -----------------------------
+# 命名空间与链路
+# -----------------------------
+def sh(*args, check=True):
+    res = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if check and res.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} 失败：{res.stderr.strip()}")
+    return res
+
+
+def in_netns(name, fn):
+    """在命名空间 name 中调用 fn（只切换一个临时线程），其中创建的 socket 留在该命名空间"""
+    out = {}
+
+    def run():
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            with open(f'/run/netns/{name}') as f:
+                if libc.setns(f.fileno(), CLONE_NEWNET) != 0:
+                    raise OSError(ctypes.get_errno(), f'setns {name}')
+            out['value'] = fn()
+        except BaseException as e:
+            out['error'] = e
+
+    t = threading.Thread(target=run)
+    t.start()
+    t.join()
+    if 'error' in out:
+        raise out['error']
+    return out['value']
+
+
+class Topology():
+    def __init__(self, prefix):
+        self.client = f'{prefix}-client'
+        self.net = f'{prefix}-net'
+        self.inet = f'{prefix}-inet'
+        self.netem_ok = None
+
+    def names(self):
+        return (self.client, self.net, self.inet)
+
+    def teardown(self):
+        for ns in self.names():
+            sh('ip', 'netns', 'del', ns, check=False)
+
+    def setup(self):
+        self.teardown()  # 清理上次异常退出的残留
+        for ns in self.names():
+            sh('ip', 'netns', 'add', ns)
+            sh('ip', '-n', ns, 'link', 'set', 'lo', 'up')
+        # client <-> net
+        sh('ip', '-n', self.client, 'link', 'add', 'eth0', 'type', 'veth', 'peer', 'name', 'cl0', 'netns', self.net)
+        sh('ip', '-n', self.client, 'addr', 'add', f'{CLIENT_IP}/24', 'dev', 'eth0')
+        sh('ip', '-n', self.net, 'addr', 'add', f'{PORTAL_IP}/24', 'dev', 'cl0')
+        # net <-> inet
+        sh('ip', '-n', self.net, 'link', 'add', 'up0', 'type', 'veth', 'peer', 'name', 'eth0', 'netns', self.inet)
+        sh('ip', '-n', self.net, 'addr', 'add', '172.31.0.1/30', 'dev', 'up0')
+        sh('ip', '-n', self.inet, 'addr', 'add', '172.31.0.2/30', 'dev', 'eth0')
+        for ip in TARGET_IPS:
+            sh('ip', '-n', self.inet, 'addr', 'add', f'{ip}/24', 'dev', 'eth0')
+        for ns, dev in ((self.client, 'eth0'), (self.net, 'cl0'), (self.net, 'up0'), (self.inet, 'eth0')):
+            sh('ip', '-n', ns, 'link', 'set', dev, 'up')
+        sh('ip', 'netns', 'exec', self.net, 'sysctl', '-qw', 'net.ipv4.ip_forward=1')
+        self.client_default_route()
+        self.upstream(True)
+        sh('ip', '-n', self.inet, 'route', 'add', '10.11.0.0/24', 'via', '172.31.0.1')
+        self.netem_ok = self._probe_netem()
+
+    def _probe_netem(self):
+        ok = sh('tc', '-n', self.client, 'qdisc', 'add', 'dev', 'eth0', 'root', 'netem', 'delay', '1ms',
+                check=False).returncode == 0
+        if ok:
+            sh('tc', '-n', self.client, 'qdisc', 'del', 'dev', 'eth0', 'root', check=False)
+        return ok
+
+    def client_default_route(self):
+        sh('ip', '-n', self.client, 'route', 'replace', 'default', 'via', PORTAL_IP)
+
+    def client_link(self, up):
+        sh('ip', '-n', self.client, 'link', 'set', 'eth0', 'up' if up else 'down')
+
+    def upstream(self, reachable):
+        via = ('via', '172.31.0.2') if reachable else ()
+        kind = () if reachable else ('blackhole',)
+        sh('ip', '-n', self.net, 'route', 'replace', *kind, '198.18.0.0/24', *via)
+
+    def netem(self, *params):
+        """客户端链路两端的出方向都加 netem；params 为空时移除"""
+        for ns, dev in ((self.client, 'eth0'), (self.net, 'cl0')):
+            if params:
+                sh('tc', '-n', ns, 'qdisc', 'replace', 'dev', dev, 'root', 'netem', *params)
+            else:
+                sh('tc', '-n', ns, 'qdisc', 'del', 'dev', dev, 'root', check=False)
+
+
+# -----------------------------
+# “外网”检测目标：按门户认证状态放行（模拟认证网关的拦截）
+# -----------------------------
+def start_internet(portal, ns):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if portal.is_online():
+                self.send_response(204)
+                self.send_header('Content-Length', '0')
+            else:
+                self.send_response(302)
+                self.send_header('Location', f'http://{PORTAL_IP}/')
+                self.send_header('Content-Length', '0')
+            self.end_headers()
+
+    httpd = in_netns(ns, lambda: ThreadingHTTPServer(('0.0.0.0', 80), Handler))
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name='fake-internet', daemon=True).start()
+    return httpd
+
+
+# -----------------------------
+# 客户端：在 client 命名空间里运行 MonitorWorker，把阶段与每轮结果按行输出为 JSON
+# -----------------------------
+def run_client(cfg_path):
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    from PySide6 import QtCore
+    import app
+
+    with open(cfg_path, encoding='utf-8') as f:
+        cfg = dict(app.DEFAULT_CONFIG)
+        cfg.update(json.load(f))
+    qapp = QtCore.QCoreApplication([])
+    worker = app.MonitorWorker(lambda: cfg)
+    thread = QtCore.QThread()
+    worker.moveToThread(thread)
+    lock = threading.Lock()
+
+    def emit(**rec):
+        rec['t'] = time.monotonic()  # CLOCK_MONOTONIC 不随网络命名空间变化，可与父进程直接比较
+        with lock:
+            sys.stdout.write(json.dumps(rec, ensure_ascii=False) + '\n')
+            sys.stdout.flush()
+
+    direct = QtCore.Qt.DirectConnection
+    worker.phaseChanged.connect(lambda snap: emit(kind='phase', phase=snap['phase']), direct)
+    worker.scheduleChanged.connect(lambda snap: emit(kind='round', online=snap.get('uptime_sec') is not None),
+                                   direct)
+    worker.logBatch.connect(lambda batch: [emit(kind='log', level=r.level, message=r.message) for r in batch],
+                            direct)
+    thread.start()
+    QtCore.QMetaObject.invokeMethod(worker, 'start', QtCore.Qt.QueuedConnection)
+
+    def wait_parent():
+        sys.stdin.read()  # 父进程关闭管道即退出
+        QtCore.QMetaObject.invokeMethod(worker, 'stop', QtCore.Qt.QueuedConnection)
+        time.sleep(0.5)
+        QtCore.QMetaObject.invokeMethod(qapp, 'quit', QtCore.Qt.QueuedConnection)
+
+    threading.Thread(target=wait_parent, daemon=True).start()
+    qapp.exec()
+    thread.quit()
+    thread.wait(3000)
+
+
+class ClientProcess():
+    def __init__(self, topo, cfg, verbose=False):
+        self._tmp = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False, encoding='utf-8')
+        json.dump(cfg, self._tmp)
+        self._tmp.close()
+        env = dict(os.environ, HOME=tempfile.mkdtemp(prefix='netns-bench-'))
+        self._home = env['HOME']
+        self._proc = subprocess.Popen(
+            ['ip', 'netns', 'exec', topo.client, sys.executable, os.path.abspath(__file__),
+             '--client', self._tmp.name],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True, encoding='utf-8', env=env)
+        self.verbose = verbose
+        self._lock = threading.Lock()
+        self.records = []
+        threading.Thread(target=self._read, daemon=True).start()
+
+    def _read(self):
+        for line in self._proc.stdout:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if self.verbose and rec['kind'] == 'log':
+                print(f"    [client] {rec['level']} {rec['message']}")
+            with self._lock:
+                self.records.append(rec)
+
+    def since(self, t):
+        with self._lock:
+            return [r for r in self.records if r['t'] >= t]
+
+    def last_round(self):
+        with self._lock:
+            for r in reversed(self.records):
+                if r['kind'] == 'round':
+                    return r
+        return None
+
+    def phase(self):
+        with self._lock:
+            for r in reversed(self.records):
+                if r['kind'] == 'phase':
+                    return r['phase']
+        return None
+
+    def stop(self):
+        try:
+            self._proc.stdin.close()
+            self._proc.wait(5)
+        except Exception:
+            self._proc.kill()
+        os.unlink(self._tmp.name)
+        shutil.rmtree(self._home, ignore_errors=True)
+
+
+# -----------------------------
+# 场景
+# -----------------------------
+class Scenario():
+    """
+    inject / heal：注入与解除故障（heal 为 None 表示无需解除，从注入起计时）；hold_sec：故障持续时间
+    target_sec：从计时起点到恢复（一轮从计时起点之后开始的检测判定外网可达）的上限
+    expect_login：False 表示整轮都不应认证（上游中断不该折腾会话）
+    """
+    def __init__(self, name, desc, inject, heal=None, hold_sec=0.0, target_sec=5.0,
+                 expect_login=True, setup=None, teardown=None, needs_netem=False):
+        self.name = name
+        self.desc = desc
+        self.inject = inject
+        self.heal = heal
+        self.hold_sec = hold_sec
+        self.target_sec = target_sec
+        self.expect_login = expect_login
+        self.setup = setup
+        self.teardown = teardown
+        self.needs_netem = needs_netem
+
+
+def build_scenarios(topo, portal):
+    interval = CLIENT_CFG['check_interval_sec']
+    probe = CLIENT_CFG['ping_timeout_ms'] / 1000.0
+
+    def link_down():
+        portal.expire()
+        topo.client_link(False)
+
+    def link_up():
+        topo.client_link(True)
+        topo.client_default_route()  # 网卡断开时默认路由随之删除，恢复时相当于 DHCP 重新下发
+
+    def portal_fail():
+        portal.expire()
+        portal.fail_rate = 1.0
+
+    def portal_heal():
+        portal.fail_rate = 0.0
+
+    return [
+        Scenario('expire', '门户踢下线', portal.expire, target_sec=interval + probe + 2.0),
+        Scenario('link-down', '断网卡 2 秒', link_down, link_up, hold_sec=2.0, target_sec=probe + 2.0),
+        Scenario('blackhole', '上游黑洞 4 秒', lambda: topo.upstream(False), lambda: topo.upstream(True),
+                 hold_sec=4.0, target_sec=interval + probe + 1.5, expect_login=False),
+        Scenario('portal-5xx', '门户 500 持续 4 秒', portal_fail, portal_heal, hold_sec=4.0,
+                 target_sec=CLIENT_CFG['portal_backoff_max_sec'] + probe + 2.0),
+        Scenario('netem-delay', '链路 100±20ms 延迟', portal.expire, target_sec=interval + probe + 3.0,
+                 setup=lambda: topo.netem('delay', '100ms', '20ms'), teardown=lambda: topo.netem(),
+                 needs_netem=True),
+        Scenario('netem-loss', '链路 10% 丢包', portal.expire, target_sec=interval + 2 * probe + 4.0,
+                 setup=lambda: topo.netem('loss', '10%'), teardown=lambda: topo.netem(), needs_netem=True),
+    ]
+
+
+def wait_for(pred, limit):
+    end = time.monotonic() + limit
+    while time.monotonic() < end:
+        if pred():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def measure(records, t_inject, t_ref):
+    """
+    从 records（注入故障之后的客户端输出）中找：
+      detect：注入后第一次进入判断原因 / 认证阶段；recover：第一轮从计时起点 t_ref 之后开始、判定外网可达的检测结束
+    """
+    detect = recover = None
+    cycle_start = None
+    for r in records:
+        if r['kind'] == 'phase':
+            if r['phase'] in ('probe', 'verify'):
+                cycle_start = r['t']
+            if detect is None and r['phase'] in ('classify', 'login'):
+                detect = r['t'] - t_inject
+        elif r['kind'] == 'round' and r['online'] and cycle_start is not None and cycle_start >= t_ref:
+            recover = r['t'] - t_ref
+            break
+    return detect, recover
+
+
+def run_scenario(sc, client, portal, rounds, scale, settle_sec):
+    interval = CLIENT_CFG['check_interval_sec']
+    detect, recover, logins = [], [], []
+    failures = []
+    if sc.setup is not None:
+        sc.setup()
+    try:
+        for i in range(rounds):
+            # 先等稳定在线
+            if not wait_for(lambda: portal.is_online() and client.phase() == 'idle'
+                            and (client.last_round() or {}).get('online'), settle_sec):
+                failures.append(f"第 {i + 1} 轮开始前未能恢复在线")
+                continue
+            time.sleep(random.uniform(0, interval))  # 故障落在检测间隔内的随机位置
+            portal.reset_counts()
+            t_inject = time.monotonic()
+            sc.inject()
+            t_ref = t_inject
+            if sc.heal is not None:
+                time.sleep(sc.hold_sec)
+                t_ref = time.monotonic()
+                sc.heal()
+            limit = sc.target_sec * scale
+            ok = wait_for(lambda: measure(client.since(t_inject), t_inject, t_ref)[1] is not None,
+                          limit + settle_sec)
+            d, r = measure(client.since(t_inject), t_inject, t_ref)
+            n_login = portal.counts.get('method=login', 0)
+            logins.append(n_login)
+            if d is not None:
+                detect.append(d * 1000.0)
+            if not ok or r is None:
+                failures.append(f"第 {i + 1} 轮未恢复")
+                continue
+            recover.append(r * 1000.0)
+            if r > limit:
+                failures.append(f"第 {i + 1} 轮恢复 {r:.2f}s 超过目标 {limit:.2f}s")
+            if not sc.expect_login and n_login:
+                failures.append(f"第 {i + 1} 轮不应认证，却认证了 {n_login} 次")
+    finally:
+        if sc.teardown is not None:
+            sc.teardown()
+    return {
+        'scenario': sc.name,
+        'desc': sc.desc,
+        'rounds': rounds,
+        'target_ms': sc.target_sec * scale * 1000.0,
+        'detect_ms': summarize(detect),
+        'recover_ms': summarize(recover),
+        'logins': summarize(logins),
+        'failures': failures,
+        'passed': not failures,
+    }
+
+
+def print_report(results):
+    for r in results:
+        if r.get('skipped'):
+            print(f"\n== {r['scenario']}（{r['desc']}）跳过：{r['skipped']}")
+            continue
+        verdict = '通过' if r['passed'] else '未通过'
+        print(f"\n== {r['scenario']}（{r['desc']}）{verdict}，目标 {r['target_ms']:.0f} ms")
+        for key in ('detect_ms', 'recover_ms', 'logins'):
+            v = r[key]
+            if v.get('n'):
+                unit = '' if key == 'logins' else ' ms'
+                print(f"  {key:<12} mean {v['mean']:8.1f}{unit}  median {v['median']:8.1f}{unit}"
+                      f"  p95 {v['p95']:8.1f}{unit}  max {v['max']:8.1f}{unit}")
+        for msg in r['failures']:
+            print(f"  ! {msg}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='网络命名空间端到端掉线恢复计时')
+    parser.add_argument('--client', metavar='CFG', help=argparse.SUPPRESS)  # 内部：客户端子进程
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--only', nargs='+', metavar='SCENARIO', help='只运行这些场景')
+    parser.add_argument('--target-scale', type=float, default=1.0, help='目标耗时的放宽倍数')
+    parser.add_argument('--prefix', default='campusbench', help='命名空间名前缀')
+    parser.add_argument('--verbose', action='store_true', help='输出客户端日志')
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    if args.client:
+        run_client(args.client)
+        return
+    if not sys.platform.startswith('linux') or os.geteuid() != 0 or shutil.which('ip') is None:
+        sys.exit('需要在 Linux 上以 root 运行，并安装 iproute2（ip / tc）')
+
+    topo = Topology(args.prefix)
+    portal = FakeEportal(host=PORTAL_IP, port=80)
+    client = None
+    results = []
+    try:
+        topo.setup()
+        in_netns(topo.net, portal.start)
+        start_internet(portal, topo.inet)
+        scenarios = build_scenarios(topo, portal)
+        if args.only:
+            unknown = set(args.only) - {s.name for s in scenarios}
+            if unknown:
+                sys.exit(f"未知场景：{'、'.join(sorted(unknown))}")
+            scenarios = [s for s in scenarios if s.name in args.only]
+        client = ClientProcess(topo, CLIENT_CFG, args.verbose)
+        if not wait_for(lambda: (client.last_round() or {}).get('online'), 20.0):
+            sys.exit('客户端启动后未能完成首次认证，检查拓扑或使用 --verbose 查看日志')
+        for sc in scenarios:
+            if sc.needs_netem and not topo.netem_ok:
+                results.append({'scenario': sc.name, 'desc': sc.desc, 'skipped': '内核不支持 netem（sch_netem）'})
+                continue
+            print(f"运行 {sc.name}（{sc.desc}）...", flush=True)
+            results.append(run_scenario(sc, client, portal, args.rounds, args.target_scale, settle_sec=20.0))
+    finally:
+        if client is not None:
+            client.stop()
+        portal.stop()
+        topo.teardown()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    sys.exit(0 if all(r.get('passed', True) for r in results) else 1)
+
+
+if __name__ == '__main__':
+    main()
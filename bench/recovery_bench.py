@@ -0,0 +1,245 @@
+# recovery_bench.py
+# -*- coding: utf-8 -*-
+"""
+掉线恢复基准测试：对本地模拟门户（fake_eportal.py）驱动 Main 与 MonitorWorker，
+统计每次恢复的检测耗时、认证耗时、校验耗时以及请求次数。
+
+  python bench/recovery_bench.py                  # 全部场景，各 20 轮
+  python bench/recovery_bench.py --rounds 50 --latency-ms 20 --json result.json
+  python bench/recovery_bench.py --only main      # 只测 Main.login
+
+场景：
+  main-cold    每轮作废登录上下文缓存，按门户状态登录（一次 GET 判断状态并抓取 queryString + POST）
+  main-classic 同上，但 smart_login 关闭：先下线再抓取 queryString + POST（对照）
+  main-warm    保留后台预取的上下文，恢复只需一次 POST
+  worker       MonitorWorker 按 --interval 周期检测；会话被踢后测量检测 / 认证 / 校验耗时
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_eportal import FakeEportal  # noqa: E402
+
+
+def summarize(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return {'n': 0}
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        'n': len(values),
+        'mean': statistics.fmean(values),
+        'median': statistics.median(values),
+        'p95': p95,
+        'max': ordered[-1],
+    }
+
+
+def portal_requests(portal):
+    """本轮打到门户的请求数（不含充当外网探测目标的 /generate_204）"""
+    return sum(v for k, v in portal.counts.items() if k != '/generate_204')
+
+
+# -----------------------------
+# 场景一：直接调用 Main.login
+# -----------------------------
+def bench_main(core, portal, rounds, warm, smart=True):
+    main = core.Main()
+    main.configure_portal(portal.base_url, portal.base_url)
+    main.smart_login = smart
+    login_ms, verify_ms, requests, round_trips = [], [], [], []
+    ok_count = 0
+    # 先完整登录一次，拿到上下文
+    main.login(portal.user, portal.pwd, '校园网')
+    for _ in range(rounds):
+        if warm:
+            portal.set_online(True)
+            main.refresh_context('校园网')  # 模拟网络正常时的后台预取
+        else:
+            main.context.invalidate()
+        portal.expire()
+        portal.reset_counts()
+
+        t0 = time.perf_counter()
+        state, _ = main.login(portal.user, portal.pwd, '校园网')
+        t1 = time.perf_counter()
+        requests.append(portal_requests(portal))
+        round_trips.append(main.last_login_round_trips)
+        verified = main.tst_net()
+        t2 = time.perf_counter()
+
+        ok_count += bool(state and verified)
+        login_ms.append((t1 - t0) * 1000.0)
+        verify_ms.append((t2 - t1) * 1000.0)
+    main.close_session()
+    return {
+        'scenario': 'main-warm' if warm else ('main-cold' if smart else 'main-classic'),
+        'success': ok_count,
+        'rounds': rounds,
+        'login_ms': summarize(login_ms),
+        'verify_ms': summarize(verify_ms),
+        'requests_per_recovery': summarize(requests),
+        'requests_reported': summarize(round_trips),  # Main 自己统计的往返次数，应与上一项一致
+    }
+
+
+# -----------------------------
+# 场景二：MonitorWorker 全流程
+# -----------------------------
+def bench_worker(app, portal, rounds, interval, verify_delay, timeout):
+    from PySide6 import QtCore
+
+    probe = portal.base_url + '/generate_204'
+    cfg = dict(app.DEFAULT_CONFIG)
+    cfg.update({
+        'user': portal.user,
+        'pwd': portal.pwd,
+        'portal_url': portal.base_url,
+        'auth_url': portal.base_url,
+        'check_host': probe,
+        'fallback_check_host': probe,
+        'tertiary_check_host': probe,
+        'ping_timeout_ms': 1000,
+        'check_interval_sec': interval,
+        'steady_interval_sec': interval,
+        'fast_recheck_sec': min(interval, 2.0),
+        'post_login_check_delay_sec': verify_delay,
+        'event_driven_check': False,
+        'journal_enabled': False,
+        'metrics_port': 0,
+    })
+
+    qapp = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    worker = app.MonitorWorker(lambda: cfg)
+    thread = QtCore.QThread()
+    worker.moveToThread(thread)
+
+    lock = threading.Lock()
+    transitions = []  # (monotonic, phase)
+
+    def on_phase(snap):
+        with lock:
+            transitions.append((time.monotonic(), snap['phase']))
+
+    worker.phaseChanged.connect(on_phase, QtCore.Qt.DirectConnection)
+    thread.start()
+    portal.set_online(True)
+    QtCore.QMetaObject.invokeMethod(worker, 'start', QtCore.Qt.QueuedConnection)
+
+    def wait_for(pred, limit):
+        end = time.monotonic() + limit
+        while time.monotonic() < end:
+            if pred():
+                return True
+            time.sleep(0.005)
+        return False
+
+    def current_phase():
+        with lock:
+            return transitions[-1][1] if transitions else None
+
+    detect, login, verify, total, requests = [], [], [], [], []
+    failures = 0
+    wait_for(lambda: current_phase() == 'idle', timeout)
+    for _ in range(rounds):
+        time.sleep(random.uniform(0, interval))  # 掉线时刻落在检测间隔内的随机位置
+        with lock:
+            transitions.clear()
+        portal.reset_counts()
+        t_expire = time.monotonic()
+        portal.expire()
+        done = wait_for(lambda: portal.is_online() and current_phase() == 'idle', timeout)
+        with lock:
+            seen = list(transitions)
+        if not done:
+            failures += 1
+            continue
+        first = {}
+        for ts, phase in seen:
+            first.setdefault(phase, ts)
+        t_idle = seen[-1][0]
+        if 'login' in first:
+            detect.append((first['login'] - t_expire) * 1000.0)
+        if 'login' in first and 'verify_wait' in first:
+            login.append((first['verify_wait'] - first['login']) * 1000.0)
+        if 'verify' in first:
+            verify.append((t_idle - first['verify']) * 1000.0)
+        total.append((t_idle - t_expire) * 1000.0)
+        requests.append(portal_requests(portal))
+
+    QtCore.QMetaObject.invokeMethod(worker, 'stop', QtCore.Qt.QueuedConnection)
+    wait_for(lambda: current_phase() == 'stopped', 5.0)
+    thread.quit()
+    thread.wait(3000)
+    qapp.processEvents()
+    return {
+        'scenario': 'worker',
+        'success': rounds - failures,
+        'rounds': rounds,
+        'interval_sec': interval,
+        'verify_delay_sec': verify_delay,
+        'detect_ms': summarize(detect),
+        'login_ms': summarize(login),
+        'verify_ms': summarize(verify),
+        'recover_ms': summarize(total),
+        'requests_per_recovery': summarize(requests),
+    }
+
+
+def print_report(results):
+    for r in results:
+        print(f"\n== {r['scenario']} （成功 {r['success']}/{r['rounds']}）")
+        for key, value in r.items():
+            if isinstance(value, dict) and value.get('n'):
+                unit = '' if key.startswith('requests') else ' ms'
+                print(f"  {key:<24} mean {value['mean']:9.1f}{unit}  median {value['median']:9.1f}{unit}"
+                      f"  p95 {value['p95']:9.1f}{unit}  max {value['max']:9.1f}{unit}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='掉线恢复基准测试（本地模拟门户）')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='模拟门户每个请求的附加延迟')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='模拟门户返回 500 的概率')
+    parser.add_argument('--gzip', choices=['none', 'header', 'raw'], default='none')
+    parser.add_argument('--interval', type=float, default=2.0, help='worker 场景的检测间隔（秒）')
+    parser.add_argument('--verify-delay', type=float, default=0.2, help='worker 场景认证后等待校验的时间（秒）')
+    parser.add_argument('--timeout', type=float, default=30.0, help='worker 场景单轮恢复超时（秒）')
+    parser.add_argument('--only', choices=['main', 'worker'])
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    args = parser.parse_args()
+
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    import campus_core
+
+    portal = FakeEportal(latency_ms=args.latency_ms, fail_rate=args.fail_rate, gzip_mode=args.gzip).start()
+    results = []
+    try:
+        if args.only in (None, 'main'):
+            results.append(bench_main(campus_core, portal, args.rounds, warm=False))
+            results.append(bench_main(campus_core, portal, args.rounds, warm=False, smart=False))
+            results.append(bench_main(campus_core, portal, args.rounds, warm=True))
+        if args.only in (None, 'worker'):
+            import app
+            results.append(bench_worker(app, portal, args.rounds, args.interval,
+                                        args.verify_delay, args.timeout))
+    finally:
+        portal.stop()
+
+    print_report(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
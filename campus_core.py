@@ -0,0 +1,4453 @@
+# campus_core.py
+# -*- coding: utf-8 -*-
+# 不依赖 Qt 的核心：配置、认证、探测、调度、事件日志、指标与监控状态机。
+# 托盘程序（app.py）与无界面守护进程（campusd.py）共用；顶层只导入标准库，requests 在首次建立会话时才导入。
+
+import os
+import sys
+import json
+import re
+import time
+import collections
+import itertools
+import platform
+import random
+import math
+import socket
+import ipaddress
+import struct
+import subprocess
+import threading
+import queue
+import gzip
+import hmac
+from array import array
+from datetime import datetime
+# -----------------------------
+# 应用常量与资源
+# -----------------------------
+APP_NAME = "CloudLight燕山大学校园网认证程序2.9"
+DEFAULT_CONFIG = {
+    "user": "",
+    "pwd": "",
+    "type": "校园网",
+
+    # 周期性检测（按 ping 判断是否有网）
+    "check_host": "www.baidu.com",     # 主：百度
+    "fallback_check_host": "223.5.5.5",# 备：阿里 AliDNS
+    "tertiary_check_host": "119.29.29.29",  # 第三：腾讯 DNS
+    "ping_timeout_ms": 1500,
+    "check_interval_sec": 30.0,             # 周期检测间隔（秒）；启用网络事件触发后可适当调大，作为兜底
+    "steady_interval_sec": 120.0,           # 持续在线超过 steady_after_sec 后放慢到此间隔
+    "steady_after_sec": 600.0,
+    "fast_recheck_sec": 2.0,                # 掉线 / 刚恢复后的快速复查间隔
+    "fast_recheck_count": 3,                # 恢复后连续快速确认的次数
+    "portal_backoff_max_sec": 300.0,        # 门户不可达时指数退避的上限
+    "schedule_jitter": 0.2,                 # 退避与稳定期间隔的随机抖动比例
+    "event_driven_check": True,             # Linux：网卡/地址/默认路由变化时立即检测
+    "event_debounce_ms": 800,               # 事件去抖：一串连续事件只触发一次检测
+
+    # 磁盘事件日志（探测 / 认证 / 下线 / 异常），位于配置目录下的 journal 子目录
+    "journal_enabled": True,
+    "journal_segment_kb": 1024,             # 单段超过此大小后轮转并压缩
+    "journal_max_segments": 200,            # 最多保留的压缩段数
+
+    # 主窗口探测历史曲线：内存中保留的逐次样本条数（之后只保留分钟 / 小时 / 天级汇总）
+    "history_raw_samples": 21600,
+
+    # 配置文件变化后自动热加载（Linux 用 inotify，其他平台定时比较修改时间）
+    "config_watch": True,
+
+    # 指标导出：>0 时在 127.0.0.1:<端口> 提供 /metrics（Prometheus 文本格式）与 /metrics.json
+    "metrics_port": 0,
+
+    # 本机控制 / 状态接口（其他程序读取状态、订阅变化、触发检测 / 认证；修改后需重启）
+    "control_api": True,                  # 是否开启（--once 时不开启）
+    "control_socket": "",                # Linux / macOS：Unix socket 路径（留空：配置目录下的 control.sock，仅当前用户可连）
+    "control_port": 47831,               # Windows：监听 127.0.0.1 的端口
+
+    # 日志成批投递给界面：最多等待 log_flush_ms，或攒够 log_batch_max 条立即投递
+    "log_flush_ms": 200,
+    "log_batch_max": 200,
+    "probe_mode": "parallel",               # parallel=三目标同时探测、首个成功即返回；serial=依次探测
+    "probe_engine": "socket",               # socket=进程内探测（ICMP/TCP/HTTP）；ping=调用系统 ping 命令
+    "probe_workers": 4,                     # 探测线程数（多账号时共用，账号多时探测排队）
+    "portal_deadline_sec": 30.0,            # 一次门户操作（判断状态 / 认证 / 下线）的总时限，超时按门户不可达处理
+
+    # 登录成功后的二次校验（留空/0 则回退到上面的目标与超时）
+    "post_login_check_host": "",
+    "post_login_fallback_host": "",
+    "post_login_tertiary_host": "",
+    "post_login_ping_timeout_ms": 0,
+
+    # 重连等待
+    "reconnect_wait_sec": 5.0,
+    "post_login_check_delay_sec": 3.0,   # 认证成功后等待多久再做二次校验
+
+    # 掉线原因判断：外网不通时先看门户是否仍显示已认证、网关是否可达，只有未认证才重新认证
+    "outage_classify": True,
+    "gateway_host": "",                  # 判断本地网络用的网关（留空：Linux 下读取默认网关，其他平台不判断）
+    "upstream_reauth_after_sec": 600.0,  # 上游中断持续超过此时长仍未恢复时重新认证一次（排除门户残留的失效会话；0 = 从不）
+
+    # 认证网关与 eportal 接口地址
+    "portal_url": "http://10.11.0.1",
+    "auth_url": "http://auth.ysu.edu.cn",
+
+    # 多出口 / 多账号：把门户请求与探测绑定到指定源地址或网卡（留空不绑定）
+    "source_address": "",
+    "bind_interface": "",
+    "accounts": [],                      # 多账号：[{"name", "user", "pwd", "type", "source_address", "bind_interface", ...}]
+    "account_workers": 4,                # 多账号共用的工作线程数
+    "portal_max_concurrent": 4,          # 所有账号合计同时打到门户的请求数上限
+
+    # 门户请求限速与熔断（所有请求经过同一闸门；多账号共用）
+    "portal_rate_per_sec": 2.0,          # 令牌桶：平均每秒请求数（0 = 不限速）
+    "portal_burst": 8,                   # 令牌桶容量：允许的突发请求数
+    "portal_breaker_failures": 5,        # 连续失败（请求异常 / 5xx / 登录被拒）达到此次数后熔断（0 = 不熔断）
+    "portal_breaker_open_sec": 30.0,     # 熔断后多久放行一个试探请求；试探失败则翻倍
+    "portal_breaker_open_max_sec": 600.0,
+
+    # 认证门户 HTTP 连接池（监控运行期间复用 keep-alive 连接）
+    "http_pool_size": 4,
+    "http_connect_timeout_sec": 3.0,
+    "http_read_timeout_sec": 5.0,        # GET（认证页、在线信息）读取超时
+    "http_post_timeout_sec": 8.0,        # POST（login / logout）读取超时
+    "http_retries": 1,                   # 建连失败重试次数；GET 额外重试读超时
+
+    # 登录上下文缓存（queryString / service / userIndex）
+    "login_context_ttl_sec": 21600.0,    # queryString 抓取超过此时长后不再用于快速登录
+    "login_context_refresh_sec": 300.0,  # 网络正常时每隔多久后台刷新一次（顺带读取会话剩余时长 / 流量）
+    "smart_login": True,                 # 先判断门户状态，只在有旧会话时才下线；False = 每次先下线再认证
+
+    # 会话到期前计划内重新认证（下线 + 一次 POST），避免门户强制下线造成断网
+    "session_refresh": True,
+    "session_max_age_sec": 0,            # 门户不返回剩余时长时按此会话寿命估算（秒，0 = 不估算）
+    "session_refresh_margin_sec": 300.0, # 到期前提前多久重新认证（秒）
+    "session_quiet_hours": "",           # 如 "03:00-05:00"：到期前最后一个该时段开始时就刷新
+    "session_flow_warn_mb": 100.0,       # 剩余流量低于此值时告警一次（MB，0 = 不告警）
+
+    # 探测目标域名预解析（探测直接用缓存的 IP，掉线后不必先等 DNS）
+    "dns_cache": True,
+    "dns_cache_ttl_sec": 300.0,          # 网络正常时超过此时长后台重新解析
+    "dns_cache_max_stale_sec": 86400.0,  # 过期后仍继续使用旧地址的最长时间
+
+    # 程序行为
+    "auto_start_monitor": True,
+    "auto_start_with_windows": False,
+
+    # 日志保留
+    "max_log_lines": 1000
+}
+
+def appdata_dir():
+    base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    path = os.path.join(base, APP_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def config_path():
+    return os.path.join(appdata_dir(), "config.json")
+
+def load_config(path=None):
+    path = path or config_path()
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for k, v in DEFAULT_CONFIG.items():
+                data.setdefault(k, v)
+            return data
+        except Exception:
+            pass
+    return DEFAULT_CONFIG.copy()
+
+def save_config(cfg: dict, path=None):
+    with open(path or config_path(), "w", encoding="utf-8") as f:
+        json.dump(cfg, f, ensure_ascii=False, indent=2)
+
+def resource_path(rel: str) -> str:
+    if hasattr(sys, "_MEIPASS"):
+        return os.path.join(sys._MEIPASS, rel)
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), rel)
+
+# -----------------------------
+# 指标：各阶段耗时直方图、计数器、掉线时长；可选本机 Prometheus 文本格式导出
+# -----------------------------
+class _MetricTimer():
+    """with METRICS.timer(...) as t: ...；正常结束记为 result=ok，抛异常记为 error，可手动改 t.result"""
+    def __init__(self, metrics, name, labels):
+        self._metrics = metrics
+        self._name = name
+        self._labels = labels
+        self.result = 'ok'
+        self.seconds = None
+
+    def __enter__(self):
+        self._t0 = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.monotonic() - self._t0
+        if exc_type is not None:
+            self.result = 'error'
+        self._metrics.observe(self._name, self.seconds, result=self.result, **self._labels)
+        return False
+
+class Metrics():
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+    HELP = {
+        'campus_probe_seconds': '单个目标探测耗时',
+        'campus_probe_chain_seconds': '一次多目标探测（主/备/第三）的总耗时',
+        'campus_portal_request_seconds': '认证门户各步骤请求耗时（op 区分 tst_net / pre_logout / scrape_query / login_post / logout / online_info）',
+        'campus_dns_resolve_seconds': '探测目标域名解析耗时（后台预解析）',
+        'campus_dns_cache_total': '探测时查询 DNS 缓存的结果（hit / stale / miss）',
+        'campus_outage_seconds': '掉线时长：首次探测失败到认证后首次探测成功',
+        'campus_logins_total': '认证次数',
+        'campus_login_round_trips_total': '认证累计发出的门户请求数（除以 campus_logins_total 即每次恢复的往返次数）',
+        'campus_outages_total': '掉线次数',
+        'campus_portal_rejected_total': '门户闸门拒绝的请求数（open = 熔断中，throttled = 限速等待超时，auth = 本账号登录连续被拒暂停中）',
+        'campus_portal_breaker_state': '门户熔断状态（0 正常 / 1 试探 / 2 熔断）',
+        'campus_outage_class_total': '外网不通时的原因判断结果（unauth / upstream / portal_down / link_down）',
+        'campus_outage_active': '当前是否处于掉线中（多账号时按 account 标签分别统计）',
+        'campus_session_refresh_total': '会话到期前的计划内重新认证次数（ok / fail / error）',
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hist = {}       # (name, labels) -> [bucket 计数..., +Inf 计数, sum]
+        self._counters = {}   # (name, labels) -> value
+        self._gauges = {}     # (name, labels) -> value
+        self._outage_since = {}  # 账号名（单账号为 None）-> 掉线开始时刻
+
+    def _key(self, name, labels):
+        return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    def observe(self, name, seconds, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            h = self._hist.get(key)
+            if h is None:
+                h = self._hist[key] = [0] * (len(self.BUCKETS) + 1) + [0.0]
+            for i, le in enumerate(self.BUCKETS):
+                if seconds <= le:
+                    h[i] += 1
+            h[len(self.BUCKETS)] += 1
+            h[-1] += seconds
+
+    def inc(self, name, n=1, **labels):
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + n
+
+    def set_gauge(self, name, value, **labels):
+        with self._lock:
+            self._gauges[self._key(name, labels)] = value
+
+    def timer(self, name, **labels):
+        return _MetricTimer(self, name, labels)
+
+    # —— 掉线时长 —— #
+    # 按账号分别计时：多账号时一个账号恢复不会结束另一个账号的掉线
+    def outage_begin(self, account=None):
+        with self._lock:
+            if account in self._outage_since:
+                return
+            self._outage_since[account] = time.monotonic()
+        labels = {} if account is None else {'account': account}
+        self.inc('campus_outages_total', **labels)
+        self.set_gauge('campus_outage_active', 1, **labels)
+
+    def outage_end(self, account=None):
+        with self._lock:
+            since = self._outage_since.pop(account, None)
+        if since is not None:
+            labels = {} if account is None else {'account': account}
+            self.observe('campus_outage_seconds', time.monotonic() - since, **labels)
+            self.set_gauge('campus_outage_active', 0, **labels)
+
+    def outage_elapsed(self, account=None):
+        since = self._outage_since.get(account)
+        return None if since is None else time.monotonic() - since
+
+    # —— 导出 —— #
+    def snapshot(self):
+        """返回便于程序读取的字典：histograms 含 count / sum / buckets"""
+        with self._lock:
+            hist = {k: list(v) for k, v in self._hist.items()}
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            now = time.monotonic()
+            outages = {k: now - v for k, v in self._outage_since.items() if k is not None}
+        out = {'histograms': [], 'counters': [], 'gauges': [], 'outage_elapsed_sec': self.outage_elapsed(),
+               'outage_elapsed_by_account': outages}
+        for (name, labels), h in sorted(hist.items()):
+            out['histograms'].append({
+                'name': name, 'labels': dict(labels),
+                'count': h[len(self.BUCKETS)], 'sum': h[-1],
+                'buckets': {str(le): h[i] for i, le in enumerate(self.BUCKETS)},
+            })
+        for (name, labels), v in sorted(counters.items()):
+            out['counters'].append({'name': name, 'labels': dict(labels), 'value': v})
+        for (name, labels), v in sorted(gauges.items()):
+            out['gauges'].append({'name': name, 'labels': dict(labels), 'value': v})
+        return out
+
+    def _fmt_labels(self, labels, extra=None):
+        items = list(labels) + ([extra] if extra else [])
+        if not items:
+            return ''
+        esc = lambda v: v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        return '{' + ','.join(f'{k}="{esc(v)}"' for k, v in items) + '}'
+
+    def render_prometheus(self):
+        """Prometheus 文本格式（0.0.4）"""
+        with self._lock:
+            hist = sorted((k, list(v)) for k, v in self._hist.items())
+            counters = sorted(self._counters.items())
+            gauges = sorted(self._gauges.items())
+        lines = []
+        seen = set()
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self.HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+        for (name, labels), h in hist:
+            header(name, 'histogram')
+            for i, le in enumerate(self.BUCKETS):
+                lines.append(f"{name}_bucket{self._fmt_labels(labels, ('le', repr(le)))} {h[i]}")
+            lines.append(f"{name}_bucket{self._fmt_labels(labels, ('le', '+Inf'))} {h[len(self.BUCKETS)]}")
+            lines.append(f"{name}_sum{self._fmt_labels(labels)} {h[-1]:.6f}")
+            lines.append(f"{name}_count{self._fmt_labels(labels)} {h[len(self.BUCKETS)]}")
+        for (name, labels), v in counters:
+            header(name, 'counter')
+            lines.append(f"{name}{self._fmt_labels(labels)} {v}")
+        for (name, labels), v in gauges:
+            header(name, 'gauge')
+            lines.append(f"{name}{self._fmt_labels(labels)} {v}")
+        return "\n".join(lines) + "\n"
+
+METRICS = Metrics()
+
+class MetricsServer():
+    """仅监听 127.0.0.1：GET /metrics 为文本格式，GET /metrics.json 为 snapshot()"""
+    def __init__(self, metrics, port, host='127.0.0.1'):
+        self.metrics = metrics
+        self.port = int(port)
+        self.host = host
+        self._httpd = None
+
+    def start(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body = metrics.render_prometheus().encode('utf-8')
+                    ctype = 'text/plain; version=0.0.4; charset=utf-8'
+                elif path == '/metrics.json':
+                    body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode('utf-8')
+                    ctype = 'application/json; charset=utf-8'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', ctype)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, name="metrics-http", daemon=True).start()
+
+    def stop(self):
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+
+# -----------------------------
+# 登录上下文缓存：网络正常时后台预取，掉线后只需一次 login POST
+# -----------------------------
+class LoginContext():
+    def __init__(self, ttl_sec=21600.0):
+        self.ttl_sec = float(ttl_sec)
+        self.query_string = ''
+        self.service = None
+        self.user_index = None
+        self.updated_at = None  # time.monotonic()；None 表示从未填充
+
+    def age(self):
+        if self.updated_at is None:
+            return None
+        return time.monotonic() - self.updated_at
+
+    def is_fresh(self, service=None):
+        """queryString 已缓存、未过期，且 service 与本次登录一致"""
+        age = self.age()
+        if not self.query_string or age is None or age > self.ttl_sec:
+            return False
+        return service is None or service == self.service
+
+    def update(self, query_string=None, service=None, user_index=None):
+        """只有重新抓到 queryString 才刷新时间戳（已在线时抓不到，沿用旧值）"""
+        if query_string:
+            self.query_string = query_string
+            self.updated_at = time.monotonic()
+        if service is not None:
+            self.service = service
+        if user_index is not None:
+            self.user_index = user_index or None
+
+    def invalidate(self):
+        """登录被拒或配置变化时清空，下次走完整流程重新抓取"""
+        self.query_string = ''
+        self.service = None
+        self.user_index = None
+        self.updated_at = None
+
+# -----------------------------
+# 会话信息：getOnlineUserInfo 中与会话寿命有关的字段（在线时长 / 剩余时长 / 剩余流量）
+# -----------------------------
+class SessionInfo():
+    # 不同版本门户字段名不一，取到哪个算哪个
+    LEFT_TIME_KEYS = ('maxLeftTime', 'leftTime', 'remainTime', 'timeLeft')
+    ONLINE_TIME_KEYS = ('onlineTime', 'onlineDuration', 'usedTime')
+    LEFT_FLOW_KEYS = ('leftFlow', 'maxLeftFlow', 'remainFlow')
+
+    def __init__(self):
+        self.online = False
+        self.user_index = None
+        self.online_sec = None     # 本次会话已在线秒数
+        self.left_sec = None       # 距门户强制下线的秒数
+        self.left_flow_mb = None   # 剩余流量（MB）
+        self.fetched_at = None     # time.monotonic()
+
+    @classmethod
+    def parse(cls, data):
+        info = cls()
+        info.fetched_at = time.monotonic()
+        if not isinstance(data, dict):
+            return info
+        info.user_index = data.get('userIndex') or None
+        info.online = data.get('result') == 'success' or bool(info.user_index)
+        info.online_sec = cls._first(data, cls.ONLINE_TIME_KEYS, cls.parse_duration)
+        info.left_sec = cls._first(data, cls.LEFT_TIME_KEYS, cls.parse_duration)
+        info.left_flow_mb = cls._first(data, cls.LEFT_FLOW_KEYS, cls.parse_flow)
+        return info
+
+    @staticmethod
+    def _first(data, keys, parser):
+        for k in keys:
+            value = parser(data.get(k))
+            if value is not None:
+                return value
+        return None
+
+    @staticmethod
+    def parse_duration(value):
+        """秒数、"HH:MM:SS" 或 "1天2小时3分4秒" → 秒；空值 / 无法识别返回 None"""
+        if value is None or isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return float(value) if value >= 0 else None
+        text = str(value).strip()
+        if not text:
+            return None
+        if re.fullmatch(r'\d+(\.\d+)?', text):
+            return float(text)
+        m = re.fullmatch(r'(\d+):(\d{1,2}):(\d{1,2})', text)
+        if m:
+            h, mi, se = (int(g) for g in m.groups())
+            return float(h * 3600 + mi * 60 + se)
+        total = 0.0
+        found = False
+        for num, unit in re.findall(r'(\d+(?:\.\d+)?)\s*(天|小时|时|分钟|分|秒)', text):
+            total += float(num) * {'天': 86400, '小时': 3600, '时': 3600, '分钟': 60, '分': 60, '秒': 1}[unit]
+            found = True
+        return total if found else None
+
+    @staticmethod
+    def parse_flow(value):
+        """数字按 MB；也识别 "512M" / "1.5G" / "300KB" 之类的写法"""
+        if value is None or isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return float(value) if value >= 0 else None
+        m = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)B?\s*', str(value), re.I)
+        if not m:
+            return None
+        scale = {'': 1.0, 'K': 1 / 1024.0, 'M': 1.0, 'G': 1024.0, 'T': 1024.0 * 1024.0}[m.group(2).upper()]
+        return float(m.group(1)) * scale
+
+    def left_at(self, now=None):
+        """按抓取时刻推算的当前剩余秒数"""
+        if self.left_sec is None or self.fetched_at is None:
+            return None
+        now = time.monotonic() if now is None else now
+        return self.left_sec - (now - self.fetched_at)
+
+
+def _fmt_duration(sec):
+    """日志用：秒数 → "1天2小时" / "3小时5分" / "4分10秒" """
+    sec = int(max(0, sec))
+    d, rem = divmod(sec, 86400)
+    h, rem = divmod(rem, 3600)
+    m, s = divmod(rem, 60)
+    if d:
+        return f"{d}天{h}小时"
+    if h:
+        return f"{h}小时{m}分"
+    if m:
+        return f"{m}分{s}秒"
+    return f"{s}秒"
+
+# -----------------------------
+# 门户请求闸门：并发上限 + 令牌桶限速 + 熔断（连续失败后暂停，冷却后放行单个试探请求）；多账号共用一个。
+# 登录被拒（密码错误、欠费等）只与账号有关，由每个账号自己的 LoginBreaker 计数
+# -----------------------------
+class PortalUnavailable(Exception):
+    """闸门拒绝发出请求：reason 为 'open'（熔断中）、'throttled'（限速等待超时）或 'auth'（本账号登录连续被拒，暂停登录）"""
+    WHAT = {'open': '门户请求已熔断', 'throttled': '门户请求过于频繁', 'auth': '登录连续被拒，已暂停登录'}
+
+    def __init__(self, reason, retry_after):
+        self.reason = reason
+        self.retry_after = max(0.0, retry_after)
+        what = self.WHAT.get(reason, self.WHAT['throttled'])
+        super().__init__(f"{what}，{self.retry_after:.0f} 秒后再试")
+
+class PortalGate():
+    STATE_NAMES = {'closed': '正常', 'open': '熔断', 'half_open': '试探'}
+    STATE_GAUGE = {'closed': 0, 'half_open': 1, 'open': 2}
+
+    def __init__(self, max_concurrent=4, rate_per_sec=2.0, burst=8, failure_threshold=5,
+                 open_sec=30.0, open_max_sec=600.0, max_wait_sec=3.0):
+        self._cond = threading.Condition()
+        self._active = 0
+        self.state = 'closed'
+        self._open_until = 0.0
+        self._cooldown = float(open_sec)
+        self._trial = None             # 半开状态下在途试探请求所在的线程（None = 没有）
+        self._changed = False
+        self._transport_failures = 0   # 连续请求异常 / 5xx
+        self.last_failure = ''
+        self.rejected = 0
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self.max_wait_sec = float(max_wait_sec)
+        self.set_limit(max_concurrent)
+        self.configure(rate_per_sec=rate_per_sec, burst=burst, failure_threshold=failure_threshold,
+                       open_sec=open_sec, open_max_sec=open_max_sec)
+
+    def set_limit(self, max_concurrent):
+        """运行中调整上限：调大立即放行排队的请求，调小则等进行中的请求自然结束"""
+        with self._cond:
+            self.max_concurrent = max(1, int(max_concurrent))
+            self._cond.notify_all()
+
+    def configure(self, rate_per_sec=2.0, burst=8, failure_threshold=5, open_sec=30.0, open_max_sec=600.0):
+        """rate_per_sec <= 0 表示不限速；failure_threshold <= 0 表示不熔断"""
+        with self._cond:
+            self.rate_per_sec = float(rate_per_sec)
+            self.burst = max(1.0, float(burst))
+            self._tokens = min(self._tokens, self.burst)
+            self.failure_threshold = int(failure_threshold)
+            self.open_sec = max(1.0, float(open_sec))
+            self.open_max_sec = max(self.open_sec, float(open_max_sec))
+            if self.state == 'closed':
+                self._cooldown = self.open_sec
+            self._cond.notify_all()
+
+    def configure_from(self, cfg):
+        def num(key, default):
+            try:
+                return float(cfg.get(key, default))
+            except Exception:
+                return default
+        self.set_limit(num("portal_max_concurrent", 4))
+        self.configure(rate_per_sec=num("portal_rate_per_sec", 2.0), burst=num("portal_burst", 8),
+                       failure_threshold=num("portal_breaker_failures", 5),
+                       open_sec=num("portal_breaker_open_sec", 30.0),
+                       open_max_sec=num("portal_breaker_open_max_sec", 600.0))
+
+    # —— 进出闸门：with gate: 包住一次 HTTP 请求 —— #
+    def __enter__(self):
+        with self._cond:
+            deadline = time.monotonic() + self.max_wait_sec
+            while True:
+                now = time.monotonic()
+                self._admit_state(now)  # 熔断中直接拒绝，不排队
+                wait = None
+                if self._active >= self.max_concurrent or (self.state == 'half_open' and self._trial is not None):
+                    wait = deadline - now
+                else:
+                    need = self._token_wait(now)
+                    if need <= 0:
+                        break
+                    wait = min(need, deadline - now)
+                    if need > deadline - now:
+                        self._reject('throttled', need)
+                if wait <= 0:
+                    self._reject('throttled', 1.0)
+                self._cond.wait(wait)
+            if self.rate_per_sec > 0:
+                self._tokens -= 1.0
+            if self.state == 'half_open':
+                self._trial = threading.get_ident()
+            self._active += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self._cond:
+            self._active -= 1
+            # 熔断前放行的请求结束时不能顶替试探请求，只有试探请求本身结束才放行下一个
+            if self._trial == threading.get_ident():
+                self._trial = None
+            self._cond.notify_all()
+        return False
+
+    def _admit_state(self, now):
+        if self.state == 'open':
+            if now < self._open_until:
+                self._reject('open', self._open_until - now)
+            self._set_state('half_open')
+
+    def _token_wait(self, now):
+        """补充令牌；返回还需等待的秒数（<=0 表示已有令牌）"""
+        if self.rate_per_sec <= 0:
+            return 0.0
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate_per_sec)
+        self._refilled_at = now
+        if self._tokens >= 1.0:
+            return 0.0
+        return (1.0 - self._tokens) / self.rate_per_sec
+
+    def _reject(self, reason, retry_after):
+        self.rejected += 1
+        METRICS.inc('campus_portal_rejected_total', reason=reason)
+        raise PortalUnavailable(reason, retry_after)
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self._changed = True
+            METRICS.set_gauge('campus_portal_breaker_state', self.STATE_GAUGE[state])
+
+    def pop_change(self):
+        """状态变化后第一次调用返回 snapshot()，之后返回 None；多账号共用时只由一个账号记日志"""
+        with self._cond:
+            if not self._changed:
+                return None
+            self._changed = False
+        return self.snapshot()
+
+    # —— 结果回报：由 Main 在请求结束 / 解析出登录结果后调用 —— #
+    def record_transport(self, ok, reason=''):
+        """一次 HTTP 请求是否拿到了正常响应（异常与 5xx 算失败）"""
+        with self._cond:
+            if ok:
+                self._transport_failures = 0
+                if self.state == 'half_open' and self._below_threshold():
+                    self._close()
+            else:
+                self._transport_failures += 1
+                self._failed(reason or '请求失败')
+
+    def _below_threshold(self):
+        return self.failure_threshold <= 0 or self._transport_failures < self.failure_threshold
+
+    def _failed(self, reason):
+        self.last_failure = reason
+        if self.failure_threshold <= 0:
+            return
+        if self.state == 'half_open':
+            self._cooldown = min(self.open_max_sec, self._cooldown * 2)  # 试探失败：冷却时间翻倍
+        elif self._below_threshold():
+            return
+        self._open_until = time.monotonic() + self._cooldown
+        self._set_state('open')
+        self._cond.notify_all()
+
+    def _close(self):
+        self._cooldown = self.open_sec
+        self._set_state('closed')
+
+    def snapshot(self):
+        with self._cond:
+            now = time.monotonic()
+            self._token_wait(now)
+            return {
+                'state': self.state,
+                'state_name': self.STATE_NAMES[self.state],
+                'retry_after_sec': max(0.0, self._open_until - now) if self.state == 'open' else 0.0,
+                'transport_failures': self._transport_failures,
+                'last_failure': self.last_failure,
+                'tokens': self._tokens if self.rate_per_sec > 0 else None,
+                'in_flight': self._active,
+                'rejected': self.rejected,
+            }
+
+class LoginBreaker():
+    """
+    单个账号的登录熔断：门户按 message 拒绝登录连续达到阈值后暂停本账号的登录 POST，冷却后放行一次试探，
+    试探仍被拒则冷却时间翻倍。与共用的 PortalGate 分开，一个账号密码错误不会挡住其他账号。
+    同一账号的门户请求是串行的，不需要像闸门那样限制试探并发。
+    """
+    STATE_NAMES = PortalGate.STATE_NAMES
+
+    def __init__(self, failure_threshold=5, open_sec=30.0, open_max_sec=600.0):
+        self._lock = threading.Lock()
+        self.state = 'closed'
+        self.failures = 0
+        self.last_failure = ''
+        self._open_until = 0.0
+        self._changed = False
+        self.configure(failure_threshold, open_sec, open_max_sec)
+        self._cooldown = self.open_sec
+
+    def configure(self, failure_threshold=5, open_sec=30.0, open_max_sec=600.0):
+        with self._lock:
+            self.failure_threshold = int(failure_threshold)
+            self.open_sec = max(1.0, float(open_sec))
+            self.open_max_sec = max(self.open_sec, float(open_max_sec))
+            if self.state == 'closed':
+                self._cooldown = self.open_sec
+            if self.failure_threshold <= 0 and self.state != 'closed':
+                self._set_state('closed')
+
+    def configure_from(self, cfg):
+        def num(key, default):
+            try:
+                return float(cfg.get(key, default))
+            except Exception:
+                return default
+        self.configure(failure_threshold=num("portal_breaker_failures", 5),
+                       open_sec=num("portal_breaker_open_sec", 30.0),
+                       open_max_sec=num("portal_breaker_open_max_sec", 600.0))
+
+    def check(self):
+        """登录 POST 之前调用：熔断中抛出 PortalUnavailable('auth')，冷却结束则转为试探"""
+        with self._lock:
+            if self.state != 'open':
+                return
+            now = time.monotonic()
+            if now < self._open_until:
+                METRICS.inc('campus_portal_rejected_total', reason='auth')
+                raise PortalUnavailable('auth', self._open_until - now)
+            self._set_state('half_open')
+
+    def record(self, ok, message=''):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self._cooldown = self.open_sec
+                self._set_state('closed')
+                return
+            self.failures += 1
+            self.last_failure = message or '登录被拒'
+            if self.failure_threshold <= 0:
+                return
+            if self.state == 'half_open':
+                self._cooldown = min(self.open_max_sec, self._cooldown * 2)
+            elif self.failures < self.failure_threshold:
+                return
+            self._open_until = time.monotonic() + self._cooldown
+            self._set_state('open')
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            self._changed = True
+
+    def pop_change(self):
+        with self._lock:
+            if not self._changed:
+                return None
+            self._changed = False
+        return self.snapshot()
+
+    def snapshot(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'state': self.state,
+                'state_name': self.STATE_NAMES[self.state],
+                'retry_after_sec': max(0.0, self._open_until - now) if self.state == 'open' else 0.0,
+                'failures': self.failures,
+                'last_failure': self.last_failure,
+            }
+
+# -----------------------------
+# 原有登录逻辑（增强：安全解析 + 认证前先下线）
+# -----------------------------
+class Main():
+    def __init__(self):
+        self.services = {
+            '校园网': '%e6%a0%a1%e5%9b%ad%e7%bd%91',
+            '中国移动': '%E4%B8%AD%E5%9B%BD%E7%A7%BB%E5%8A%A8',
+            '中国联通': '%e4%b8%ad%e5%9b%bd%e8%81%94%e9%80%9a',
+            '中国电信': '%e4%b8%ad%e5%9b%bd%e7%94%b5%e4%bf%a1',
+            '0': '%e6%a0%a1%e5%9b%ad%e7%bd%91',
+            '1': '%E4%B8%AD%E5%9B%BD%E7%A7%BB%E5%8A%A8',
+            '2': '%e4%b8%ad%e5%9b%bd%e8%81%94%e9%80%9a',
+            '3': '%e4%b8%ad%e5%9b%bd%e7%94%b5%e4%bf%a1'
+        }
+        self.configure_portal()
+        self.header = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/64.0.3282.140 Safari/537.36 Edge/17.17134',
+            'Accept-Encoding': 'gzip, deflate'
+        }
+        self.isLogined = None
+        self.alldata = None
+        self.session = None
+        self.gate = None  # PortalGate；多账号时共用
+        self.login_breaker = LoginBreaker()  # 登录被拒的熔断，每个账号一个
+        self.configure_http()
+        self.context = LoginContext()
+        self.session_info = None    # SessionInfo；每次 get_alldata 后更新
+        self.smart_login = True      # False 时沿用“先下线再抓取”的完整流程
+        self.last_login_path = None  # 'cached' = 仅一次 POST；'smart' = 一次 GET 判断状态 + POST；'full' = 下线 + 抓取 + POST
+        self.round_trips = 0         # 累计发出的门户请求数
+        self.last_login_round_trips = None
+
+    # 门户拒绝登录且提示已有在线会话（旧会话未清）时的提示语
+    CONFLICT_PATTERN = re.compile(r'已在线|已经在线|重复登录|already online', re.I)
+    # 门户拒绝登录且提示认证参数（queryString）失效时的提示语：只有这种拒绝才值得作废缓存重新抓取
+    STALE_CONTEXT_PATTERN = re.compile(r'querystring|认证参数|参数无效|参数错误|重新打开|认证页|页面已过期|请刷新', re.I)
+
+    def configure_portal(self, portal_url='http://10.11.0.1', auth_url='http://auth.ysu.edu.cn'):
+        """认证网关与 eportal 接口地址（测试时可指向本地模拟门户）"""
+        self.portal_url = portal_url.rstrip('/')
+        self.url = auth_url.rstrip('/') + '/eportal/InterFace.do?method='
+
+    # —— HTTP 会话：连接池 + keep-alive，一次重认证周期内复用同一批连接 —— #
+    def configure_http(self, pool_size=4, connect_timeout=3.0, read_timeout=5.0,
+                       post_timeout=8.0, retries=1, source_address=None, interface=None):
+        """source_address / interface：多出口时把门户连接绑定到该账号的源地址或网卡"""
+        self.pool_size = max(1, int(pool_size))
+        self.retries = max(0, int(retries))
+        self.source_address = source_address or None
+        self.interface = interface or None
+        self.get_timeout = (float(connect_timeout), float(read_timeout))
+        self.post_timeout = (float(connect_timeout), float(post_timeout))
+        self.close_session()
+
+    def open_session(self):
+        if self.session is not None:
+            return self.session
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        retry = Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=0,
+            allowed_methods=frozenset(['GET']),  # POST 只在建连失败（请求未发出）时重试
+            backoff_factor=0.2,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_size, max_retries=retry)
+        pool_kwargs = {}
+        if self.source_address:
+            pool_kwargs['source_address'] = (self.source_address, 0)
+        if self.interface and hasattr(socket, 'SO_BINDTODEVICE'):
+            from urllib3.connection import HTTPConnection
+            pool_kwargs['socket_options'] = HTTPConnection.default_socket_options + [
+                (socket.SOL_SOCKET, socket.SO_BINDTODEVICE, self.interface.encode())
+            ]
+        if pool_kwargs:
+            adapter.init_poolmanager(2, self.pool_size, **pool_kwargs)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        self.session = session
+        return session
+
+    def close_session(self):
+        if self.session is not None:
+            try:
+                self.session.close()
+            except Exception:
+                pass
+            self.session = None
+
+    def _get(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.get_timeout)
+        return self._send('get', url, kwargs)
+
+    def _post(self, url, **kwargs):
+        kwargs.setdefault('timeout', self.post_timeout)
+        return self._send('post', url, kwargs)
+
+    def _send(self, method, url, kwargs):
+        """所有门户请求的出口：经过闸门（限速 / 熔断）并统计往返次数"""
+        send = getattr(self.open_session(), method)
+        if self.gate is None:
+            self.round_trips += 1
+            res = send(url, **kwargs)
+        else:
+            with self.gate:
+                self.round_trips += 1  # 被闸门拒绝的请求没有发出，不算往返
+                try:
+                    res = send(url, **kwargs)
+                except Exception as e:
+                    self.gate.record_transport(False, type(e).__name__)
+                    raise
+                self.gate.record_transport(res.status_code < 500, f"HTTP {res.status_code}")
+        self.round_trips += len(res.history)  # 跟随的重定向（如 success.jsp）也是一次往返
+        return res
+
+    # —— 安全解析：JSON —— #
+    def _json_from_response(self, res):
+        """
+        安全解析 JSON：
+        1) 优先 res.json()
+        2) 若失败，检查 gzip 头（1F 8B），尝试手动解压再解析
+        3) 再失败则按 UTF-8 严格解析
+        """
+        try:
+            return res.json()
+        except Exception:
+            data = res.content
+            if len(data) >= 2 and data[0] == 0x1F and data[1] == 0x8B:
+                try:
+                    decompressed = gzip.decompress(data)
+                    return json.loads(decompressed.decode('utf-8'))
+                except Exception:
+                    pass
+            return json.loads(data.decode('utf-8', errors='strict'))
+
+    # —— 安全解析：文本（用于从 HTML 中提取 queryString） —— #
+    def _text_from_response(self, res):
+        try:
+            return res.text
+        except Exception:
+            pass
+        data = res.content
+        try:
+            if len(data) >= 2 and data[0] == 0x1F and data[1] == 0x8B:
+                return gzip.decompress(data).decode('utf-8', errors='replace')
+            return data.decode('utf-8', errors='replace')
+        except Exception:
+            return ''
+
+    def tst_net(self):
+        """是否已通过校园网认证（不代表外网可达）"""
+        self.portal_state()
+        return self.isLogined
+
+    def portal_state(self):
+        """GET 一次 10.11.0.1 并更新 isLogined；未认证时该响应里就带着 queryString，可直接复用"""
+        with METRICS.timer('campus_portal_request_seconds', op='tst_net'):
+            res = self._get(self.portal_url, headers=self.header)
+        self.isLogined = ('success.jsp' in res.url)
+        return res
+
+    def _try_logout_once(self):
+        """无论是否在线，都尝试获取 userIndex 并调用 logout，失败忽略。"""
+        with METRICS.timer('campus_portal_request_seconds', op='pre_logout'):
+            self._try_logout_inner()
+
+    def _try_logout_inner(self):
+        try:
+            if self.alldata is None:
+                try:
+                    res_info = self._get(self.portal_url + '/eportal/InterFace.do?method=getOnlineUserInfo')
+                    self.alldata = self._json_from_response(res_info)
+                except Exception:
+                    self.alldata = None
+
+            user_index = None
+            if isinstance(self.alldata, dict):
+                user_index = self.alldata.get('userIndex')
+
+            if user_index:
+                res = self._post(self.url + 'logout', headers=self.header,
+                                 data={'userIndex': user_index})
+                _ = self._json_from_response(res)
+        except Exception:
+            pass
+        finally:
+            self.alldata = None
+            self.context.user_index = None
+
+    def _user_index_from(self, res):
+        """已认证时门户重定向到 success.jsp?userIndex=...，直接从地址里取，省一次 getOnlineUserInfo"""
+        m = re.search(r'[?&]userIndex=([^&#]+)', res.url or '')
+        return m.group(1) if m else None
+
+    def _online_user_index(self):
+        try:
+            res = self._get(self.portal_url + '/eportal/InterFace.do?method=getOnlineUserInfo')
+            info = self._json_from_response(res)
+        except Exception:
+            return None
+        return info.get('userIndex') if isinstance(info, dict) else None
+
+    def _logout_user_index(self, user_index):
+        """按已知的 userIndex 下线一次，失败忽略；返回门户是否确认下线"""
+        if not user_index:
+            return False
+        try:
+            with METRICS.timer('campus_portal_request_seconds', op='pre_logout') as t:
+                res = self._post(self.url + 'logout', headers=self.header, data={'userIndex': user_index})
+                ok = self._json_from_response(res).get('result') == 'success'
+                if not ok:
+                    t.result = 'fail'
+        except Exception:
+            return False
+        finally:
+            self.alldata = None
+            self.context.user_index = None
+        return ok
+
+    def _scrape_query_string(self, res=None):
+        """从认证页 HTML 中提取 queryString；未传入响应时重新请求 10.11.0.1"""
+        with METRICS.timer('campus_portal_request_seconds', op='scrape_query') as t:
+            if res is None:
+                res = self._get(self.portal_url, headers=self.header)
+            query = self._parse_query_string(res)
+            if not query:
+                t.result = 'fail'
+        return query
+
+    def _parse_query_string(self, res):
+        html = self._text_from_response(res)
+        query = re.findall(r"href='.*?\?(.*?)'", html, re.S)
+        if not query:
+            query = re.findall(r'href="[^"]+\?([^"]+)"', html, re.S)
+        return query[0] if query else ''
+
+    def refresh_context(self, type):
+        """
+        网络正常时预取登录上下文：
+        未认证时能直接抓到 queryString；已认证时只能刷新 userIndex，
+        queryString 沿用上一次抓到的值（同一终端不会变化）。
+        """
+        service = self.services.get(type, self.services['校园网'])
+        res = self._get(self.portal_url, headers=self.header)
+        if 'success.jsp' in res.url:
+            self.isLogined = True
+            user_index = None
+            try:
+                info = self.get_alldata()
+                if isinstance(info, dict):
+                    user_index = info.get('userIndex')
+            finally:
+                self.alldata = None
+            self.context.update(service=service, user_index=user_index)
+        else:
+            self.context.update(query_string=self._scrape_query_string(res), service=service)
+        return self.context.is_fresh(service)
+
+    def _post_login(self, user, pwd, service, query_string, code):
+        self.data = {
+            'userId': user,
+            'password': pwd,
+            'service': service,
+            'operatorPwd': '',
+            'operatorUserId': '',
+            'validcode': code,
+            'passwordEncrypt': 'False',
+            'queryString': query_string
+        }
+        self.login_breaker.check()
+        with METRICS.timer('campus_portal_request_seconds', op='login_post') as t:
+            res = self._post(self.url + 'login', headers=self.header, data=self.data)
+            login_json = self._json_from_response(res)
+            if login_json.get('result') != 'success':
+                t.result = 'fail'
+        self.userindex = login_json.get('userIndex')
+        self.info = login_json.get('message', '')
+        ok = login_json.get('result') == 'success'
+        if ok or not self.CONFLICT_PATTERN.search(self.info or ''):
+            self.login_breaker.record(ok, self.info)  # “已在线”冲突会自行下线重提，不计入熔断
+        return ok
+
+    def rejected_by_portal(self, message):
+        """登录被拒的原因与缓存的上下文无关（不是参数失效，也不是已在线冲突）"""
+        return bool(message) and not (self.STALE_CONTEXT_PATTERN.search(message)
+                                      or self.CONFLICT_PATTERN.search(message))
+
+    def _post_login_resolving(self, user, pwd, service, query_string, code):
+        """提交登录；门户提示已有在线会话时按返回的 userIndex 下线后重提一次"""
+        if self._post_login(user, pwd, service, query_string, code):
+            return True
+        if not self.CONFLICT_PATTERN.search(self.info or ''):
+            return False
+        if not self._logout_user_index(self.userindex or self._online_user_index()):
+            return False
+        return self._post_login(user, pwd, service, query_string, code)
+
+    def login(self, user, pwd, type, code='', portal_res=None):
+        """
+        返回 (是否成功, 提示)；last_login_path / last_login_round_trips 记录本次走的路径与请求数。
+        portal_res：调用方刚取得的 portal_state() 响应，按门户状态登录时直接复用，省一次 GET。
+        """
+        start = self.round_trips
+        try:
+            return self._login(user, pwd, type, code, portal_res)
+        finally:
+            self.last_login_round_trips = self.round_trips - start
+
+    def _login(self, user, pwd, type, code, portal_res=None):
+        service = self.services.get(type, self.services['校园网'])
+
+        # 0) 上下文缓存有效：直接一次 POST。请求异常或提示参数失效时作废缓存走完整流程；
+        #    其他拒绝（密码错误、欠费等）换条路径再提交也一样，直接返回门户的提示
+        if user != '' and pwd != '' and self.context.is_fresh(service):
+            self.last_login_path = 'cached'
+            try:
+                if self._post_login_resolving(user, pwd, service, self.context.query_string, code):
+                    self.isLogined = True
+                    self.context.update(user_index=self.userindex)
+                    return (True, '认证成功')
+                if self.rejected_by_portal(self.info):
+                    self.isLogined = False
+                    return (False, self.info)
+            except PortalUnavailable:
+                raise
+            except Exception:
+                pass
+            self.context.invalidate()
+        if self.smart_login:
+            return self._login_smart(user, pwd, service, code, portal_res)
+        self.last_login_path = 'full'
+
+        # 1) 无论是否在线，先“尝试下线”一次
+        self._try_logout_once()
+
+        # 2) 刷新状态
+        if self.isLogined is None:
+            try:
+                self.tst_net()
+            except Exception:
+                self.isLogined = False
+
+        # 3) 执行登录流程
+        if user == '' or pwd == '':
+            return (False, '用户名或密码为空')
+
+        # 3.1 先拿 queryString
+        query_string = self._scrape_query_string()
+
+        # 3.2 提交
+        if self._post_login(user, pwd, service, query_string, code):
+            self.isLogined = True
+            self.context.update(query_string=query_string, service=service, user_index=self.userindex)
+            return (True, '认证成功')
+        else:
+            self.isLogined = False
+            return (False, self.info)
+
+    def _login_smart(self, user, pwd, service, code, portal_res=None):
+        """
+        少往返的登录：一次 GET 10.11.0.1 同时得到认证状态与 queryString。
+        未认证（常见的掉线）：直接 POST，共 2 次请求；
+        门户仍认为在线（会话已失效但未清）：按 success.jsp 里的 userIndex 下线，再抓取、POST；
+        POST 提示已有在线会话：下线后重提一次。
+        """
+        self.last_login_path = 'smart'
+        if user == '' or pwd == '':
+            return (False, '用户名或密码为空')
+        if portal_res is not None:
+            res = portal_res
+            self.isLogined = ('success.jsp' in res.url)
+        else:
+            res = self.portal_state()
+        if self.isLogined:
+            self._logout_user_index(self._user_index_from(res) or self._online_user_index())
+            res = self.portal_state()
+        query_string = self._scrape_query_string(res)
+        if not query_string and self.context.query_string:
+            query_string = self.context.query_string  # 仍在线抓不到时沿用上一次的值（同一终端不会变化）
+        if self._post_login_resolving(user, pwd, service, query_string, code):
+            self.isLogined = True
+            self.context.update(query_string=query_string, service=service, user_index=self.userindex)
+            return (True, '认证成功')
+        self.isLogined = False
+        return (False, self.info)
+
+    def get_alldata(self):
+        with METRICS.timer('campus_portal_request_seconds', op='online_info'):
+            res = self._get(self.portal_url + '/eportal/InterFace.do?method=getOnlineUserInfo')
+            self.alldata = self._json_from_response(res)
+        self.session_info = SessionInfo.parse(self.alldata)
+        return self.alldata
+
+    def logout(self):
+        if self.alldata is None:
+            self.get_alldata()
+        user_index = None
+        if isinstance(self.alldata, dict):
+            user_index = self.alldata.get('userIndex')
+        if not user_index:
+            user_index = ''
+        with METRICS.timer('campus_portal_request_seconds', op='logout') as t:
+            res = self._post(self.url + 'logout', headers=self.header,
+                             data={'userIndex': user_index})
+            logout_json = self._json_from_response(res)
+            if logout_json.get('result') != 'success':
+                t.result = 'fail'
+        self.info = logout_json.get('message', '')
+        if logout_json.get('result') == 'success':
+            self.isLogined = False
+            self.context.user_index = None
+            return (True, '下线成功')
+        else:
+            return (False, self.info)
+
+# -----------------------------
+# 并发探测的取消句柄：首个目标成功后结束其余探测（ping 子进程或 socket）
+# -----------------------------
+class _ProbeCancel():
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._handles = []
+        self.cancelled = False
+
+    def add(self, handle):
+        """登记子进程或 socket；若已取消则立即结束它并返回 False"""
+        with self._lock:
+            if not self.cancelled:
+                self._handles.append(handle)
+                return True
+        self._kill(handle)
+        return False
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            handles, self._handles = self._handles, []
+        for h in handles:
+            self._kill(h)
+
+    def _kill(self, handle):
+        try:
+            if isinstance(handle, socket.socket):
+                try:
+                    handle.shutdown(socket.SHUT_RDWR)  # 唤醒阻塞在 recv/connect 上的线程
+                except OSError:
+                    pass
+                handle.close()
+            elif handle.poll() is None:
+                handle.kill()
+        except Exception:
+            pass
+
+# -----------------------------
+# 探测目标的 DNS 缓存：网络正常时后台解析，掉线后探测直接用缓存的 IP（过期也照用），不再先等一次解析
+# -----------------------------
+class DnsCache():
+    """
+    getaddrinfo 拿不到记录的 TTL，统一按 ttl_sec 视为过期；过期后 max_stale_sec 内仍返回旧地址，
+    由调用方在网络正常时调用 refresh_async() 重新解析（stale-while-revalidate）。
+    掉线时的解析结果可能被认证网关劫持，因此探测中临时解析到的地址不写入缓存。
+    """
+
+    def __init__(self, ttl_sec=300.0, max_stale_sec=86400.0):
+        self.ttl_sec = float(ttl_sec)
+        self.max_stale_sec = float(max_stale_sec)
+        self._lock = threading.Lock()
+        self._entries = {}  # host -> (family, ip, resolved_at)
+        self._refreshing = False
+
+    @staticmethod
+    def is_literal(host):
+        try:
+            ipaddress.ip_address(host)
+            return True
+        except ValueError:
+            return False
+
+    def lookup(self, host):
+        """返回 (family, ip)；未缓存或旧得不能再用时返回 None"""
+        if not host or self.is_literal(host):
+            return None
+        with self._lock:
+            entry = self._entries.get(host)
+        if entry is None:
+            METRICS.inc('campus_dns_cache_total', result='miss')
+            return None
+        family, ip, resolved_at = entry
+        age = time.monotonic() - resolved_at
+        if age > self.ttl_sec + self.max_stale_sec:
+            METRICS.inc('campus_dns_cache_total', result='miss')
+            return None
+        METRICS.inc('campus_dns_cache_total', result='hit' if age <= self.ttl_sec else 'stale')
+        return family, ip
+
+    def resolve(self, host):
+        """同步解析并写入缓存；失败时保留旧记录"""
+        with METRICS.timer('campus_dns_resolve_seconds') as t:
+            try:
+                family, _, _, _, addr = socket.getaddrinfo(host, None, 0, socket.SOCK_STREAM)[0]
+            except OSError:
+                t.result = 'fail'
+                return None
+        with self._lock:
+            self._entries[host] = (family, addr[0], time.monotonic())
+        return family, addr[0]
+
+    def due(self, hosts):
+        """需要（重新）解析的域名：未缓存或已过期"""
+        now = time.monotonic()
+        with self._lock:
+            return [h for h in dict.fromkeys(hosts)
+                    if h and not self.is_literal(h)
+                    and (h not in self._entries or now - self._entries[h][2] > self.ttl_sec)]
+
+    def refresh_async(self, hosts):
+        """在后台线程解析到期的域名；已有刷新在进行时忽略"""
+        hosts = self.due(hosts)
+        if not hosts:
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                for h in hosts:
+                    self.resolve(h)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, name="dns-refresh", daemon=True).start()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            return {h: {'ip': ip, 'age_sec': now - at} for h, (_, ip, at) in self._entries.items()}
+
+class _DeadlineResolver():
+    """
+    getaddrinfo 本身不能设超时：放到后台线程里解析，调用方只等到自己的截止时间。
+    同一 (host, port, socktype) 的并发解析合并为一次，解析卡住时每个域名最多只占一个线程。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> [完成事件, 结果, 异常]
+
+    def getaddrinfo(self, host, port, socktype, timeout):
+        key = (host, port, socktype)
+        with self._lock:
+            slot = self._pending.get(key)
+            if slot is None:
+                slot = self._pending[key] = [threading.Event(), None, None]
+                threading.Thread(target=self._run, args=(key, slot), name="dns-probe", daemon=True).start()
+        if not slot[0].wait(timeout):
+            raise socket.timeout('dns deadline')
+        if slot[2] is not None:
+            raise slot[2]
+        return slot[1]
+
+    def _run(self, key, slot):
+        host, port, socktype = key
+        try:
+            slot[1] = socket.getaddrinfo(host, port, 0, socktype)[0]
+        except OSError as e:
+            slot[2] = e
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+            slot[0].set()
+
+_RESOLVER = _DeadlineResolver()
+
+# -----------------------------
+# 进程内探测引擎：ICMP（非特权 datagram socket）/ TCP 连接 / HTTP generate_204
+# -----------------------------
+class ProbeEngine():
+    """
+    检测目标写法：
+      www.baidu.com / icmp://223.5.5.5   ICMP echo（无权限时自动回退到系统 ping）
+      tcp://223.5.5.5:53                 TCP 建连即成功
+      http://connect.rom.miui.com/generate_204   返回 204 即成功（也支持 https://）
+      ping://www.baidu.com               强制使用系统 ping 命令
+    probe() 返回 (是否成功, 往返耗时毫秒)，超时严格按毫秒截止。
+    source_address / interface：多出口网关上按账号绑定源地址或网卡（网卡绑定需 Linux 且有 CAP_NET_RAW）。
+    dns：DnsCache；命中时直接探测缓存的 IP（HTTP 的 Host 头与 TLS SNI 仍用原域名）。
+    """
+
+    def __init__(self, use_socket=True, source_address=None, interface=None, dns=None):
+        self.use_socket = use_socket
+        self.source_address = source_address or None
+        self.interface = interface or None
+        self.dns = dns
+        self._icmp_supported = None  # None=未知；False=本机不允许非特权 ICMP socket
+        self._seq = itertools.count(int.from_bytes(os.urandom(2), 'big'))  # next() 在并发探测间不会重号
+
+    def parse_target(self, target):
+        """解析目标为 (kind, host, port, path)"""
+        target = (target or '').strip()
+        m = re.match(r'^(icmp|tcp|http|https|ping)://(.*)$', target, re.I)
+        if not m:
+            return ('icmp' if self.use_socket else 'ping'), target, None, None
+        kind, rest = m.group(1).lower(), m.group(2)
+        if kind in ('icmp', 'ping'):
+            return kind, rest.strip('/'), None, None
+        hostport, _, path = rest.partition('/')
+        host, port = self._split_port(hostport)
+        if kind == 'tcp':
+            return kind, host, port or 80, None
+        return kind, host, port or (443 if kind == 'https' else 80), '/' + path
+
+    def _split_port(self, hostport):
+        if hostport.startswith('['):  # [IPv6]:port
+            host, _, rest = hostport[1:].partition(']')
+            return host, int(rest[1:]) if rest.startswith(':') else None
+        if hostport.count(':') == 1:
+            host, port = hostport.split(':')
+            return host, int(port)
+        return hostport, None
+
+    def probe(self, target, timeout_ms, cancel=None):
+        deadline = time.monotonic() + max(1, int(timeout_ms)) / 1000.0
+        try:
+            kind, host, port, path = self.parse_target(target)
+            if not host:
+                return False, None
+            if kind == 'icmp' and self._icmp_supported is not False:
+                try:
+                    return self._probe_icmp(host, deadline, cancel)
+                except _IcmpUnsupported:
+                    self._icmp_supported = False
+                kind = 'ping'
+            if kind == 'tcp':
+                return self._probe_tcp(host, port, deadline, cancel)
+            if kind in ('http', 'https'):
+                return self._probe_http(kind, host, port, path, deadline, cancel)
+            cached = self.dns.lookup(host) if self.dns is not None else None
+            return self._probe_ping_cmd(cached[1] if cached else host, timeout_ms, cancel)
+        except Exception:
+            return False, None
+
+    # —— 工具 —— #
+    def _remaining(self, deadline):
+        left = deadline - time.monotonic()
+        if left <= 0:
+            raise socket.timeout('deadline')
+        return left
+
+    def _resolve(self, host, port, socktype, deadline):
+        cached = self.dns.lookup(host) if self.dns is not None else None
+        if cached is not None:
+            family, ip = cached
+            return socket.getaddrinfo(ip, port, family, socktype, 0, socket.AI_NUMERICHOST)[0]
+        if DnsCache.is_literal(host):
+            return socket.getaddrinfo(host, port, 0, socktype, 0, socket.AI_NUMERICHOST)[0]
+        # 未缓存的域名：解析也算在探测的截止时间内
+        return _RESOLVER.getaddrinfo(host, port, socktype, self._remaining(deadline))
+
+    def _bind(self, sock, family):
+        if self.interface and hasattr(socket, 'SO_BINDTODEVICE'):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, self.interface.encode())
+        if self.source_address and family == socket.AF_INET:
+            sock.bind((self.source_address, 0))
+        elif self.source_address and family == socket.AF_INET6 and ':' in self.source_address:
+            sock.bind((self.source_address, 0, 0, 0))
+
+    def _register(self, sock, cancel):
+        if cancel is not None and not cancel.add(sock):
+            raise socket.timeout('cancelled')
+
+    def _checksum(self, data):
+        if len(data) % 2:
+            data += b'\x00'
+        total = sum(int.from_bytes(data[i:i + 2], 'big') for i in range(0, len(data), 2))
+        total = (total >> 16) + (total & 0xFFFF)
+        total += total >> 16
+        return ~total & 0xFFFF
+
+    # —— ICMP —— #
+    def _probe_icmp(self, host, deadline, cancel):
+        family, _, _, _, addr = self._resolve(host, None, socket.SOCK_DGRAM, deadline)
+        if family == socket.AF_INET6:
+            proto, req_type, reply_type = socket.IPPROTO_ICMPV6, 128, 129
+        else:
+            proto, req_type, reply_type = socket.IPPROTO_ICMP, 8, 0
+        try:
+            sock = socket.socket(family, socket.SOCK_DGRAM, proto)
+        except OSError as e:
+            # Linux 受 net.ipv4.ping_group_range 限制；Windows 不支持此类 socket
+            raise _IcmpUnsupported(e)
+        self._icmp_supported = True
+        with sock:
+            self._bind(sock, family)
+            self._register(sock, cancel)
+            seq = next(self._seq) & 0xFFFF
+            payload = b'campus-network-probe'
+            header = bytes([req_type, 0, 0, 0, 0, 0]) + seq.to_bytes(2, 'big')
+            if family == socket.AF_INET:  # ICMPv6 校验和由内核计算
+                csum = self._checksum(header + payload)
+                header = header[:2] + csum.to_bytes(2, 'big') + header[4:]
+            sock.connect(addr)
+            t0 = time.monotonic()
+            sock.send(header + payload)
+            while True:
+                sock.settimeout(self._remaining(deadline))
+                data = sock.recv(2048)
+                if not data:
+                    return False, None
+                # macOS 会带上 IP 头，Linux 不带
+                if family == socket.AF_INET and len(data) >= 20 and data[0] >> 4 == 4:
+                    data = data[(data[0] & 0x0F) * 4:]
+                if len(data) >= 8 and data[0] == reply_type and int.from_bytes(data[6:8], 'big') == seq:
+                    return True, (time.monotonic() - t0) * 1000.0
+
+    # —— TCP —— #
+    def _connect(self, host, port, deadline, cancel):
+        family, socktype, proto, _, addr = self._resolve(host, port, socket.SOCK_STREAM, deadline)
+        sock = socket.socket(family, socktype, proto)
+        try:
+            self._bind(sock, family)
+            self._register(sock, cancel)
+            sock.settimeout(self._remaining(deadline))
+            t0 = time.monotonic()
+            sock.connect(addr)
+            return sock, t0
+        except Exception:
+            sock.close()
+            raise
+
+    def _probe_tcp(self, host, port, deadline, cancel):
+        sock, t0 = self._connect(host, port, deadline, cancel)
+        with sock:
+            return True, (time.monotonic() - t0) * 1000.0
+
+    # —— HTTP(S) generate_204 —— #
+    def _probe_http(self, scheme, host, port, path, deadline, cancel):
+        sock, t0 = self._connect(host, port, deadline, cancel)
+        try:
+            if scheme == 'https':
+                import ssl
+                sock.settimeout(self._remaining(deadline))
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+            req = (f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+                   "User-Agent: campus-network-probe\r\nConnection: close\r\n\r\n")
+            sock.settimeout(self._remaining(deadline))
+            sock.sendall(req.encode('ascii'))
+            buf = b''
+            while b'\r\n' not in buf:
+                sock.settimeout(self._remaining(deadline))
+                chunk = sock.recv(512)
+                if not chunk:
+                    break
+                buf += chunk
+            # 被认证网关劫持时会返回 200/302 等，只有 204 代表真正出网
+            m = re.match(rb'HTTP/\d(?:\.\d)? (\d{3})', buf)
+            ok = bool(m) and m.group(1) == b'204'
+            return ok, ((time.monotonic() - t0) * 1000.0 if ok else None)
+        finally:
+            sock.close()
+
+    # —— 系统 ping 命令（回退） —— #
+    def _probe_ping_cmd(self, host, timeout_ms, cancel):
+        """静默 ping：Windows 下不弹出终端窗口；cancel 触发时直接结束子进程"""
+        system = platform.system().lower()
+        kwargs = {}
+        bind = []
+        wait_sec = int(timeout_ms) / 1000.0 + 1  # ping 自己按毫秒超时，这里只兜底
+        if 'windows' in system:
+            if self.source_address:
+                bind = ['-S', self.source_address]
+            cmd = ['ping', '-n', '1', '-w', str(int(timeout_ms))] + bind + [host]
+            CREATE_NO_WINDOW = 0x08000000
+            si = subprocess.STARTUPINFO()
+            si.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+            kwargs = {'creationflags': CREATE_NO_WINDOW, 'startupinfo': si}
+        elif 'darwin' in system:
+            if self.source_address:
+                bind = ['-S', self.source_address]
+            cmd = ['ping', '-c', '1', '-W', str(int(timeout_ms))] + bind + [host]
+        else:
+            # Linux 的 -W 只接受整秒（busybox 与旧版 iputils 不认小数），向上取整；毫秒级时限由 wait 保证
+            # -I 可接网卡名或源地址
+            if self.interface or self.source_address:
+                bind = ['-I', self.interface or self.source_address]
+            cmd = ['ping', '-c', '1', '-W', str(max(1, math.ceil(int(timeout_ms) / 1000)))] + bind + [host]
+            wait_sec = int(timeout_ms) / 1000.0
+        t0 = time.monotonic()
+        try:
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                **kwargs
+            )
+        except Exception:
+            return False, None
+        if cancel is not None and not cancel.add(proc):
+            return False, None
+        try:
+            ok = proc.wait(timeout=wait_sec) == 0
+        except Exception:
+            proc.kill()
+            proc.wait()
+            return False, None
+        return ok, ((time.monotonic() - t0) * 1000.0 if ok else None)
+
+class _IcmpUnsupported(Exception):
+    pass
+
+# -----------------------------
+# Linux rtnetlink 事件源：网卡通断 / 地址变化 / 默认路由变化时立即触发检测
+# -----------------------------
+class NetlinkMonitor():
+    RTMGRP_LINK = 0x1
+    RTMGRP_IPV4_IFADDR = 0x10
+    RTMGRP_IPV4_ROUTE = 0x40
+    RTMGRP_IPV6_IFADDR = 0x100
+    RTMGRP_IPV6_ROUTE = 0x400
+
+    RTM_NEWLINK, RTM_DELLINK = 16, 17
+    RTM_NEWADDR, RTM_DELADDR = 20, 21
+    RTM_NEWROUTE, RTM_DELROUTE = 24, 25
+    NLMSG_ERROR, NLMSG_OVERRUN = 2, 4
+
+    IFF_UP = 0x1
+    IFF_LOOPBACK = 0x8
+    IFF_RUNNING = 0x40
+    IFF_LOWER_UP = 0x10000
+    IFF_DORMANT = 0x20000
+    # 只关心这些标志位的变化：载波、管理状态、Wi-Fi 关联（dormant）
+    LINK_MASK = IFF_UP | IFF_RUNNING | IFF_LOWER_UP | IFF_DORMANT
+
+    RT_TABLE_MAIN = 254
+    RT_SCOPE_LINK = 253
+    IFA_ADDRESS, IFA_LOCAL = 1, 2
+
+    def __init__(self):
+        self.sock = None
+        self._link_flags = {}
+        self._addrs = set()  # 已见过的 (网卡序号, 地址)：区分新地址与同一地址的续租
+
+    @staticmethod
+    def available():
+        return hasattr(socket, 'AF_NETLINK') and platform.system().lower() == 'linux'
+
+    def open(self):
+        """打开并订阅 rtnetlink 组播，返回 fd（供 QSocketNotifier 使用）"""
+        groups = (self.RTMGRP_LINK | self.RTMGRP_IPV4_IFADDR | self.RTMGRP_IPV6_IFADDR
+                  | self.RTMGRP_IPV4_ROUTE | self.RTMGRP_IPV6_ROUTE)
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        try:
+            sock.bind((0, groups))
+            sock.setblocking(False)
+        except Exception:
+            sock.close()
+            raise
+        self.sock = sock
+        self._link_flags = {}
+        self._addrs = set()
+        return sock.fileno()
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except Exception:
+                pass
+            self.sock = None
+
+    def read_events(self):
+        """
+        读空 socket 中积压的消息，返回需要触发检测的事件列表，每项为 (kind, action, 网卡序号, 地址, 描述)：
+          'link'  action 为 'up' / 'down' / 'del'，缓冲溢出时为 'overrun'（序号为 None）
+          'addr'  action 为 'new'（新地址）/ 'renew'（同一地址续租）/ 'del'，地址为字符串
+          'route' action 为 'new' / 'del'（默认路由），序号与地址为 None
+        描述只用于日志，判断一律看 kind / action。
+        """
+        events = []
+        while self.sock is not None:
+            try:
+                data = self.sock.recv(65536)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                # ENOBUFS：内核丢了消息，无法得知细节，按一次链路变化处理
+                events.append(('link', 'overrun', None, None, f'事件缓冲溢出（{e.strerror or e}）'))
+                break
+            if not data:
+                break
+            events.extend(self._parse(data))
+        return events
+
+    def _ifname(self, index):
+        try:
+            return socket.if_indextoname(index)
+        except OSError:
+            return f'#{index}'
+
+    def _parse(self, data):
+        events = []
+        off = 0
+        while off + 16 <= len(data):
+            length, msg_type = struct.unpack_from('=IH', data, off)
+            if length < 16:
+                break
+            body = data[off + 16:off + length]
+            off += (length + 3) & ~3
+            ev = None
+            if msg_type in (self.RTM_NEWLINK, self.RTM_DELLINK) and len(body) >= 16:
+                ev = self._parse_link(msg_type, body)
+            elif msg_type in (self.RTM_NEWADDR, self.RTM_DELADDR) and len(body) >= 8:
+                ev = self._parse_addr(msg_type, body)
+            elif msg_type in (self.RTM_NEWROUTE, self.RTM_DELROUTE) and len(body) >= 12:
+                ev = self._parse_route(msg_type, body)
+            elif msg_type == self.NLMSG_OVERRUN:
+                ev = ('link', 'overrun', None, None, '事件缓冲溢出')
+            if ev is not None:
+                events.append(ev)
+        return events
+
+    def _parse_link(self, msg_type, body):
+        _, _, index, flags, _ = struct.unpack_from('=BxHiII', body, 0)
+        if flags & self.IFF_LOOPBACK:
+            return None
+        name = self._ifname(index)
+        if msg_type == self.RTM_DELLINK:
+            self._link_flags.pop(index, None)
+            self._addrs = {a for a in self._addrs if a[0] != index}
+            return ('link', 'del', index, None, f'网卡 {name} 已移除')
+        old = self._link_flags.get(index)
+        self._link_flags[index] = flags & self.LINK_MASK
+        if old == flags & self.LINK_MASK:
+            return None  # 统计信息等无关更新
+        action = 'down'
+        if not flags & self.IFF_UP:
+            state = '已停用'
+        elif flags & self.IFF_LOWER_UP and not flags & self.IFF_DORMANT:
+            state, action = '已连接', 'up'
+        else:
+            state = '无载波'
+        return ('link', action, index, None, f'网卡 {name} {state}')
+
+    def _parse_addr(self, msg_type, body):
+        family, _, _, scope, index = struct.unpack_from('=BBBBI', body, 0)
+        if scope >= self.RT_SCOPE_LINK:  # 链路本地 / 回环地址不影响出网
+            return None
+        ver = 'IPv6' if family == socket.AF_INET6 else 'IPv4'
+        addr = self._addr_attr(family, body)
+        key = (index, addr)
+        if msg_type == self.RTM_DELADDR:
+            self._addrs.discard(key)
+            action, text = 'del', '移除'
+        elif key in self._addrs:
+            action, text = 'renew', '续租'
+        else:
+            self._addrs.add(key)
+            action, text = 'new', '新增'
+        return ('addr', action, index, addr, f'网卡 {self._ifname(index)} {ver} 地址 {addr or "?"} {text}')
+
+    def _addr_attr(self, family, body):
+        """从 ifaddrmsg 之后的属性里取地址：优先 IFA_LOCAL（点对点链路上 IFA_ADDRESS 是对端地址）"""
+        found = {}
+        off = 8
+        while off + 4 <= len(body):
+            rta_len, rta_type = struct.unpack_from('=HH', body, off)
+            if rta_len < 4:
+                break
+            if rta_type in (self.IFA_ADDRESS, self.IFA_LOCAL):
+                try:
+                    found[rta_type] = socket.inet_ntop(family, body[off + 4:off + rta_len])
+                except (OSError, ValueError):
+                    pass
+            off += (rta_len + 3) & ~3
+        return found.get(self.IFA_LOCAL) or found.get(self.IFA_ADDRESS)
+
+    def _parse_route(self, msg_type, body):
+        family, dst_len, _, _, table = struct.unpack_from('=BBBBB', body, 0)
+        if dst_len != 0 or table != self.RT_TABLE_MAIN:
+            return None  # 只关心主路由表的默认路由
+        ver = 'IPv6' if family == socket.AF_INET6 else 'IPv4'
+        if msg_type == self.RTM_NEWROUTE:
+            return ('route', 'new', None, None, f'{ver} 默认路由更新')
+        return ('route', 'del', None, None, f'{ver} 默认路由删除')
+
+# -----------------------------
+# 掉线原因判断：门户是否认为已认证（success.jsp 跳转）+ 网关是否可达，只有“未认证”才值得重新认证
+# -----------------------------
+class OutageClassifier():
+    KIND_NAMES = {
+        'unauth': '未认证',
+        'upstream': '门户显示已认证，上游中断',
+        'portal_down': '门户不可达',
+        'link_down': '网关不可达（本地网络中断）',
+        'throttled': '门户请求受限（熔断 / 限速）',
+    }
+
+    def __init__(self, main, probe):
+        self.main = main
+        self.probe = probe
+        self.gateway = ''  # 为空时 Linux 下读取默认网关
+
+    @staticmethod
+    def default_gateway():
+        """Linux：从 /proc/net/route 读取 IPv4 默认网关；其他平台返回 None"""
+        try:
+            with open('/proc/net/route') as f:
+                next(f)
+                for line in f:
+                    fields = line.split()
+                    if len(fields) >= 3 and fields[1] == '00000000' and int(fields[3], 16) & 0x2:
+                        return socket.inet_ntoa(struct.pack('<L', int(fields[2], 16)))
+        except (OSError, ValueError, StopIteration):
+            pass
+        return None
+
+    def classify(self, timeout_ms):
+        """
+        外网探测失败后调用，返回 (kind, 门户响应或 None)：
+          'unauth'      门户返回认证页（响应中带 queryString，可直接交给 Main.login 复用）
+          'upstream'    门户跳转 success.jsp，会话仍在，问题在上游
+          'portal_down' 门户请求异常或返回 5xx，网关可达
+          'link_down'   门户与网关都不可达
+          'throttled'   门户闸门拒绝发出请求（熔断中或限速），状态未知
+        """
+        try:
+            res = self.main.portal_state()
+            if res.status_code < 500:
+                return ('upstream' if self.main.isLogined else 'unauth'), res
+        except PortalUnavailable:
+            return 'throttled', None
+        except Exception:
+            pass
+        gateway = self.gateway or self.default_gateway()
+        if gateway:
+            ok, _ = self.probe.probe(gateway, timeout_ms)
+            if not ok:
+                return 'link_down', None
+        return 'portal_down', None
+
+# -----------------------------
+# 自适应检测调度：稳定期放慢、异常后快速复查、门户不可达或认证屡次失败时指数退避 + 抖动
+# -----------------------------
+class ProbeScheduler():
+    STATE_NAMES = {
+        'normal': '正常',
+        'steady': '稳定',
+        'recheck': '快速复查',
+        'backoff': '门户不可达退避',
+        'upstream': '上游中断退避',
+        'retry': '认证失败退避',
+        'rejected': '认证被拒退避',
+    }
+    BACKOFF_STATES = ('backoff', 'upstream', 'retry', 'rejected')
+
+    def __init__(self):
+        self.base_sec = 30.0
+        self.steady_sec = 120.0
+        self.steady_after_sec = 600.0
+        self.fast_sec = 2.0
+        self.fast_count = 3
+        self.backoff_max_sec = 300.0
+        self.jitter = 0.2
+        self.reset()
+
+    def configure(self, cfg):
+        def num(key, default, low):
+            try:
+                return max(low, float(cfg.get(key, default)))
+            except Exception:
+                return default
+        self.base_sec = num("check_interval_sec", 30.0, 1.0)
+        self.steady_sec = max(self.base_sec, num("steady_interval_sec", 120.0, 1.0))
+        self.steady_after_sec = num("steady_after_sec", 600.0, 0.0)
+        self.fast_sec = min(self.base_sec, num("fast_recheck_sec", 2.0, 0.5))
+        self.fast_count = int(num("fast_recheck_count", 3, 0))
+        self.backoff_max_sec = num("portal_backoff_max_sec", 300.0, 1.0)
+        self.jitter = min(1.0, num("schedule_jitter", 0.2, 0.0))
+
+    def reset(self):
+        self.state = 'normal'
+        self.up_since = None          # 连续可达的起点（monotonic）
+        self.recheck_left = 0         # 剩余快速复查次数
+        self.backoff_level = 0        # 门户连续不可达 / 认证连续失败的退避级数
+        self.fail_streak = 0          # 连续认证失败的轮数
+        self.next_delay_sec = None
+        self.next_fire_at = None      # 下次检测的时间戳（time.time()）
+
+    def on_result(self, outcome):
+        """
+        记录一轮检测结果：
+          'ok'          外网可达
+          'fail'        外网不通（门户可达，认证已尝试但没成功）：先快速复查 fast_count 次，仍失败则指数退避
+          'rejected'    门户明确拒绝认证（密码错误、欠费等）：重试也不会成功，直接退避
+          'portal_down' 门户本身不可达（请求异常）
+          'upstream'    门户显示已认证但外网不通（上游中断，不重新认证）
+        """
+        now = time.monotonic()
+        if outcome == 'ok':
+            self.backoff_level = 0
+            if self.fail_streak:
+                self.fail_streak = 0
+                self.recheck_left = self.fast_count  # 从认证失败中恢复：照样快速确认几次
+            if self.up_since is None:
+                self.up_since = now
+            if self.recheck_left > 0:
+                # 刚恢复（或时通时断）：连续确认几次再放慢
+                self.recheck_left -= 1
+                self.state = 'recheck'
+            elif now - self.up_since >= self.steady_after_sec:
+                self.state = 'steady'
+            else:
+                self.state = 'normal'
+        elif outcome in ('portal_down', 'upstream'):
+            self.up_since = None
+            self.recheck_left = self.fast_count
+            self.backoff_level += 1
+            self.state = 'backoff' if outcome == 'portal_down' else 'upstream'
+        else:
+            # 每一轮认证失败都会打门户：快速复查次数用完（或门户明确拒绝）后改为指数退避
+            self.up_since = None
+            self.fail_streak += 1
+            if outcome == 'rejected':
+                self.backoff_level += 1
+                self.recheck_left = 0
+                self.state = 'rejected'
+            elif self.fail_streak > self.fast_count:
+                self.backoff_level = self.fail_streak - self.fast_count
+                self.recheck_left = 0
+                self.state = 'retry'
+            else:
+                self.backoff_level = 0
+                self.recheck_left = self.fast_count - self.fail_streak
+                self.state = 'recheck'
+
+    def next_delay(self):
+        """计算下一次检测的延迟（秒），并记录下次触发时间"""
+        if self.state in self.BACKOFF_STATES:
+            # 上游中断时探测本身不打门户（只有一次判断用的 GET），退避上限取正常间隔，恢复后尽快发现；
+            # 认证被拒从正常间隔起退避，其余从快速复查间隔起
+            cap = self.base_sec if self.state == 'upstream' else self.backoff_max_sec
+            start = self.base_sec if self.state == 'rejected' else self.fast_sec
+            delay = min(cap, start * (2 ** max(0, self.backoff_level - 1)))
+        elif self.state == 'recheck':
+            delay = self.fast_sec
+        elif self.state == 'steady':
+            delay = self.steady_sec
+        else:
+            delay = self.base_sec
+        if self.jitter > 0 and self.state in self.BACKOFF_STATES + ('steady',):
+            # 抖动只用于退避与稳定期，避免多台机器同时打到门户
+            delay *= 1.0 + random.uniform(-self.jitter, self.jitter)
+        delay = max(0.5, delay)
+        self.next_delay_sec = delay
+        self.next_fire_at = time.time() + delay
+        return delay
+
+    def reschedule(self):
+        """配置变化后按新间隔重算下次检测：已经等过的时间照算，返回剩余延迟（秒）"""
+        if self.next_fire_at is None:
+            return None
+        waited = self.next_delay_sec - max(0.0, self.next_fire_at - time.time())
+        delay = self.next_delay()
+        left = max(0.0, delay - waited)
+        self.next_fire_at = time.time() + left
+        return left
+
+    def snapshot(self):
+        return {
+            'state': self.state,
+            'state_name': self.STATE_NAMES.get(self.state, self.state),
+            'uptime_sec': (time.monotonic() - self.up_since) if self.up_since is not None else None,
+            'recheck_left': self.recheck_left,
+            'backoff_level': self.backoff_level,
+            'next_delay_sec': self.next_delay_sec,
+            'next_fire_at': self.next_fire_at,
+        }
+
+# -----------------------------
+# 事件日志（磁盘）：追加写、按大小轮转并 gzip 压缩；后台线程写入，不阻塞监控
+# -----------------------------
+def journal_dir():
+    path = os.path.join(appdata_dir(), "journal")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+class EventJournal():
+    """
+    每条事件是一行 JSON：{"ts": 时间戳, "kind": probe/login/logout/error, ...}。
+    当前段写入 journal-current.jsonl；超过 segment_bytes 后压缩为
+    journal-<首条毫秒>-<末条毫秒>.jsonl.gz，文件名即时间范围，读取时可整段跳过。
+    """
+    CURRENT = "journal-current.jsonl"
+    _STOP = object()
+
+    def __init__(self, path=None, segment_bytes=1024 * 1024, max_segments=200, queue_size=10000, on_error=None):
+        """on_error(消息)：写入或轮转出错时在写线程中调用，连续出错只报告一次"""
+        self.path = path or journal_dir()
+        self.segment_bytes = max(4096, int(segment_bytes))
+        self.max_segments = max(1, int(max_segments))
+        self.dropped = 0  # 队列满或写入失败时丢弃的事件数
+        self._on_error = on_error
+        self._failing = False
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._thread = None
+        self._fp = None
+        self._first_ts = None
+        self._last_ts = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="event-journal", daemon=True)
+            self._thread.start()
+
+    def write(self, kind, **fields):
+        """非阻塞：只入队；队列满则丢弃并计数"""
+        event = {'ts': round(time.time(), 3), 'kind': kind}
+        event.update(fields)
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=2.0):
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    # —— 后台写线程 —— #
+    def _run(self):
+        # 单次写入 / 轮转失败（磁盘满、目录被删等）只丢掉这一批，下一批重新打开当前段再试
+        try:
+            while True:
+                item = self._queue.get()
+                batch = [item]
+                while len(batch) < 500:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                stop = any(e is self._STOP for e in batch)
+                events = [e for e in batch if e is not self._STOP]
+                if events:
+                    try:
+                        if self._fp is None:
+                            self._open_current()
+                        self._append(events)
+                        self._failing = False
+                    except Exception as e:
+                        self.dropped += len(events)
+                        self._close_current()
+                        self._report(e)
+                if stop:
+                    break
+        finally:
+            self._close_current()
+
+    def _close_current(self):
+        if self._fp is not None:
+            try:
+                self._fp.close()
+            except OSError:
+                pass
+            self._fp = None
+
+    def _report(self, error):
+        if self._failing:
+            return
+        self._failing = True
+        if self._on_error is not None:
+            try:
+                self._on_error(f"事件日志写入失败，本批事件已丢弃：{error}")
+            except Exception:
+                pass
+
+    def _open_current(self):
+        cur = os.path.join(self.path, self.CURRENT)
+        self._first_ts = self._last_ts = None
+        if os.path.exists(cur) and os.path.getsize(cur) > 0:
+            with open(cur, "r", encoding="utf-8") as f:
+                first = f.readline()
+            try:
+                self._first_ts = json.loads(first)['ts']
+            except Exception:
+                self._first_ts = os.path.getmtime(cur)
+            self._last_ts = os.path.getmtime(cur)
+        self._fp = open(cur, "a", encoding="utf-8")
+
+    def _append(self, events):
+        lines = []
+        for e in events:
+            lines.append(json.dumps(e, ensure_ascii=False, separators=(',', ':')))
+            if self._first_ts is None:
+                self._first_ts = e['ts']
+            self._last_ts = e['ts']
+        self._fp.write("\n".join(lines) + "\n")
+        self._fp.flush()
+        if self._fp.tell() >= self.segment_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._fp.close()
+        self._fp = None
+        cur = os.path.join(self.path, self.CURRENT)
+        name = f"journal-{int(self._first_ts * 1000)}-{int(self._last_ts * 1000)}.jsonl.gz"
+        tmp = os.path.join(self.path, name + ".tmp")
+        try:
+            with open(cur, "rb") as src, gzip.open(tmp, "wb", compresslevel=6) as dst:
+                while True:
+                    chunk = src.read(256 * 1024)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+        except OSError:
+            # 压缩失败时当前段原样保留，下一批继续追加并再次尝试轮转
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        os.replace(tmp, os.path.join(self.path, name))
+        os.remove(cur)
+        self._prune()
+        self._open_current()
+
+    def _prune(self):
+        segments = sorted(list_journal_segments(self.path))
+        for _, _, path in segments[:-self.max_segments]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+def list_journal_segments(path=None):
+    """返回已压缩段 [(首条时间戳, 末条时间戳, 路径)]，按时间排序"""
+    path = path or journal_dir()
+    out = []
+    for name in os.listdir(path):
+        m = re.match(r'^journal-(\d+)-(\d+)\.jsonl\.gz$', name)
+        if m:
+            out.append((int(m.group(1)) / 1000.0, int(m.group(2)) / 1000.0, os.path.join(path, name)))
+    out.sort()
+    return out
+
+def read_journal(start=None, end=None, kinds=None, path=None):
+    """
+    按时间范围流式读取事件（生成器），不会把整个历史读入内存：
+    时间范围之外的压缩段按文件名直接跳过，段内逐行解压解析。
+    """
+    path = path or journal_dir()
+    kinds = set(kinds) if kinds else None
+    files = [(f, l, p) for f, l, p in list_journal_segments(path)
+             if (start is None or l >= start) and (end is None or f <= end)]
+    cur = os.path.join(path, EventJournal.CURRENT)
+    if os.path.exists(cur):
+        files.append((None, None, cur))
+    for _, _, p in files:
+        opener = gzip.open if p.endswith(".gz") else open
+        try:
+            with opener(p, "rt", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue  # 进程异常退出时可能留下半行
+                    ts = e.get('ts', 0)
+                    if start is not None and ts < start:
+                        continue
+                    if end is not None and ts > end:
+                        break  # 段内按时间顺序写入
+                    if kinds is None or e.get('kind') in kinds:
+                        yield e
+        except (OSError, EOFError):
+            continue
+
+def dump_journal(argv, prog="app.py journal"):
+    """命令行读取事件日志：app.py journal / campusd.py journal [--since 时间] [--until 时间] [--kind 类型 ...]"""
+    import argparse
+    def parse_time(text):
+        try:
+            return float(text)
+        except ValueError:
+            return datetime.fromisoformat(text).timestamp()
+    parser = argparse.ArgumentParser(prog=prog, description="按时间范围输出事件日志（JSON Lines）")
+    parser.add_argument("--since", type=parse_time, help="起始时间（ISO 格式或 Unix 时间戳）")
+    parser.add_argument("--until", type=parse_time, help="结束时间（ISO 格式或 Unix 时间戳）")
+    parser.add_argument("--kind", action="append", help="只输出指定类型：probe / login / logout / error / monitor")
+    args = parser.parse_args(argv)
+    for e in read_journal(args.since, args.until, args.kind):
+        sys.stdout.write(json.dumps(e, ensure_ascii=False) + "\n")
+
+# -----------------------------
+# 探测历史（内存）：定宽数组环形缓冲 + 分钟 / 小时 / 天三级降采样，内存固定，按时间二分查询
+# -----------------------------
+class _SampleRing():
+    """逐次探测样本：时间戳 / 目标编号 / RTT（毫秒，失败为 NaN）/ 是否成功"""
+    def __init__(self, capacity):
+        self.capacity = max(1, int(capacity))
+        self.ts = array('d', bytes(8 * self.capacity))
+        self.rtt = array('f', bytes(4 * self.capacity))
+        self.ok = array('B', bytes(self.capacity))
+        self.target = array('H', bytes(2 * self.capacity))
+        self._head = -1  # 最新一条的位置
+        self._len = 0
+        self.complete = True  # 从未丢弃过样本：范围早于最旧一条时也不必改查汇总桶
+
+    def __len__(self):
+        return self._len
+
+    def _pos(self, i):
+        """逻辑下标（0 = 最旧）→ 数组下标"""
+        return (self._head - self._len + 1 + i) % self.capacity
+
+    def add(self, ts, target, rtt, ok):
+        if self._len and ts < self.ts[self._head]:
+            ts = self.ts[self._head]  # 系统时间回拨：保持有序，便于二分
+        if self._len == self.capacity:
+            self.complete = False
+        self._head = (self._head + 1) % self.capacity
+        self._len = min(self._len + 1, self.capacity)
+        i = self._head
+        self.ts[i] = ts
+        self.target[i] = target
+        self.rtt[i] = rtt
+        self.ok[i] = 1 if ok else 0
+
+    def oldest(self):
+        return self.ts[self._pos(0)] if self._len else None
+
+    def lower_bound(self, ts):
+        lo, hi = 0, self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.ts[self._pos(mid)] < ts:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def rows(self, start, end):
+        """[start, end) 内的样本：(时间戳, 目标编号, RTT, 是否成功)"""
+        for i in range(self.lower_bound(start), self.lower_bound(end)):
+            p = self._pos(i)
+            yield self.ts[p], self.target[p], self.rtt[p], bool(self.ok[p])
+
+class _BucketRing(_SampleRing):
+    """固定宽度的降采样桶：起始时间 / 样本数 / 成功数 / RTT 和、最小、最大（只统计成功的样本）"""
+    def __init__(self, width_sec, capacity):
+        self.width = float(width_sec)
+        self.capacity = max(1, int(capacity))
+        self.ts = array('d', bytes(8 * self.capacity))
+        self.count = array('I', bytes(4 * self.capacity))
+        self.okn = array('I', bytes(4 * self.capacity))
+        self.rtt_sum = array('d', bytes(8 * self.capacity))
+        self.rtt_min = array('f', bytes(4 * self.capacity))
+        self.rtt_max = array('f', bytes(4 * self.capacity))
+        self._head = -1
+        self._len = 0
+
+    def add(self, ts, rtt, ok):
+        start = ts - ts % self.width
+        if not self._len or start > self.ts[self._head]:
+            self._head = (self._head + 1) % self.capacity
+            self._len = min(self._len + 1, self.capacity)
+            i = self._head
+            self.ts[i] = start
+            self.count[i] = self.okn[i] = 0
+            self.rtt_sum[i] = 0.0
+            self.rtt_min[i] = self.rtt_max[i] = float('nan')
+        i = self._head  # 时间回拨时并入最新的桶
+        self.count[i] += 1
+        if ok:
+            self.okn[i] += 1
+            self.rtt_sum[i] += rtt
+            if not self.rtt_min[i] <= rtt:  # NaN 比较为 False
+                self.rtt_min[i] = rtt
+            if not self.rtt_max[i] >= rtt:
+                self.rtt_max[i] = rtt
+
+    def rows(self, start, end):
+        """(桶起始时间, 样本数, 成功数, 平均 RTT, 最小 RTT, 最大 RTT)"""
+        for i in range(self.lower_bound(start - self.width + 1e-9), self.lower_bound(end)):
+            p = self._pos(i)
+            okn = self.okn[p]
+            avg = self.rtt_sum[p] / okn if okn else float('nan')
+            yield self.ts[p], self.count[p], okn, avg, self.rtt_min[p], self.rtt_max[p]
+
+class ProbeHistory():
+    """
+    每轮检测记录一条样本（命中的目标、RTT、是否可达），同时累加到分钟 / 小时 / 天三级桶。
+    默认容量：原始样本 21600 条（1 秒一轮约 6 小时）、分钟桶 3 天、小时桶 90 天、天桶 3 年，合计约 0.6 MB。
+    add() 在监控线程调用，query() 在界面线程调用，内部加锁。
+    """
+    TIERS = (('minute', 60, 60 * 24 * 3), ('hour', 3600, 24 * 90), ('day', 86400, 365 * 3))
+    MAX_TARGETS = 1024
+
+    def __init__(self, raw_capacity=21600):
+        self._lock = threading.Lock()
+        self._raw = _SampleRing(raw_capacity)
+        self._tiers = [(name, _BucketRing(width, cap)) for name, width, cap in self.TIERS]
+        self._targets = ['']   # 编号 0 保留给未知 / 超出上限的目标
+        self._target_ids = {}
+
+    def _target_id(self, target):
+        tid = self._target_ids.get(target)
+        if tid is None:
+            if len(self._targets) >= self.MAX_TARGETS:
+                return 0
+            tid = len(self._targets)
+            self._targets.append(target)
+            self._target_ids[target] = tid
+        return tid
+
+    def add(self, ts, target, rtt_ms, ok):
+        rtt = float(rtt_ms) if ok and rtt_ms is not None else float('nan')
+        ok = bool(ok) and rtt == rtt
+        with self._lock:
+            self._raw.add(ts, self._target_id(target or ''), rtt, ok)
+            for _, ring in self._tiers:
+                ring.add(ts, rtt, ok)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def memory_bytes(self):
+        rings = [self._raw] + [ring for _, ring in self._tiers]
+        return sum(a.itemsize * len(a) for r in rings for a in vars(r).values() if isinstance(a, array))
+
+    def query(self, start=None, end=None, max_points=1500):
+        """
+        返回 (分辨率, 数据点)；分辨率为 'raw' / 'minute' / 'hour' / 'day'，自动选能覆盖时间范围且点数不超过 max_points 的最细一级。
+        数据点统一为 (时间戳, 样本数, 成功数, 平均 RTT, 最小 RTT, 最大 RTT)；RTT 单位毫秒，无成功样本时为 NaN。
+        """
+        end = time.time() if end is None else end
+        start = (end - 3600.0) if start is None else start
+        with self._lock:
+            oldest = self._raw.oldest()
+            if oldest is not None and (oldest <= start or self._raw.complete):
+                lo, hi = self._raw.lower_bound(start), self._raw.lower_bound(end)
+                if hi - lo <= max_points:
+                    return 'raw', [(ts, 1, int(ok), rtt, rtt, rtt) for ts, _, rtt, ok in self._raw.rows(start, end)]
+            for i, (name, ring) in enumerate(self._tiers):
+                last = i == len(self._tiers) - 1
+                covered = ring.oldest() is not None and ring.oldest() <= start
+                if last or ((covered or len(ring) < ring.capacity) and (end - start) / ring.width <= max_points):
+                    return name, list(ring.rows(start, end))
+
+    def resize(self, raw_capacity):
+        """调整原始样本容量（热加载），保留最新的样本；各级汇总桶不受影响"""
+        ring = _SampleRing(raw_capacity)
+        with self._lock:
+            old = self._raw
+            if ring.capacity == old.capacity:
+                return
+            for i in range(max(0, len(old) - ring.capacity), len(old)):
+                p = old._pos(i)
+                ring.add(old.ts[p], old.target[p], old.rtt[p], bool(old.ok[p]))
+            ring.complete = old.complete and len(old) <= ring.capacity
+            self._raw = ring
+
+    def samples(self, start, end):
+        """原始样本：(时间戳, 目标, RTT, 是否成功)"""
+        with self._lock:
+            return [(ts, self._targets[tid], rtt, ok) for ts, tid, rtt, ok in self._raw.rows(start, end)]
+
+# -----------------------------
+# 结构化日志记录：时间戳 / 级别（INFO / WARN / ERROR）/ 所处阶段 / 内容
+# -----------------------------
+LogRecord = collections.namedtuple('LogRecord', 'ts level phase message')
+
+def format_log_record(rec):
+    return datetime.fromtimestamp(rec.ts).strftime("[%Y-%m-%d %H:%M:%S] ") + rec.message
+
+# -----------------------------
+# 事件循环适配：Monitor 只依赖 call_later / add_reader / remove_reader
+# （asyncio 事件循环原生满足；Qt 侧由 app.py 的 QtLoop 以 QTimer / QSocketNotifier 实现）
+# -----------------------------
+class _OneShot():
+    """单次定时器；再次 start 会取消尚未触发的上一次"""
+    def __init__(self, loop, callback):
+        self._loop = loop
+        self._callback = callback
+        self._handle = None
+
+    def start(self, delay_sec):
+        self.stop()
+        self._handle = self._loop.call_later(max(0.0, delay_sec), self._fire)
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def is_active(self):
+        return self._handle is not None
+
+    def _fire(self):
+        self._handle = None
+        self._callback()
+
+# -----------------------------
+# 线程池任务：阻塞的探测 / 门户请求放到线程池执行，结果投递回事件循环线程
+# -----------------------------
+class _Job():
+    """
+    一次阻塞调用。fn 在线程池中执行，on_done(结果, 异常) 经 loop.call_soon_threadsafe 回到事件循环线程调用。
+    deadline_sec 到期仍未返回：先调用 on_cancel（让阻塞调用尽快放弃），再以 TimeoutError 结束；
+    cancel() 之后不再回调 on_done。on_finish() 在 fn 真正返回后调用（不论是否已超时 / 取消）。
+    """
+    def __init__(self, loop, fn, on_done, deadline_sec=None, on_cancel=None, on_finish=None):
+        self._loop = loop
+        self._fn = fn
+        self._on_done = on_done
+        self._on_cancel = on_cancel
+        self.on_finish = on_finish
+        self.deadline_sec = deadline_sec
+        self.started_at = None
+        self.done = False
+        self._deadline = _OneShot(loop, self._expire) if deadline_sec else None
+
+    def arm(self):
+        """开始计时（排队等待也算在时限内）；submit 时若尚未计时则自动开始"""
+        if self._deadline is not None and not self._deadline.is_active() and not self.done:
+            self._deadline.start(self.deadline_sec)
+
+    def submit(self, executor):
+        """交给线程池；线程池已关闭时返回 False（不回调）"""
+        self.started_at = time.monotonic()
+        try:
+            executor.submit(self._run).add_done_callback(self._on_future_done)
+        except RuntimeError:
+            self.done = True
+            if self._deadline is not None:
+                self._deadline.stop()
+            return False
+        self.arm()
+        return True
+
+    def _run(self):
+        result, error = None, None
+        try:
+            result = self._fn()
+        except Exception as e:
+            error = e
+        try:
+            self._loop.call_soon_threadsafe(self._deliver, result, error)
+        except RuntimeError:
+            pass  # 事件循环已关闭
+
+    def _on_future_done(self, future):
+        """线程池关闭时丢弃了还没开始的任务：fn 不会执行，照样通知 on_finish"""
+        if future.cancelled():
+            try:
+                self._loop.call_soon_threadsafe(self._deliver, None, RuntimeError("线程池已关闭"))
+            except RuntimeError:
+                pass
+
+    def _deliver(self, result, error):
+        if self.on_finish is not None:
+            self.on_finish()
+        self._settle(result, error)
+
+    def _settle(self, result, error):
+        if self.done:
+            return
+        self.done = True
+        if self._deadline is not None:
+            self._deadline.stop()
+        self._on_done(result, error)
+
+    def _expire(self):
+        if self.done:
+            return
+        self._cancel_fn()
+        self._settle(None, TimeoutError(f"超过 {self.deadline_sec:g} 秒未返回"))
+
+    def _cancel_fn(self):
+        if self._on_cancel is not None:
+            try:
+                self._on_cancel()
+            except Exception:
+                pass
+
+    def cancel(self):
+        if self.done:
+            return
+        self.done = True
+        if self._deadline is not None:
+            self._deadline.stop()
+        self._cancel_fn()
+
+class MonitorExecutors():
+    """
+    探测与门户请求各用一个有界线程池，互不阻塞：认证请求卡住时探测照常进行。
+    多账号时由 AccountPool 创建一份给所有 Monitor 共用。
+    """
+    def __init__(self, probe_workers=4, portal_workers=1):
+        import concurrent.futures
+        self.probe = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, int(probe_workers)), thread_name_prefix='campus-probe')
+        self.portal = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, int(portal_workers)), thread_name_prefix='campus-portal')
+
+    def shutdown(self):
+        """不等待进行中的任务（它们各自有超时），排队中的任务直接丢弃"""
+        self.probe.shutdown(wait=False, cancel_futures=True)
+        self.portal.shutdown(wait=False, cancel_futures=True)
+
+# -----------------------------
+# 配置文件监视：变化后重新读取，交给 Monitor.reload / AccountPool.reload 按差异热加载
+# -----------------------------
+class ConfigWatcher():
+    """
+    Linux 用 inotify 监视配置文件所在目录（编辑器常以“写临时文件再改名”的方式保存）；
+    其他平台按 poll_sec 比较修改时间。变化去抖后读取，解析成功才回调 on_change(新配置)。
+    """
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+
+    def __init__(self, path, loop, on_change, debounce_ms=300, poll_sec=2.0):
+        self.path = os.path.abspath(path)
+        self._loop = loop
+        self._on_change = on_change
+        self._debounce_sec = max(0, int(debounce_ms)) / 1000.0
+        self._poll_sec = max(0.2, float(poll_sec))
+        self._fd = None
+        self._mtime = None
+        self._settle_timer = _OneShot(loop, self._reload)
+        self._poll_timer = _OneShot(loop, self._poll)
+
+    @property
+    def mode(self):
+        return 'inotify' if self._fd is not None else 'poll'
+
+    def start(self):
+        self._fd = self._inotify_open()
+        if self._fd is not None:
+            self._loop.add_reader(self._fd, self._on_readable)
+        else:
+            self._mtime = self._stat()
+            self._poll_timer.start(self._poll_sec)
+
+    def stop(self):
+        self._settle_timer.stop()
+        self._poll_timer.stop()
+        if self._fd is not None:
+            self._loop.remove_reader(self._fd)
+            try:
+                os.close(self._fd)
+            except OSError:
+                pass
+            self._fd = None
+
+    def _inotify_open(self):
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+            if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except Exception:
+            return None
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._fd, 65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            return
+        name = os.path.basename(self.path)
+        off = 0
+        hit = False
+        # struct inotify_event { int wd; uint32 mask, cookie, len; char name[len]; }
+        while off + 16 <= len(data):
+            _, _, _, length = struct.unpack_from('iIII', data, off)
+            fname = data[off + 16:off + 16 + length].split(b'\0', 1)[0]
+            off += 16 + length
+            if fname.decode('utf-8', 'replace') == name:
+                hit = True
+        if hit:
+            self._settle_timer.start(self._debounce_sec)
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _poll(self):
+        mtime = self._stat()
+        if mtime != self._mtime:
+            self._mtime = mtime
+            self._settle_timer.start(self._debounce_sec)
+        self._poll_timer.start(self._poll_sec)
+
+    def _reload(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return  # 文件写到一半或格式有误：保持当前配置，等下一次变化
+        if not isinstance(data, dict):
+            return
+        for k, v in DEFAULT_CONFIG.items():
+            data.setdefault(k, v)
+        self._on_change(data)
+
+# -----------------------------
+# 本机控制 / 状态接口：其他程序直接读取本程序缓存的状态、订阅变化，不必各自再探测一遍
+# -----------------------------
+def control_address(cfg):
+    """Linux / macOS 为 Unix socket 路径；Windows 为 ('127.0.0.1', 端口)"""
+    if hasattr(socket, 'AF_UNIX') and not platform.system().lower().startswith("win"):
+        return cfg.get("control_socket") or os.path.join(appdata_dir(), "control.sock")
+    try:
+        port = int(cfg.get("control_port", 47831))
+    except Exception:
+        port = 47831
+    return ('127.0.0.1', port)
+
+def control_token(create=True):
+    """TCP 接口（Windows）的访问令牌：存放在当前用户的配置目录，本机其他用户读不到，相当于 Unix socket 的 0600"""
+    path = os.path.join(appdata_dir(), "control.token")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            token = f.read().strip()
+        if token:
+            return token
+    except OSError:
+        pass
+    if not create:
+        return None
+    import secrets
+    token = secrets.token_hex(16)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(token)
+    try:
+        os.chmod(path, 0o600)
+    except OSError:
+        pass
+    return token
+
+class ControlServer():
+    """
+    协议：每行一个 JSON。请求 {"cmd": 命令, "account": 账号（多账号时可选，省略为全部）}，响应 {"ok": 是否成功, ...}；
+    TCP（Windows）时请求还须带 "token"：control_token() 的值，不符则回一条错误后断开
+      status          缓存的当前状态（不触发探测）：{"state": ..., "accounts": {账号: 状态}}（单账号时 accounts 只有 "default"）
+      probe / reauth  立即检测 / 立即重新认证
+      start / stop    启停监控（接口本身保持可用）
+      subscribe       先回一次 status，之后每次状态变化推送 {"event": 事件, "account": 账号, "state": 状态}，直到断开
+    commands：{命令: fn(账号或 None) -> None 或错误信息}，在连接线程中调用，由宿主投递到监控所在线程执行。
+    """
+    COMMANDS = ('probe', 'reauth', 'start', 'stop')
+    DEFAULT_ACCOUNT = 'default'
+
+    def __init__(self, address, commands, queue_size=256):
+        self.address = address
+        self._commands = commands
+        self._queue_size = max(1, int(queue_size))
+        self._lock = threading.Lock()
+        self._states = {}        # 账号 -> 最近一次状态
+        self._subscribers = {}   # 订阅者队列 -> 断开标志
+        self._server = None
+        self._token = None
+
+    # —— 状态缓存（任意线程调用） —— #
+    def publish(self, account, state):
+        """state 为 Monitor.status_snapshot()，其中 event 为触发本次更新的事件；None 表示账号已移除"""
+        account = account or self.DEFAULT_ACCOUNT
+        msg = {'event': state.get('event') if state is not None else 'removed', 'account': account, 'state': state}
+        with self._lock:
+            if state is None:
+                self._states.pop(account, None)
+            else:
+                self._states[account] = state
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(msg)
+            except queue.Full:
+                self._drop(q)  # 读得太慢的订阅者直接断开，不拖累其他人
+
+    def status(self):
+        with self._lock:
+            accounts = dict(self._states)
+        states = list(accounts.values())
+        if len(states) == 1:
+            overall = states[0]
+        else:
+            # 多账号：全部在线才算在线，任一账号仍未知则为 None
+            online = [s.get('online') for s in states]
+            overall = {
+                'running': any(s.get('running') for s in states),
+                'online': None if not states or None in online else all(online),
+            }
+        return {'ok': True, 'state': overall, 'accounts': accounts}
+
+    def _drop(self, q):
+        """断开订阅者：置断开标志，清掉积压的消息再放入结束标记，唤醒阻塞在 get 上的连接线程"""
+        with self._lock:
+            closed = self._subscribers.pop(q, None)
+        if closed is None:
+            return
+        closed.set()
+        while True:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                break
+        try:
+            q.put_nowait(None)
+        except queue.Full:
+            pass  # 其他线程又塞进了消息：连接线程按断开标志超时退出
+
+    # —— 启停 —— #
+    def start(self):
+        import socketserver
+        owner = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                owner._serve(self.rfile, self.wfile)
+
+        if isinstance(self.address, str):
+            self._claim_socket_path(self.address)
+
+            class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+                daemon_threads = True
+
+                def server_bind(self):
+                    # 只允许当前用户连接：bind 时就以 0600 创建，不留先建后 chmod 的空档
+                    old = os.umask(0o177)
+                    try:
+                        super().server_bind()
+                    finally:
+                        os.umask(old)
+            self._server = Server(self.address, Handler)
+        else:
+            # Windows 的 SO_REUSEADDR 允许别的进程绑定同一端口，改用独占绑定（POSIX 上 SO_REUSEADDR 只影响
+            # TIME_WAIT，照常打开）；回环地址谁都能连，靠只有当前用户读得到的令牌鉴权
+            class Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+                daemon_threads = True
+                allow_reuse_address = not hasattr(socket, 'SO_EXCLUSIVEADDRUSE')
+
+                def server_bind(self):
+                    if hasattr(socket, 'SO_EXCLUSIVEADDRUSE'):
+                        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_EXCLUSIVEADDRUSE, 1)
+                    super().server_bind()
+            self._token = control_token()
+            self._server = Server(tuple(self.address), Handler)
+        threading.Thread(target=self._server.serve_forever, name="control-api", daemon=True).start()
+
+    def _claim_socket_path(self, path):
+        """残留的 socket 文件（上次异常退出）直接删除；仍有进程在监听则报错"""
+        if not os.path.exists(path):
+            return
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.settimeout(0.5)
+            probe.connect(path)
+        except OSError:
+            os.unlink(path)
+            return
+        finally:
+            probe.close()
+        raise OSError(f"{path} 已被另一个实例使用")
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            self._drop(q)
+        if isinstance(self.address, str):
+            try:
+                os.unlink(self.address)
+            except OSError:
+                pass
+
+    # —— 连接处理（连接线程） —— #
+    def _serve(self, rfile, wfile):
+        def send(obj):
+            wfile.write((json.dumps(obj, ensure_ascii=False) + "\n").encode('utf-8'))
+            wfile.flush()
+        try:
+            for line in rfile:
+                if not line.strip():
+                    continue
+                try:
+                    req = json.loads(line)
+                    cmd = req.get('cmd')
+                except (ValueError, AttributeError):
+                    send({'ok': False, 'error': '请求不是 JSON 对象'})
+                    continue
+                if self._token is not None and not hmac.compare_digest(str(req.get('token', '')), self._token):
+                    send({'ok': False, 'error': '令牌无效'})
+                    return
+                if cmd == 'subscribe':
+                    self._stream(send)
+                    return
+                send(self._dispatch(cmd, req.get('account')))
+        except OSError:
+            pass  # 客户端已断开
+
+    def _dispatch(self, cmd, account):
+        if cmd == 'status':
+            return self.status()
+        if cmd not in self.COMMANDS or cmd not in self._commands:
+            return {'ok': False, 'error': f"未知命令：{cmd}"}
+        try:
+            error = self._commands[cmd](account)
+        except Exception as e:
+            error = str(e)
+        return {'ok': True, 'cmd': cmd} if not error else {'ok': False, 'cmd': cmd, 'error': error}
+
+    def _stream(self, send):
+        q = queue.Queue(maxsize=self._queue_size)
+        closed = threading.Event()
+        with self._lock:
+            self._subscribers[q] = closed
+        try:
+            send(self.status())
+            while not closed.is_set():
+                try:
+                    msg = q.get(timeout=1.0)
+                except queue.Empty:
+                    continue
+                if msg is None:
+                    return
+                send(msg)
+        finally:
+            with self._lock:
+                self._subscribers.pop(q, None)
+
+def control_client(argv, prog="app.py ctl"):
+    """命令行访问本机控制接口：app.py ctl / campusd.py ctl status|probe|reauth|start|stop|subscribe"""
+    import argparse
+    parser = argparse.ArgumentParser(prog=prog, description="访问正在运行的监控（本机控制 / 状态接口）")
+    parser.add_argument("cmd", choices=('status', 'subscribe') + ControlServer.COMMANDS)
+    parser.add_argument("--account", help="多账号时只作用于该账号")
+    parser.add_argument("--config", help="配置文件路径（用于确定接口地址）")
+    args = parser.parse_args(argv)
+    address = control_address(load_config(args.config))
+    family = socket.AF_UNIX if isinstance(address, str) else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+    except OSError as e:
+        sys.exit(f"无法连接 {address}：{e}（程序未运行或未开启 control_api）")
+    req = {'cmd': args.cmd}
+    if family == socket.AF_INET:
+        req['token'] = control_token(create=False) or ''
+    if args.account:
+        req['account'] = args.account
+    sock.sendall((json.dumps(req, ensure_ascii=False) + "\n").encode('utf-8'))
+    try:
+        with sock.makefile('rb') as f:
+            for line in f:
+                sys.stdout.write(line.decode('utf-8'))
+                sys.stdout.flush()
+                if args.cmd != 'subscribe':
+                    reply = json.loads(line)
+                    sys.exit(0 if reply.get('ok') else 1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+
+# -----------------------------
+# 监控状态机（按 ping 三级检测）；与界面 / 事件循环实现无关
+# -----------------------------
+class Monitor():
+    def __init__(self, cfg_getter, loop, on_log_batch=None, on_running=None,
+                 on_schedule=None, on_phase=None, name=None, journal=None, gate=None, history=None,
+                 executors=None, on_status=None):
+        """
+        loop：提供 call_later(秒, 回调) -> 带 cancel() 的句柄、add_reader(fd, 回调)、remove_reader(fd)，
+              以及可从其他线程调用的 call_soon_threadsafe(回调, *参数)（线程池把探测 / 门户结果投递回来）
+        on_log_batch([LogRecord, ...]) / on_running(bool) / on_schedule(dict) / on_phase(dict)：状态回调，可为 None
+        on_status(dict)：status_snapshot()，阶段、检测 / 认证结果、每轮结果与会话信息变化时调用（本机控制接口用）
+        name / journal / gate：多账号时由 AccountPool 传入账号名、共用的事件日志与门户闸门（gate 为 None 时自建一个）
+        history：ProbeHistory，每轮检测记录一条样本（界面曲线用）；为 None 则不记录
+        executors：MonitorExecutors，多账号时共用；为 None 则启动时自建、停止时关闭
+        """
+        self.name = name
+        self.history = history
+        self._shared_journal = journal
+        self._cfg_getter = cfg_getter
+        self._loop = loop
+        self._on_log_batch = on_log_batch
+        self._on_running = on_running
+        self._on_schedule = on_schedule
+        self._on_phase = on_phase
+        self._on_status = on_status
+        self._main = Main()
+        self._own_gate = gate is None
+        self._main.gate = gate if gate is not None else PortalGate()
+        self._portal_pending = False  # 门户地址 / 连接参数已变，等本轮结束后再重建会话
+        self._dns = DnsCache()
+        self._probe = ProbeEngine(dns=self._dns)
+        self._classifier = OutageClassifier(self._main, self._probe)
+        self._upstream_since = None     # 本次上游中断的开始时刻（monotonic）
+        self._upstream_reauthed = False
+        self._ctx_refreshed_at = None
+        self._running = False
+        self._executors = executors
+        self._own_executors = executors is None
+        self._epoch = 0                 # 每次启停加一；线程池在此之前提交的任务结果一律丢弃
+        self._portal_queue = collections.deque()  # 门户操作按提交顺序串行执行（Main 不跨线程并发使用）
+        self._portal_busy = None        # 线程池中正在执行的门户任务（停止后仍可能在执行，见 _portal_finished）
+        self._portal_stale = False      # 重新启动时上一次的门户任务还没结束：等它结束后再建会话
+        self._portal_job = None         # 当前阶段等待结果的门户任务
+        self._side_probing = False
+        self._online = None             # 最近一轮的结论；None = 尚未完成过一轮
+        self._last_probe = None
+        self._last_login = None
+        self._scheduler = ProbeScheduler()
+        self._timer = _OneShot(loop, self._tick)
+
+        # 状态机：当前阶段、进入时间、各阶段累计耗时
+        self._phase = 'stopped'
+        self._phase_entered_at = None
+        self._phase_totals = {}
+        self._cycle = None
+        self._step_timer = _OneShot(loop, self._step)
+
+        # 日志先缓冲，按时间间隔或条数成批交给 on_log_batch
+        self._journal = None
+        self._metrics_server = None
+        self._log_buf = []
+        self._log_timer = _OneShot(loop, self._flush_logs)
+
+        # 网络事件触发（Linux rtnetlink）：去抖后立即执行一次 _tick
+        self._netlink = None
+        self._netlink_fd = None
+        self._event_reasons = []
+        self._event_timer = _OneShot(loop, self._on_net_event_settled)
+
+        # 会话到期前的计划内重新认证
+        self._session_login_at = None   # 本程序最近一次认证成功的时刻（monotonic）
+        self._session_due = None        # 计划重新认证的时刻（monotonic）
+        self._session_deadline_at = None
+        self._session_flow_warned = False
+        self._session_timer = _OneShot(loop, self._on_session_due)
+        self._ctx_timer = _OneShot(loop, self._refresh_context)  # 预取登录上下文：排到本轮检测之后
+
+    @property
+    def running(self):
+        return self._running
+
+    def _emit(self, callback, value):
+        if callback is not None:
+            callback(value)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._epoch += 1
+        if self._own_executors:
+            try:
+                probe_workers = int(self._cfg_getter().get("probe_workers", 4))
+            except Exception:
+                probe_workers = 4
+            self._executors = MonitorExecutors(probe_workers, 1)
+        self._emit(self._on_running, True)
+        if self._portal_busy is None:
+            self._open_portal_session()
+        else:
+            # 上次停止时门户线程上还有请求在用 Main：等它结束再重建会话，Main 不会被两个线程同时使用
+            self._portal_stale = True
+        self._apply_context_cfg()
+        self._apply_dns_cfg()
+        if self._own_gate:
+            self._main.gate.configure_from(self._cfg_getter())
+        self._main.login_breaker.configure_from(self._cfg_getter())
+        self._ctx_refreshed_at = None
+        self._session_login_at = None
+        self._session_due = None
+        self._session_deadline_at = None
+        self._session_flow_warned = False
+        self._upstream_since = None
+        self._upstream_reauthed = False
+        self._side_probing = False
+        self._scheduler.reset()
+        self._scheduler.configure(self._cfg_getter())
+        self._phase_totals = {}
+        self._enter('idle')
+        self._open_journal()
+        self._event('monitor', running=True)
+        self._publish_status('running')
+        self._log("监控已启动")
+        self._start_metrics_server()
+        self._start_net_events()
+        self._timer.start(0)
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        self._epoch += 1
+        self._timer.stop()
+        self._session_timer.stop()
+        self._ctx_timer.stop()
+        self._enter('stopped')
+        self._stop_net_events()
+        self._cancel_jobs()
+        if self._portal_busy is None:
+            self._main.close_session()  # 否则等门户线程上的请求结束后在 _portal_finished 里关闭
+        self._emit(self._on_running, False)
+        self._publish_status('running')
+        self._log("监控已停止")
+        self._flush_logs()
+        self._event('monitor', running=False)
+        self._close_journal()
+        self._stop_metrics_server()
+
+    def _event(self, kind, **fields):
+        """写入磁盘事件日志（只入队，不阻塞）"""
+        if self._journal is not None:
+            if self.name is not None:
+                fields['account'] = self.name
+            self._journal.write(kind, phase=self._phase, **fields)
+
+    def _open_journal(self):
+        if self._shared_journal is not None:
+            self._journal = self._shared_journal
+            return
+        cfg = self._cfg_getter()
+        if not cfg.get("journal_enabled", True):
+            return
+        try:
+            self._journal = EventJournal(
+                segment_bytes=int(cfg.get("journal_segment_kb", 1024)) * 1024,
+                max_segments=int(cfg.get("journal_max_segments", 200)),
+                on_error=lambda message: self._loop.call_soon_threadsafe(self._log, message, 'WARN')
+            )
+            self._journal.start()
+        except Exception as e:
+            self._journal = None
+            self._log(f"事件日志不可用：{e}", 'WARN')
+
+    def _start_metrics_server(self):
+        """metrics_port > 0 时在 127.0.0.1 上提供 /metrics 与 /metrics.json"""
+        try:
+            port = int(self._cfg_getter().get("metrics_port", 0))
+        except Exception:
+            port = 0
+        if port <= 0:
+            return
+        server = MetricsServer(METRICS, port)
+        try:
+            server.start()
+        except Exception as e:
+            self._log(f"指标端口 {port} 启动失败：{e}", 'WARN')
+            return
+        self._metrics_server = server
+        self._log(f"指标导出：http://127.0.0.1:{server.port}/metrics")
+
+    def _stop_metrics_server(self):
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+            self._metrics_server = None
+
+    def metrics_snapshot(self):
+        return METRICS.snapshot()
+
+    def _close_journal(self):
+        if self._journal is not None and self._journal is not self._shared_journal:
+            self._journal.close()
+        self._journal = None
+
+    def _log(self, message, level='INFO'):
+        if self.name is not None:
+            message = f"[{self.name}] {message}"
+        self._log_buf.append(LogRecord(time.time(), level, self._phase, message))
+        cfg = self._cfg_getter()
+        try:
+            batch_max = max(1, int(cfg.get("log_batch_max", 200)))
+            flush_ms = max(0, int(cfg.get("log_flush_ms", 200)))
+        except Exception:
+            batch_max, flush_ms = 200, 200
+        if len(self._log_buf) >= batch_max:
+            self._flush_logs()
+        elif not self._log_timer.is_active():
+            self._log_timer.start(flush_ms / 1000.0)
+
+    def _flush_logs(self):
+        self._log_timer.stop()
+        if self._log_buf:
+            batch, self._log_buf = self._log_buf, []
+            self._emit(self._on_log_batch, batch)
+
+    def _start_net_events(self):
+        cfg = self._cfg_getter()
+        if not cfg.get("event_driven_check", True) or not NetlinkMonitor.available():
+            return
+        monitor = NetlinkMonitor()
+        try:
+            fd = monitor.open()
+        except Exception as e:
+            self._log(f"网络事件订阅失败，仅按间隔检测：{e}", 'WARN')
+            return
+        self._netlink = monitor
+        self._netlink_fd = fd
+        self._loop.add_reader(fd, self._on_netlink_readable)
+        self._log("已订阅网络事件（网卡 / 地址 / 默认路由变化时立即检测）")
+
+    def _stop_net_events(self):
+        self._event_timer.stop()
+        self._event_reasons = []
+        if self._netlink_fd is not None:
+            self._loop.remove_reader(self._netlink_fd)
+            self._netlink_fd = None
+        if self._netlink is not None:
+            self._netlink.close()
+            self._netlink = None
+
+    def _on_netlink_readable(self):
+        if self._netlink is None:
+            return
+        self.feed_net_events(self._netlink.read_events())
+
+    def feed_net_events(self, events):
+        """NetlinkMonitor.read_events() 的结果：去抖后立即检测；AccountPool 读一份 netlink 后分发给各账号"""
+        if not events or not self._running:
+            return
+        for kind, action, _, _, desc in events:
+            if kind == 'addr' and action in ('new', 'del'):
+                # 地址变了（DHCP 换了地址、地址被移除），缓存的 queryString（含 wlanuserip）随之失效
+                self._main.context.invalidate()
+            if desc not in self._event_reasons:
+                self._event_reasons.append(desc)
+        try:
+            debounce_ms = int(self._cfg_getter().get("event_debounce_ms", 800))
+        except Exception:
+            debounce_ms = 800
+        self._event_timer.start(max(0, debounce_ms) / 1000.0)  # 每来一个事件重新计时
+
+    def _on_net_event_settled(self):
+        reasons, self._event_reasons = self._event_reasons, []
+        if not self._running or not reasons:
+            return
+        shown = "；".join(reasons[:3]) + (f" 等 {len(reasons)} 项" if len(reasons) > 3 else "")
+        self._log(f"检测到网络变化（{shown}），立即检测")
+        self._tick()
+
+    def _open_portal_session(self):
+        """按配置建立门户连接池；监控运行期间一直复用，停止时关闭"""
+        cfg = self._cfg_getter()
+        try:
+            self._main.configure_http(
+                pool_size=cfg.get("http_pool_size", 4),
+                connect_timeout=cfg.get("http_connect_timeout_sec", 3.0),
+                read_timeout=cfg.get("http_read_timeout_sec", 5.0),
+                post_timeout=cfg.get("http_post_timeout_sec", 8.0),
+                retries=cfg.get("http_retries", 1),
+                source_address=cfg.get("source_address"),
+                interface=cfg.get("bind_interface")
+            )
+        except Exception:
+            self._main.configure_http()
+        self._main.configure_portal(
+            cfg.get("portal_url") or "http://10.11.0.1",
+            cfg.get("auth_url") or "http://auth.ysu.edu.cn"
+        )
+        # 在门户线程上建立（首次会导入 requests，耗时上百毫秒），与第一次探测同时进行
+        self._run_portal(self._main.open_session, lambda result, error: None, track=False)
+
+    def _apply_context_cfg(self):
+        cfg = self._cfg_getter()
+        try:
+            self._main.context.ttl_sec = float(cfg.get("login_context_ttl_sec", 21600.0))
+        except Exception:
+            self._main.context.ttl_sec = 21600.0
+        self._main.smart_login = bool(cfg.get("smart_login", True))
+
+    def _schedule_context_refresh(self):
+        """网络正常时，按 login_context_refresh_sec 在本轮检测之后预取登录上下文"""
+        cfg = self._cfg_getter()
+        try:
+            every = float(cfg.get("login_context_refresh_sec", 300.0))
+        except Exception:
+            every = 300.0
+        now = time.monotonic()
+        if self._ctx_refreshed_at is not None and now - self._ctx_refreshed_at < every:
+            return
+        self._ctx_refreshed_at = now
+        self._ctx_timer.start(0)
+
+    def _refresh_context(self):
+        if not self._running:
+            return
+        self._apply_context_cfg()
+        type = self._cfg_getter().get("type", "校园网")
+        # 预取失败不影响检测，掉线时走完整登录流程
+        self._run_portal(lambda: self._main.refresh_context(type), self._on_context_refreshed, track=False)
+
+    def _on_context_refreshed(self, result, error):
+        self._plan_session_refresh()
+        self._publish_status('session')
+
+    # —— 会话到期前计划内重新认证 —— #
+    @staticmethod
+    def _parse_quiet_hours(text):
+        """"HH:MM-HH:MM" → (起始分钟, 结束分钟)；空或格式不对返回 None"""
+        m = re.fullmatch(r'\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*', str(text or ''))
+        if not m:
+            return None
+        h1, m1, h2, m2 = (int(g) for g in m.groups())
+        if h1 > 23 or h2 > 24 or m1 > 59 or m2 > 59:
+            return None
+        return (h1 * 60 + m1, h2 * 60 + m2)
+
+    def _next_quiet_start(self, quiet, now):
+        """下一个安静时段的开始时刻（monotonic）；当前就处于时段内则返回 now"""
+        start_min, end_min = quiet
+        t = time.localtime()
+        cur_min = t.tm_hour * 60 + t.tm_min
+        inside = (start_min <= cur_min < end_min) if start_min <= end_min \
+            else (cur_min >= start_min or cur_min < end_min)
+        if inside:
+            return now
+        wait_min = (start_min - cur_min) % (24 * 60)
+        return now + wait_min * 60 - t.tm_sec
+
+    def _session_deadline(self, cfg):
+        """估算门户强制下线的时刻（monotonic）：优先用剩余时长，其次按会话寿命推算"""
+        info = self._main.session_info
+        if info is not None and not info.online:
+            return None
+        if info is not None and info.left_sec is not None:
+            return info.fetched_at + info.left_sec
+        try:
+            max_age = float(cfg.get("session_max_age_sec", 0) or 0)
+        except Exception:
+            max_age = 0.0
+        if max_age <= 0:
+            return None
+        if info is not None and info.online_sec is not None:
+            return info.fetched_at - info.online_sec + max_age
+        if self._session_login_at is not None:
+            return self._session_login_at + max_age
+        return None
+
+    def _check_session_flow(self, cfg):
+        info = self._main.session_info
+        if info is None or info.left_flow_mb is None:
+            return
+        try:
+            warn_mb = float(cfg.get("session_flow_warn_mb", 100.0) or 0)
+        except Exception:
+            warn_mb = 0.0
+        if warn_mb > 0 and info.left_flow_mb < warn_mb:
+            if not self._session_flow_warned:
+                self._session_flow_warned = True
+                self._log(f"剩余流量仅 {info.left_flow_mb:.0f} MB，用尽后门户将强制下线", 'WARN')
+                self._event('session', flow_left_mb=info.left_flow_mb)
+        else:
+            self._session_flow_warned = False
+
+    def _plan_session_refresh(self):
+        """按会话剩余时长排定重新认证；拿不到到期时间则不排"""
+        if not self._running:
+            return
+        cfg = self._cfg_getter()
+        self._check_session_flow(cfg)
+        deadline = self._session_deadline(cfg) if cfg.get("session_refresh", True) else None
+        if deadline is None:
+            if self._session_due is not None:
+                self._session_timer.stop()
+                self._session_due = None
+            return
+        try:
+            margin = max(0.0, float(cfg.get("session_refresh_margin_sec", 300.0)))
+        except Exception:
+            margin = 300.0
+        now = time.monotonic()
+        due = deadline - margin
+        reason = f"到期前 {margin:g} 秒"
+        quiet = self._parse_quiet_hours(cfg.get("session_quiet_hours"))
+        if quiet is not None:
+            # 到期前最后一个安静时段：时段开始时就刷新，不必等到临近到期。
+            # 会话刚建立不久（不足 12 小时）时不提前，免得在安静时段内反复刷新
+            q = self._next_quiet_start(quiet, now)
+            started = self._session_login_at
+            info = self._main.session_info
+            if started is None and info is not None and info.online_sec is not None:
+                started = info.fetched_at - info.online_sec
+            if q < due and deadline - q <= 86400 and (started is None or q - started >= 43200):
+                due = q
+                reason = "安静时段"
+        due = max(due, now)
+        # 每次读取会话信息都会得到相近的到期时间，差别不大时不重新排期、不重复记日志
+        if self._session_due is not None and abs(due - self._session_due) < 30:
+            return
+        self._session_due = due
+        self._session_deadline_at = deadline
+        self._session_timer.start(due - now)
+        self._log(f"会话约 {_fmt_duration(deadline - now)} 后到期，"
+                  f"计划在 {_fmt_duration(due - now)} 后重新认证（{reason}）")
+
+    def _on_session_due(self):
+        if not self._running:
+            return
+        if self._phase != 'idle':
+            self._session_timer.start(5.0)  # 本轮流程结束后再刷新
+            return
+        self._session_due = None
+        self._timer.stop()
+        self._cycle = self._read_cycle_cfg()
+        self._enter('refresh', 0)
+
+    def session_snapshot(self):
+        now = time.monotonic()
+        info = self._main.session_info
+        left = info.left_at(now) if info is not None else None
+        if left is None and self._session_deadline_at is not None:
+            left = self._session_deadline_at - now
+        return {
+            'login_age_sec': None if self._session_login_at is None else now - self._session_login_at,
+            'online_sec': None if info is None else info.online_sec,
+            'left_sec': left,
+            'left_flow_mb': None if info is None else info.left_flow_mb,
+            'refresh_in_sec': None if self._session_due is None else max(0.0, self._session_due - now),
+        }
+
+    LOGIN_PATH_NAMES = {'cached': '缓存的登录参数', 'smart': '按门户状态登录', 'full': '完整流程'}
+
+    def _apply_dns_cfg(self):
+        cfg = self._cfg_getter()
+        try:
+            self._dns.ttl_sec = max(1.0, float(cfg.get("dns_cache_ttl_sec", 300.0)))
+            self._dns.max_stale_sec = max(0.0, float(cfg.get("dns_cache_max_stale_sec", 86400.0)))
+        except Exception:
+            self._dns.ttl_sec, self._dns.max_stale_sec = 300.0, 86400.0
+        if not cfg.get("dns_cache", True):
+            self._dns.clear()
+
+    def _refresh_dns(self):
+        """网络正常时后台解析全部检测目标（含认证后校验目标）中到期的域名"""
+        if self._probe.dns is None or self._cycle is None:
+            return
+        names = [self._probe.parse_target(h)[1] for h in self._cycle['hosts'] + self._cycle['post_hosts']]
+        self._dns.refresh_async(names)
+
+    def _login_path_note(self):
+        path = self._main.last_login_path
+        n = self._main.last_login_round_trips
+        if path == 'cached' and n == 1:
+            return "（已用缓存的登录参数，仅一次请求）"
+        if path not in self.LOGIN_PATH_NAMES or n is None:
+            return ""
+        return f"（{self.LOGIN_PATH_NAMES[path]}，{n} 次请求）"
+
+    def _schedule_next(self, outcome):
+        """按本轮结果决定下次检测时间；事件触发的检测同样会重新排期"""
+        if not self._running:
+            return
+        self._scheduler.configure(self._cfg_getter())
+        self._scheduler.on_result(outcome)
+        delay = self._scheduler.next_delay()
+        self._timer.start(delay)
+        self._online = outcome == 'ok'
+        self._emit(self._on_schedule, self._scheduler.snapshot())
+        self._publish_status('round')
+
+    def schedule_snapshot(self):
+        return self._scheduler.snapshot()
+
+    # —— 本机控制接口：状态与命令（命令须在事件循环线程调用） —— #
+    def status_snapshot(self, event=None):
+        """当前状态（均为可 JSON 序列化的值）；event 为触发本次更新的事件"""
+        return {
+            'event': event,
+            'at': time.time(),
+            'running': self._running,
+            'online': self._online,
+            'phase': self._phase,
+            'phase_name': self.PHASE_NAMES.get(self._phase, self._phase),
+            'last_probe': self._last_probe,
+            'last_login': self._last_login,
+            'session': self.session_snapshot(),
+            'schedule': self._scheduler.snapshot(),
+            'portal_gate': self._main.gate.snapshot()['state'],
+            'login_breaker': self._main.login_breaker.snapshot()['state'],
+        }
+
+    def _publish_status(self, event):
+        if self._on_status is not None:
+            self._on_status(self.status_snapshot(event))
+
+    def probe_now(self):
+        """立即检测；一轮流程进行中时与网络事件触发相同"""
+        if not self._running:
+            return False
+        self._log("收到立即检测请求")
+        self._tick()
+        return True
+
+    def reauth_now(self):
+        """立即重新认证（空闲时才执行，进行中的流程不打断）"""
+        if not self._running:
+            return False
+        if self._phase != 'idle':
+            self._log(f"收到重新认证请求，但正在{self.PHASE_NAMES.get(self._phase, self._phase)}，已忽略", 'WARN')
+            return False
+        self._log("收到重新认证请求")
+        self._timer.stop()
+        self._cycle = self._read_cycle_cfg()
+        self._enter('login', 0)
+        return True
+
+    def _configure_probe(self):
+        """在事件循环线程里按配置设置探测引擎，探测线程只读"""
+        cfg = self._cfg_getter()
+        engine = str(cfg.get("probe_engine", "socket")).lower()
+        self._probe.use_socket = (engine != "ping")
+        self._probe.source_address = cfg.get("source_address") or None
+        self._probe.interface = cfg.get("bind_interface") or None
+        self._probe.dns = self._dns if cfg.get("dns_cache", True) else None
+
+    def _ping_once(self, host, timeout_ms, cancel=None):
+        """单个目标探测（在探测线程中执行），返回 (是否成功, 往返耗时毫秒)"""
+        t0 = time.monotonic()
+        ok, rtt = self._probe.probe(host, timeout_ms, cancel=cancel)
+        if cancel is None or not cancel.cancelled or ok:
+            # 被取消的探测不计入（它没有跑完）
+            METRICS.observe('campus_probe_seconds', (rtt / 1000.0) if ok else time.monotonic() - t0,
+                            target=host, result='ok' if ok else 'fail')
+        return ok, rtt
+
+    def _unique_hosts(self, hosts):
+        """去空、去重，保持原有优先级顺序"""
+        out = []
+        for h in hosts:
+            h = (h or '').strip()
+            if h and h not in out:
+                out.append(h)
+        return out
+
+    # —— 线程池任务：探测与门户请求在各自线程池中执行，回调都在事件循环线程 —— #
+    def _bind_epoch(self, on_done):
+        """包装线程池回调：监控已停止或重启过则丢弃结果"""
+        epoch = self._epoch
+
+        def done(*args):
+            if self._running and epoch == self._epoch:
+                on_done(*args)
+        return done
+
+    def _cancel_jobs(self):
+        if self._portal_job is not None:
+            self._portal_job.cancel()
+            self._portal_job = None
+        for job in self._portal_queue:
+            job.cancel()
+        self._portal_queue.clear()
+        # _portal_busy 保留：请求已在门户线程上执行，无法中断，结束时仍会回到 _portal_finished
+        if self._own_executors and self._executors is not None:
+            self._executors.shutdown()
+            self._executors = None
+
+    def _portal_deadline(self):
+        try:
+            return max(1.0, float(self._cfg_getter().get("portal_deadline_sec", 30.0)))
+        except Exception:
+            return 30.0
+
+    def _run_portal(self, fn, on_done, track=True):
+        """
+        把一次门户操作排进门户线程；on_done(结果, 异常) 在事件循环线程调用。
+        时限从排队时算起；超时后放弃等待（请求本身由 HTTP 超时兜底），门户线程空出来之前不执行下一项。
+        track=True 表示当前阶段在等它的结果。
+        """
+        def done(result, error):
+            if self._portal_job is job:
+                self._portal_job = None
+            on_done(result, error)
+        job = _Job(self._loop, fn, self._bind_epoch(done), deadline_sec=self._portal_deadline())
+        job.on_finish = lambda: self._portal_finished(job)
+        if track:
+            self._portal_job = job
+        job.arm()
+        self._portal_queue.append(job)
+        self._pump_portal()
+
+    def _pump_portal(self):
+        while self._portal_busy is None and self._portal_queue and self._executors is not None:
+            job = self._portal_queue.popleft()
+            if job.done:
+                continue  # 排队期间已超时或被取消
+            self._portal_busy = job
+            if not job.submit(self._executors.portal):
+                self._portal_busy = None
+
+    def _portal_finished(self, job):
+        if self._portal_busy is not job:
+            return
+        self._portal_busy = None
+        if not self._running:
+            self._main.close_session()  # 停止时仍在执行的请求结束了，此时才能关闭会话
+            return
+        if self._portal_stale:
+            self._portal_stale = False
+            self._open_portal_session()
+        self._pump_portal()
+        self._reopen_portal_if_pending()
+
+    def _probe_chain(self, hosts, timeout_ms, on_done, during=None):
+        """
+        按 probe_mode 在探测线程池上探测 hosts；任一成功即判定可达，并结束其余探测。
+        完成后在事件循环线程调用 on_done(是否可达, 命中的 host 或最后一个尝试的 host, 各目标结果)，
+        各目标结果为 {host: (状态, 耗时毫秒)}，状态为 'ok' / 'fail' / 'cancel'。
+        parallel：所有目标同时探测，全部失败时总耗时约为一次超时；serial：依次探测。
+        during：门户操作进行中的旁路探测所在阶段（只用于记录）。
+        """
+        mode = str(self._cfg_getter().get("probe_mode", "parallel")).lower()
+        hosts = self._unique_hosts(hosts)
+        phase = during or self._phase
+        on_done = self._bind_epoch(on_done)
+        t0 = time.monotonic()
+        stats = {}
+        pending = {}  # host -> _Job
+        state = {'done': False, 'next': 0}
+
+        def settle(ok, hit):
+            state['done'] = True
+            for job in pending.values():
+                job.cancel()
+            pending.clear()
+            elapsed = time.monotonic() - t0
+            for h in hosts:
+                stats.setdefault(h, ('cancel', elapsed * 1000.0))
+            self._record_chain(ok, hit, stats, mode, phase, elapsed, during)
+            on_done(ok, hit, stats)
+
+        def launch_next():
+            h = hosts[state['next']]
+            state['next'] += 1
+            cancel = _ProbeCancel()
+            started = time.monotonic()
+
+            def done(result, error):
+                pending.pop(h, None)
+                if state['done']:
+                    return
+                ok, rtt = result if error is None else (False, None)
+                stats[h] = ('ok', rtt) if ok else ('fail', (time.monotonic() - started) * 1000.0)
+                if ok:
+                    settle(True, h)
+                elif state['next'] < len(hosts):
+                    launch_next()
+                elif not pending:
+                    settle(False, hosts[-1])
+            # 超时兜底：ping 子进程 / socket 卡住时强制结束
+            job = _Job(self._loop, lambda: self._ping_once(h, timeout_ms, cancel=cancel), self._bind_epoch(done),
+                       deadline_sec=timeout_ms / 1000.0 + 2.0, on_cancel=cancel.cancel)
+            pending[h] = job
+            if self._executors is None or not job.submit(self._executors.probe):
+                pending.pop(h, None)
+                state['done'] = True  # 线程池已关闭：监控正在停止
+
+        if not hosts:
+            settle(False, None)
+            return
+        self._configure_probe()
+        if mode == "serial":
+            launch_next()
+        else:
+            while state['next'] < len(hosts) and not state['done']:
+                launch_next()
+
+    def _record_chain(self, ok, hit, stats, mode, phase, elapsed, during=None):
+        METRICS.observe('campus_probe_chain_seconds', elapsed, mode=mode, phase=phase,
+                        result='ok' if ok else 'fail')
+        # 掉线时长：首次探测失败 → 首次探测成功（含认证后的校验）
+        if ok:
+            METRICS.outage_end(self.name)
+        else:
+            METRICS.outage_begin(self.name)
+        if self.history is not None:
+            self.history.add(time.time(), hit, stats.get(hit, (None, None))[1] if ok else None, ok)
+        fields = {'during': during} if during else {}
+        self._event('probe', ok=ok, hit=hit, mode=mode,
+                    targets={h: [st, round(ms, 1) if ms is not None else None] for h, (st, ms) in stats.items()},
+                    **fields)
+        rtt = stats.get(hit, (None, None))[1] if ok else None
+        self._last_probe = {'at': time.time(), 'ok': ok, 'hit': hit, 'rtt_ms': rtt, 'during': during}
+        if during is None:
+            self._online = ok
+        self._publish_status('probe')
+
+    def _side_probe(self):
+        """等门户返回期间按快速复查间隔继续探测，状态与曲线保持实时"""
+        self._timer.start(self._scheduler.fast_sec)
+        if self._side_probing or self._cycle is None:
+            return
+        self._side_probing = True
+        phase = self._phase
+
+        def done(ok, hit, stats):
+            self._side_probing = False
+            self._emit(self._on_phase, self.phase_snapshot())
+            if not ok or self._phase != phase:
+                return
+            if phase == 'classify' and self._portal_job is not None:
+                # 还没判断出原因网络就恢复了：不必再等门户
+                self._portal_job.cancel()
+                self._portal_job = None
+                self._log(f"门户状态检查尚未返回，外网已恢复（ping {hit} 成功）")
+                self._upstream_since = None
+                self._upstream_reauthed = False
+                self._finish('ok')
+            elif not self._cycle.get('side_ok'):
+                # 认证 / 下线会改动会话，必须等它返回再继续
+                self._cycle['side_ok'] = True
+                self._log(f"外网已可达（ping {hit} 成功），等待{self.PHASE_NAMES[phase]}请求返回")
+        self._probe_chain(self._cycle['hosts'], self._cycle['timeout_ms'], done, during=phase)
+
+    def _fmt_probe_stats(self, stats):
+        """日志用：www.baidu.com 23ms / 223.5.5.5 失败(1502ms) / 119.29.29.29 已取消"""
+        parts = []
+        for h, (status, ms) in stats.items():
+            if status == 'ok':
+                parts.append(f"{h} {ms:.0f}ms")
+            elif status == 'fail':
+                parts.append(f"{h} 失败({ms:.0f}ms)")
+            else:
+                parts.append(f"{h} 已取消")
+        return " / ".join(parts)
+
+    # —— 检测 / 认证状态机：每一步由单次定时器驱动，等待期间不阻塞事件循环 —— #
+    PHASE_NAMES = {
+        'idle': '空闲',
+        'probe': '检测外网',
+        'classify': '判断掉线原因',
+        'login': '认证',
+        'verify_wait': '等待校验',
+        'verify': '认证后校验',
+        'logout': '下线',
+        'retry_wait': '等待重试',
+        'relogin': '重试认证',
+        'refresh': '计划内重新认证',
+        'stopped': '已停止',
+    }
+    WAIT_PHASES = ('verify_wait', 'retry_wait')
+    # 等门户返回的阶段：按快速复查间隔继续探测外网（不含计划内重新认证，那时网络本来就是通的）
+    SIDE_PROBE_PHASES = ('classify', 'login', 'logout', 'relogin')
+
+    def _enter(self, phase, delay_sec=None):
+        """切换阶段并累计上一阶段耗时；delay_sec 不为 None 时在该延迟后执行此阶段"""
+        now = time.monotonic()
+        if self._phase_entered_at is not None:
+            spent = now - self._phase_entered_at
+            self._phase_totals[self._phase] = self._phase_totals.get(self._phase, 0.0) + spent
+        self._phase = phase
+        self._phase_entered_at = now
+        self._step_timer.stop()
+        if delay_sec is not None:
+            self._step_timer.start(delay_sec)
+        if phase in self.SIDE_PROBE_PHASES:
+            self._timer.start(self._scheduler.fast_sec)
+        elif phase != 'idle':
+            self._timer.stop()
+        self._emit(self._on_phase, self.phase_snapshot())
+        self._publish_status('phase')
+
+    def phase_snapshot(self):
+        now = time.monotonic()
+        totals = dict(self._phase_totals)
+        elapsed = 0.0
+        if self._phase_entered_at is not None:
+            elapsed = now - self._phase_entered_at
+            totals[self._phase] = totals.get(self._phase, 0.0) + elapsed
+        busy = self._portal_busy
+        return {
+            'phase': self._phase,
+            'phase_name': self.PHASE_NAMES.get(self._phase, self._phase),
+            'elapsed_sec': elapsed,
+            'totals_sec': totals,
+            # 正在执行的门户请求已等待的秒数（None = 门户空闲）
+            'portal_wait_sec': None if busy is None or busy.started_at is None else now - busy.started_at,
+        }
+
+    def _log_gate_change(self):
+        snap = self._main.gate.pop_change()
+        if snap is not None:
+            self._event('portal_gate', state=snap['state'], reason=snap['last_failure'])
+            if snap['state'] == 'open':
+                self._log(f"门户请求已熔断（最近失败：{snap['last_failure']}），"
+                          f"{snap['retry_after_sec']:.0f} 秒后放行一个试探请求", 'WARN')
+            elif snap['state'] == 'closed':
+                self._log("门户请求已恢复正常")
+        snap = self._main.login_breaker.pop_change()
+        if snap is not None:
+            self._event('login_breaker', state=snap['state'], reason=snap['last_failure'])
+            if snap['state'] == 'open':
+                self._log(f"登录连续 {snap['failures']} 次被拒（{snap['last_failure']}），暂停登录，"
+                          f"{snap['retry_after_sec']:.0f} 秒后再试一次", 'WARN')
+            elif snap['state'] == 'closed':
+                self._log("登录已恢复正常")
+
+    def portal_snapshot(self):
+        """共用闸门的状态，login 为本账号的登录熔断状态"""
+        snap = self._main.gate.snapshot()
+        snap['login'] = self._main.login_breaker.snapshot()
+        return snap
+
+    def _finish(self, outcome):
+        self._log_gate_change()
+        self._enter('idle')
+        self._reopen_portal_if_pending()
+        self._schedule_next(outcome)
+
+    def _reopen_portal_if_pending(self):
+        """门户地址 / 连接参数已变：等门户线程空闲后再重建会话"""
+        if self._portal_pending and self._phase == 'idle' and self._portal_busy is None and not self._portal_queue:
+            self._portal_pending = False
+            self._open_portal_session()
+
+    # —— 配置热加载：只把变化的项交给受影响的部件，进行中的探测与门户会话不中断 —— #
+    RELOAD_GROUPS = (
+        ('probe', ('check_host', 'fallback_check_host', 'tertiary_check_host', 'ping_timeout_ms',
+                   'probe_mode', 'probe_engine', 'portal_deadline_sec', 'post_login_check_host', 'post_login_fallback_host',
+                   'post_login_tertiary_host', 'post_login_ping_timeout_ms', 'reconnect_wait_sec',
+                   'post_login_check_delay_sec', 'outage_classify', 'gateway_host',
+                   'upstream_reauth_after_sec')),
+        ('schedule', ('check_interval_sec', 'steady_interval_sec', 'steady_after_sec', 'fast_recheck_sec',
+                      'fast_recheck_count', 'portal_backoff_max_sec', 'schedule_jitter')),
+        ('credentials', ('user', 'pwd', 'type')),
+        ('portal', ('portal_url', 'auth_url', 'http_pool_size', 'http_connect_timeout_sec',
+                    'http_read_timeout_sec', 'http_post_timeout_sec', 'http_retries',
+                    'source_address', 'bind_interface')),
+        ('context', ('login_context_ttl_sec', 'login_context_refresh_sec', 'smart_login')),
+        ('events', ('event_driven_check',)),
+        ('journal', ('journal_enabled', 'journal_segment_kb', 'journal_max_segments')),
+        ('metrics', ('metrics_port',)),
+        ('dns', ('dns_cache', 'dns_cache_ttl_sec', 'dns_cache_max_stale_sec')),
+        ('gate', ('portal_max_concurrent', 'portal_rate_per_sec', 'portal_burst', 'portal_breaker_failures',
+                  'portal_breaker_open_sec', 'portal_breaker_open_max_sec')),
+        ('session', ('session_refresh', 'session_max_age_sec', 'session_refresh_margin_sec',
+                     'session_quiet_hours', 'session_flow_warn_mb')),
+    )
+    RELOAD_NAMES = {
+        'probe': '检测参数（下一轮生效）',
+        'schedule': '检测间隔',
+        'credentials': '账号',
+        'portal': '门户连接',
+        'context': '登录上下文',
+        'events': '网络事件订阅',
+        'journal': '事件日志',
+        'metrics': '指标端口',
+        'dns': 'DNS 缓存',
+        'gate': '门户限速与熔断',
+        'session': '会话刷新',
+    }
+
+    def reload(self, old_cfg):
+        """
+        cfg_getter 已返回新配置后调用，old_cfg 为修改前的配置。
+        返回受影响的分组名列表；未运行时无需处理（下次 start 会重新读取）。
+        """
+        new_cfg = self._cfg_getter()
+        changed = {k for k in set(old_cfg) | set(new_cfg) if old_cfg.get(k) != new_cfg.get(k)}
+        groups = [g for g, keys in self.RELOAD_GROUPS if changed.intersection(keys)]
+        if 'probe_workers' in changed and self._own_executors and self._running:
+            # 探测线程池随 start() 创建，在途探测不能中途换池（多账号时由 AccountPool 提示）
+            self._log("probe_workers 需停止并重新开始监控后生效", 'WARN')
+        if not groups or not self._running:
+            return groups
+        for g in groups:
+            handler = getattr(self, '_reload_' + g, None)
+            if handler is not None:
+                handler(new_cfg)
+        self._log("配置已热加载：" + "、".join(self.RELOAD_NAMES[g] for g in groups))
+        self._event('reload', groups=groups)
+        return groups
+
+    def _reload_schedule(self, cfg):
+        self._scheduler.configure(cfg)
+        if self._phase == 'idle' and self._timer.is_active():
+            left = self._scheduler.reschedule()
+            if left is not None:
+                self._timer.start(left)
+            self._emit(self._on_schedule, self._scheduler.snapshot())
+
+    def _reload_credentials(self, cfg):
+        self._main.context.invalidate()
+        if self._cycle is not None:
+            # 本轮尚未执行的认证 / 重试改用新账号
+            self._cycle.update(user=cfg.get("user", ""), pwd=cfg.get("pwd", ""), type=cfg.get("type", "校园网"))
+
+    def _reload_portal(self, cfg):
+        self._main.context.invalidate()
+        self._portal_pending = True
+        self._reopen_portal_if_pending()
+
+    def _reload_context(self, cfg):
+        self._apply_context_cfg()
+
+    def _reload_events(self, cfg):
+        if cfg.get("event_driven_check", True):
+            if self._netlink is None:
+                self._start_net_events()
+        else:
+            self._stop_net_events()
+
+    def _reload_journal(self, cfg):
+        if self._shared_journal is None:
+            self._close_journal()
+            self._open_journal()
+
+    def _reload_metrics(self, cfg):
+        self._stop_metrics_server()
+        self._start_metrics_server()
+
+    def _reload_gate(self, cfg):
+        if self._own_gate:
+            self._main.gate.configure_from(cfg)
+        self._main.login_breaker.configure_from(cfg)
+
+    def _reload_dns(self, cfg):
+        self._apply_dns_cfg()
+
+    def _reload_session(self, cfg):
+        self._session_due = None
+        self._session_timer.stop()
+        self._plan_session_refresh()
+
+    def _tick(self):
+        if not self._running:
+            return
+        if self._phase != 'idle':
+            # 一轮认证流程进行中：处于等待阶段则提前进入下一步，等门户返回时继续探测，否则忽略
+            if self._phase in self.WAIT_PHASES:
+                self._step_timer.start(0)
+            elif self._phase in self.SIDE_PROBE_PHASES:
+                self._side_probe()
+            return
+        self._timer.stop()
+        self._cycle = self._read_cycle_cfg()
+        self._enter('probe', 0)
+
+    def _step(self):
+        if not self._running:
+            return
+        handler = getattr(self, '_on_' + self._phase, None)
+        if handler is not None:
+            handler()
+
+    def _read_cycle_cfg(self):
+        """一轮流程开始时读取检测与认证参数"""
+        cfg = self._cfg_getter()
+        # 读取检测参数（三级链：主→备→第三）
+        primary = (cfg.get("check_host") or "www.baidu.com").strip()
+        fallback = (cfg.get("fallback_check_host") or "223.5.5.5").strip()
+        tertiary = (cfg.get("tertiary_check_host") or "119.29.29.29").strip()
+        try:
+            tout = int(cfg.get("ping_timeout_ms", 1500))
+        except Exception:
+            tout = 1500
+        try:
+            post_tout = int(cfg.get("post_login_ping_timeout_ms") or tout)
+        except Exception:
+            post_tout = tout
+        try:
+            wait_sec = float(cfg.get("reconnect_wait_sec", 5.0))
+        except Exception:
+            wait_sec = 5.0
+        try:
+            verify_delay = max(0.0, float(cfg.get("post_login_check_delay_sec", 3.0)))
+        except Exception:
+            verify_delay = 3.0
+        try:
+            upstream_reauth = max(0.0, float(cfg.get("upstream_reauth_after_sec", 600.0)))
+        except Exception:
+            upstream_reauth = 600.0
+        return {
+            'hosts': [primary, fallback, tertiary],
+            'timeout_ms': tout,
+            'post_hosts': [
+                (cfg.get("post_login_check_host") or primary).strip(),
+                (cfg.get("post_login_fallback_host") or fallback).strip(),
+                (cfg.get("post_login_tertiary_host") or tertiary).strip(),
+            ],
+            'post_timeout_ms': post_tout,
+            'wait_sec': wait_sec,
+            'verify_delay_sec': verify_delay,
+            'classify': bool(cfg.get("outage_classify", True)),
+            'gateway': (cfg.get("gateway_host") or "").strip(),
+            'upstream_reauth_sec': upstream_reauth,
+            'portal_res': None,   # 判断掉线原因时取得的门户响应，认证时复用
+            'user': cfg.get("user", ""),
+            'pwd': cfg.get("pwd", ""),
+            'type': cfg.get("type", "校园网"),
+        }
+
+    def _record_login(self, state, info):
+        """认证结果回到监控线程后记录（事件日志、指标、会话信息）"""
+        path = self._main.last_login_path or ''
+        round_trips = self._main.last_login_round_trips or 0
+        self._event('login', ok=bool(state), message=info, path=path, round_trips=round_trips)
+        METRICS.inc('campus_logins_total', result='ok' if state else 'fail', path=path)
+        METRICS.inc('campus_login_round_trips_total', round_trips, path=path)
+        self._last_login = {'at': time.time(), 'ok': bool(state), 'message': info, 'path': path,
+                            'round_trips': round_trips}
+        self._publish_status('login')
+        if state:
+            # 新会话：旧的会话信息作废，下一次网络正常的检测后立即重新读取
+            self._session_login_at = time.monotonic()
+            self._main.session_info = None
+            self._ctx_refreshed_at = None
+            self._session_due = None
+            self._session_deadline_at = None
+            self._session_timer.stop()
+
+    def _start_login(self, on_done):
+        """在门户线程上认证；完成后在监控线程调用 on_done(state, info, 异常)"""
+        c = self._cycle
+        portal_res = c.pop('portal_res', None)
+
+        def work():
+            return self._main.login(user=c['user'], pwd=c['pwd'], type=c['type'], portal_res=portal_res)
+
+        def done(result, error):
+            if error is not None:
+                self._event('error', op='login', error=str(error))
+                on_done(None, None, error)
+                return
+            state, info = result
+            self._record_login(state, info)
+            on_done(state, info, None)
+        self._run_portal(work, done)
+
+    def _wait_then_verify(self):
+        hosts = " / ".join(self._cycle['post_hosts'])
+        delay = self._cycle['verify_delay_sec']
+        self._log(f"认证成功，{delay:g} 秒后检查外网连通性（{hosts}）...")
+        self._enter('verify_wait', delay)
+
+    # 1) 先按三级 ping 检测外网是否可达
+    def _on_probe(self):
+        self._probe_chain(self._cycle['hosts'], self._cycle['timeout_ms'], self._on_probe_result)
+
+    def _on_probe_result(self, ok, hit, stats):
+        if ok:
+            self._log(f"网络正常 | ping {hit} 成功（{self._fmt_probe_stats(stats)}）")
+            self._upstream_since = None
+            self._upstream_reauthed = False
+            self._refresh_dns()
+            self._schedule_context_refresh()
+            self._finish('ok')
+            return
+        if self._cycle['classify']:
+            self._log(f"外网不通（{self._fmt_probe_stats(stats)}），检查门户状态...", 'WARN')
+            self._enter('classify', 0)
+            return
+        self._log(f"外网不通（{self._fmt_probe_stats(stats)}），尝试认证校园网...", 'WARN')
+        self._enter('login', 0)
+
+    # 1.5) 判断掉线原因：只有门户显示未认证才认证；上游中断、门户 / 网关不可达时不折腾会话
+    def _on_classify(self):
+        c = self._cycle
+        self._classifier.gateway = c['gateway']
+        self._run_portal(lambda: self._classifier.classify(c['timeout_ms']), self._on_classify_result)
+
+    def _on_classify_result(self, result, error):
+        c = self._cycle
+        after_login = c.get('after_login', False)
+        kind, res = result if error is None else ('portal_down', None)
+        self._event('classify', cause=kind, after_login=after_login)
+        METRICS.inc('campus_outage_class_total', kind=kind)
+        name = OutageClassifier.KIND_NAMES[kind]
+        if kind == 'unauth':
+            c['portal_res'] = res
+            if after_login:
+                self._log(f"认证后门户仍显示{name}，稍后重试认证", 'WARN')
+                self._log(f"等待 {c['wait_sec']} 秒后再重试认证...")
+                self._enter('retry_wait', c['wait_sec'])
+            else:
+                self._log(f"门户显示{name}，开始认证...")
+                self._enter('login', 0)
+            return
+        if kind == 'upstream':
+            now = time.monotonic()
+            if self._upstream_since is None:
+                self._upstream_since = now
+            lasted = now - self._upstream_since
+            if (not after_login and not self._upstream_reauthed and c['upstream_reauth_sec'] > 0
+                    and lasted >= c['upstream_reauth_sec']):
+                # 持续太久：可能是门户残留的失效会话，重新认证一次（本次中断内只试一次）
+                self._upstream_reauthed = True
+                c['portal_res'] = res
+                self._log(f"{name}已持续 {_fmt_duration(lasted)}，尝试重新认证一次...", 'WARN')
+                self._enter('login', 0)
+                return
+            self._log(f"{name}（已持续 {_fmt_duration(lasted)}），不重新认证，等待恢复", 'WARN')
+            self._finish('upstream')
+            return
+        if error is not None:
+            self._log(f"门户状态检查异常：{error}", 'WARN')
+        self._log(f"{name}，稍后再检测", 'WARN')
+        self._finish('portal_down')
+
+    # 2) 不通则尝试认证（认证前先下线的逻辑在 Main.login() 内部已实现）
+    def _on_login(self):
+        self._start_login(self._on_login_result)
+
+    def _on_login_result(self, state, info, error):
+        self._after_login(state, info, error, "认证")
+
+    def _after_login(self, state, info, error, what):
+        """认证 / 重试认证的结果：成功则等待后校验，失败按原因交给调度器（rejected / fail / portal_down）"""
+        if isinstance(error, PortalUnavailable) and error.reason == 'auth':
+            self._log(f"{what}未执行：{error}", 'WARN')
+            self._finish('rejected')
+            return
+        if error is not None:
+            self._log(f"{what}异常：{error}", 'ERROR')
+            self._finish('portal_down')
+            return
+        self._log(f"{what}结果：{info}{self._login_path_note()}", 'INFO' if state else 'WARN')
+        if not state:
+            # 门户给出了与登录参数无关的拒绝理由（密码错误、欠费等）：退避，不按快速复查反复提交
+            self._finish('rejected' if self._main.rejected_by_portal(info) else 'fail')
+            return
+        self._wait_then_verify()
+
+    def _on_verify_wait(self):
+        self._enter('verify', 0)
+
+    # 3) 若认证成功但外网仍不通 → 判断原因（或下线、等待、重试认证），直到通或停止
+    def _on_verify(self):
+        c = self._cycle
+        self._probe_chain(c['post_hosts'], c['post_timeout_ms'], self._on_verify_result)
+
+    def _on_verify_result(self, ok, hit, stats):
+        c = self._cycle
+        if ok:
+            self._log(f"外网连通性正常（{hit} 可达 | {self._fmt_probe_stats(stats)}）")
+            self._refresh_dns()
+            self._finish('ok')
+            return
+        if c['classify']:
+            self._log("外网仍不可达，检查门户状态...", 'WARN')
+            c['after_login'] = True
+            self._enter('classify', 0)
+            return
+        self._log("外网仍不可达，执行下线并重试认证...", 'WARN')
+        self._enter('logout', 0)
+
+    def _on_logout(self):
+        self._run_portal(self._main.logout, self._on_logout_result)
+
+    def _on_logout_result(self, result, error):
+        if error is not None:
+            self._event('error', op='logout', error=str(error))
+            self._log(f"下线异常：{error}", 'ERROR')
+        else:
+            state, info = result
+            self._event('logout', ok=bool(state), message=info)
+        wait_sec = self._cycle['wait_sec']
+        self._log(f"等待 {wait_sec} 秒后再重试认证...")
+        self._enter('retry_wait', wait_sec)
+
+    def _on_retry_wait(self):
+        self._enter('relogin', 0)
+
+    def _on_relogin(self):
+        self._start_login(self._on_relogin_result)
+
+    def _on_relogin_result(self, state, info, error):
+        self._after_login(state, info, error, "重试认证")
+
+    # 会话快到期：趁网络正常时先下线再立即认证（上下文已缓存时只需一次 POST），不等门户把我们踢掉
+    def _on_refresh(self):
+        c = self._cycle
+
+        def work():
+            self._main.get_alldata()
+            if not self._main.session_info.online:
+                return None
+            self._main.logout()
+            return self._main.login(user=c['user'], pwd=c['pwd'], type=c['type'])
+        self._run_portal(work, self._on_refresh_result)
+
+    def _on_refresh_result(self, result, error):
+        c = self._cycle
+        if error is not None:
+            self._event('refresh', ok=False, error=str(error))
+            METRICS.inc('campus_session_refresh_total', result='error')
+            self._log(f"计划内重新认证异常：{error}", 'ERROR')
+            self._enter('probe', 0)
+            return
+        if result is None:
+            self._log("会话已不在线，转入检测流程", 'WARN')
+            self._enter('probe', 0)
+            return
+        state, info = result
+        self._record_login(state, info)
+        self._event('refresh', ok=bool(state), message=info)
+        METRICS.inc('campus_session_refresh_total', result='ok' if state else 'fail')
+        self._log(f"计划内重新认证结果：{info}{self._login_path_note()}", 'INFO' if state else 'WARN')
+        if not state:
+            self._enter('probe', 0)  # 已下线但没认证上：按掉线处理
+            return
+        hosts = " / ".join(c['post_hosts'])
+        self._log(f"{c['verify_delay_sec']:g} 秒后检查外网连通性（{hosts}）...")
+        self._enter('verify_wait', c['verify_delay_sec'])
+
+# -----------------------------
+# 多账号监控：N 个账号分摊到固定数量的事件循环线程上，共用门户闸门、事件日志、指标端口与 netlink 订阅
+# -----------------------------
+def account_profiles(cfg):
+    """
+    读取 config.json 的 accounts 列表，返回 [(账号名, 覆盖项), ...]。
+    每项至少含 user；其余键覆盖全局配置，如 pwd / type / source_address / bind_interface / check_host。
+    """
+    out = []
+    names = set()
+    for i, item in enumerate(cfg.get("accounts") or []):
+        if not isinstance(item, dict) or not item.get("user"):
+            continue
+        name = str(item.get("name") or item["user"])
+        if name in names:
+            name = f"{name}#{i + 1}"
+        names.add(name)
+        overrides = {k: v for k, v in item.items() if k != "name"}
+        out.append((name, overrides))
+    return out
+
+class AccountPool():
+    # 每个账号的 Monitor 不单独开指标端口与 netlink 订阅，由池统一负责
+    POOL_OVERRIDES = {"metrics_port": 0, "event_driven_check": False}
+
+    def __init__(self, cfg_getter, on_log_batch=None, on_schedule=None, on_phase=None, on_status=None):
+        """
+        回调均在工作线程中调用：
+          on_log_batch([LogRecord, ...]) / on_schedule(账号名, dict) / on_phase(账号名, dict)
+          on_status(账号名, dict)：Monitor.status_snapshot()；账号被移除时为 (账号名, None)
+        """
+        self._cfg_getter = cfg_getter
+        self._on_log_batch = on_log_batch
+        self._on_schedule = on_schedule
+        self._on_phase = on_phase
+        self._on_status = on_status
+        self._running = False
+        self._loops = []
+        self._threads = []
+        self._monitors = {}  # 账号名 -> (所在事件循环, Monitor)
+        self._overrides = {}  # 账号名 -> 覆盖项（热加载时原地替换）
+        # 保护 _monitors：reload / stop 在调用线程里增删，netlink 分发与控制命令在其他线程里遍历
+        self._lock = threading.RLock()
+        self._gate = None
+        self._executors = None
+        self._journal = None
+        self._metrics_server = None
+        self._netlink = None
+        self._netlink_fd = None
+
+    @property
+    def running(self):
+        return self._running
+
+    def _profile_cfg(self, cfg, overrides):
+        cfg = dict(cfg)
+        cfg.update(overrides)
+        cfg.update(self.POOL_OVERRIDES)
+        return cfg
+
+    def _profile_cfg_getter(self, name):
+        return lambda: self._profile_cfg(self._cfg_getter(), self._overrides.get(name, {}))
+
+    def _add_monitor(self, name, overrides, loop):
+        self._overrides[name] = overrides
+        monitor = Monitor(
+            self._profile_cfg_getter(name), loop,
+            on_log_batch=self._on_log_batch,
+            on_schedule=self._bind_callback(self._on_schedule, name),
+            on_phase=self._bind_callback(self._on_phase, name),
+            on_status=self._bind_callback(self._on_status, name),
+            name=name, journal=self._journal, gate=self._gate, executors=self._executors
+        )
+        with self._lock:
+            self._monitors[name] = (loop, monitor)
+        loop.call_soon_threadsafe(monitor.start)
+
+    def _log(self, message, level='INFO'):
+        if self._on_log_batch is not None:
+            self._on_log_batch([LogRecord(time.time(), level, '', message)])
+
+    def start(self):
+        import asyncio
+        if self._running:
+            return
+        cfg = self._cfg_getter()
+        profiles = account_profiles(cfg)
+        if not profiles:
+            raise ValueError("accounts 中没有可用账号")
+        try:
+            workers = max(1, int(cfg.get("account_workers", 4)))
+        except Exception:
+            workers = 4
+        workers = min(workers, len(profiles))
+        self._gate = PortalGate()
+        self._gate.configure_from(cfg)
+        # 探测线程按 probe_workers 封顶，账号多于线程时探测任务排队（各自有截止时间）；
+        # 门户线程数与闸门并发上限一致，多出来的也只会在闸门前排队
+        try:
+            probe_workers = max(1, int(cfg.get("probe_workers", 4)))
+        except Exception:
+            probe_workers = 4
+        self._executors = MonitorExecutors(probe_workers, self._gate.max_concurrent)
+        self._open_journal(cfg)
+        self._start_metrics_server(cfg)
+
+        for i in range(workers):
+            loop = asyncio.new_event_loop()
+            t = threading.Thread(target=loop.run_forever, name=f"campus-accounts-{i}", daemon=True)
+            t.start()
+            self._loops.append(loop)
+            self._threads.append(t)
+        for i, (name, overrides) in enumerate(profiles):
+            self._add_monitor(name, overrides, self._loops[i % workers])
+        self._running = True
+        self._log(f"多账号监控已启动：{len(profiles)} 个账号，{workers} 个工作线程，"
+                  f"门户并发上限 {self._gate.max_concurrent}")
+        if cfg.get("event_driven_check", True):
+            self._start_net_events()
+
+    def stop(self, timeout=5.0):
+        import concurrent.futures
+        if not self._running:
+            return
+        self._running = False
+        self._stop_net_events()
+        futures = []
+        with self._lock:
+            monitors = list(self._monitors.values())
+        for loop, monitor in monitors:
+            fut = concurrent.futures.Future()
+
+            def stop_one(monitor=monitor, fut=fut):
+                try:
+                    monitor.stop()
+                finally:
+                    fut.set_result(None)
+            loop.call_soon_threadsafe(stop_one)
+            futures.append(fut)
+        # 正在探测或认证的账号要等这一步结束
+        concurrent.futures.wait(futures, timeout=timeout)
+        for loop in self._loops:
+            loop.call_soon_threadsafe(loop.stop)
+        for t in self._threads:
+            t.join(timeout)
+        for loop, t in zip(self._loops, self._threads):
+            if not t.is_alive():
+                loop.close()
+        with self._lock:
+            self._monitors, self._overrides = {}, {}
+        self._loops, self._threads = [], []
+        self._executors.shutdown()
+        self._executors = None
+        self._log("多账号监控已停止")
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+            self._metrics_server = None
+
+    def reload(self, old_cfg):
+        """
+        cfg_getter 已返回新配置后调用：增删账号只启停对应的 Monitor，其余账号在各自线程里按差异热加载。
+        """
+        if not self._running:
+            return
+        cfg = self._cfg_getter()
+        old_profiles = dict(account_profiles(old_cfg))
+        new_profiles = dict(account_profiles(cfg))
+        with self._lock:
+            self._reload_monitors(old_cfg, old_profiles, new_profiles)
+
+        def changed(key):
+            return old_cfg.get(key) != cfg.get(key)
+        gate_keys = dict(Monitor.RELOAD_GROUPS)['gate']
+        if any(changed(k) for k in gate_keys):
+            self._gate.configure_from(cfg)
+            self._log(f"门户闸门已调整：并发上限 {self._gate.max_concurrent}，"
+                      f"限速 {self._gate.rate_per_sec:g} 次/秒（突发 {self._gate.burst:g}）")
+        if changed("metrics_port"):
+            if self._metrics_server is not None:
+                self._metrics_server.stop()
+                self._metrics_server = None
+            self._start_metrics_server(cfg)
+        if changed("event_driven_check"):
+            if cfg.get("event_driven_check", True):
+                if self._netlink is None:
+                    self._start_net_events()
+            else:
+                self._stop_net_events()
+        if changed("account_workers") or changed("probe_workers") or any(
+                changed(k) for k in ("journal_enabled", "journal_segment_kb", "journal_max_segments")):
+            self._log("account_workers / probe_workers / 事件日志设置需重启后生效", 'WARN')
+
+    def _reload_monitors(self, old_cfg, old_profiles, new_profiles):
+        """在 _lock 内调用：按新账号列表增删 Monitor，保留的账号投递热加载"""
+        for name in [n for n in self._monitors if n not in new_profiles]:
+            loop, monitor = self._monitors.pop(name)
+            self._overrides.pop(name, None)
+            loop.call_soon_threadsafe(self._remove_monitor, name, monitor)
+            self._log(f"已移除账号 {name}")
+        for name, (loop, monitor) in self._monitors.items():
+            old_effective = self._profile_cfg(old_cfg, old_profiles.get(name, self._overrides[name]))
+            self._overrides[name] = new_profiles[name]
+            loop.call_soon_threadsafe(monitor.reload, old_effective)
+        for name, overrides in new_profiles.items():
+            if name not in self._monitors:
+                # 放到账号最少的工作线程上
+                loads = {id(loop): 0 for loop in self._loops}
+                for loop, _ in self._monitors.values():
+                    loads[id(loop)] += 1
+                loop = min(self._loops, key=lambda lp: loads[id(lp)])
+                self._add_monitor(name, overrides, loop)
+                self._log(f"已添加账号 {name}")
+
+    def _remove_monitor(self, name, monitor):
+        monitor.stop()
+        if self._on_status is not None:
+            self._on_status(name, None)
+
+    def command(self, cmd, name=None):
+        """
+        本机控制接口的命令（任意线程调用）：probe / reauth / start / stop，投递到账号所在的工作线程执行。
+        name 为 None 时作用于全部账号；返回 None 或错误信息。
+        """
+        actions = {'probe': 'probe_now', 'reauth': 'reauth_now', 'start': 'start', 'stop': 'stop'}
+        if cmd not in actions:
+            return f"未知命令：{cmd}"
+        if not self._running:
+            return "多账号监控未运行"
+        with self._lock:
+            monitors = dict(self._monitors)
+        if name is not None:
+            if name not in monitors:
+                return f"没有账号 {name}"
+            monitors = {name: monitors[name]}
+        for loop, monitor in monitors.values():
+            loop.call_soon_threadsafe(getattr(monitor, actions[cmd]))
+        return None
+
+    def _bind_callback(self, callback, name):
+        if callback is None:
+            return None
+        return lambda value: callback(name, value)
+
+    def snapshot(self):
+        """各账号的阶段与调度状态（跨线程读取，仅供展示）"""
+        with self._lock:
+            monitors = list(self._monitors.items())
+        return {
+            name: {'phase': m.phase_snapshot(), 'schedule': m.schedule_snapshot(),
+                   'session': m.session_snapshot()}
+            for name, (_, m) in monitors
+        }
+
+    def gate_snapshot(self):
+        """共用门户闸门的限速 / 熔断状态"""
+        return self._gate.snapshot() if self._gate is not None else None
+
+    def _open_journal(self, cfg):
+        if not cfg.get("journal_enabled", True):
+            return
+        try:
+            self._journal = EventJournal(
+                segment_bytes=int(cfg.get("journal_segment_kb", 1024)) * 1024,
+                max_segments=int(cfg.get("journal_max_segments", 200)),
+                on_error=lambda message: self._log(message, 'WARN')
+            )
+            self._journal.start()
+        except Exception as e:
+            self._journal = None
+            self._log(f"事件日志不可用：{e}", 'WARN')
+
+    def _start_metrics_server(self, cfg):
+        try:
+            port = int(cfg.get("metrics_port", 0))
+        except Exception:
+            port = 0
+        if port <= 0:
+            return
+        server = MetricsServer(METRICS, port)
+        try:
+            server.start()
+        except Exception as e:
+            self._log(f"指标端口 {port} 启动失败：{e}", 'WARN')
+            return
+        self._metrics_server = server
+        self._log(f"指标导出：http://127.0.0.1:{server.port}/metrics")
+
+    # —— 一份 netlink 订阅，事件分发给所有账号，各自去抖 —— #
+    def _start_net_events(self):
+        if not NetlinkMonitor.available():
+            return
+        netlink = NetlinkMonitor()
+        try:
+            fd = netlink.open()
+        except Exception as e:
+            self._log(f"网络事件订阅失败，仅按间隔检测：{e}", 'WARN')
+            return
+        self._netlink, self._netlink_fd = netlink, fd
+        self._loops[0].call_soon_threadsafe(self._loops[0].add_reader, fd, self._on_netlink_readable)
+
+    def _stop_net_events(self):
+        if self._netlink is None:
+            return
+        netlink, fd = self._netlink, self._netlink_fd
+        self._netlink = self._netlink_fd = None
+
+        def close():
+            self._loops[0].remove_reader(fd)
+            netlink.close()
+        self._loops[0].call_soon_threadsafe(close)
+
+    def _on_netlink_readable(self):
+        if self._netlink is None:
+            return
+        events = self._netlink.read_events()
+        if not events:
+            return
+        with self._lock:
+            monitors = list(self._monitors.values())
+        for loop, monitor in monitors:
+            loop.call_soon_threadsafe(monitor.feed_net_events, events)
@@ -0,0 +1,160 @@
+# campusd.py
+# -*- coding: utf-8 -*-
+"""
+无界面守护进程：与托盘程序共用配置与监控状态机（campus_core.Monitor），由 asyncio 事件循环驱动，不导入 Qt。
+日志输出到标准输出，事件照常写入磁盘事件日志。
+
+  python campusd.py                      # 按配置目录下的 config.json 持续监控
+  python campusd.py --config /etc/campus.json --quiet
+  python campusd.py --once               # 只检测（必要时认证）一轮；外网可达时退出码为 0
+config.json 中 accounts 非空时按多账号模式运行（AccountPool），--once 要求所有账号都恢复。
+配置文件修改后自动热加载（config_watch），只影响变化的部分，不重启监控。
+  python campusd.py journal --since 2025-09-01T00:00 --kind login
+  python campusd.py ctl status           # 通过本机控制接口（control_api）查询 / 操作正在运行的守护进程
+"""
+
+import argparse
+import asyncio
+import signal
+import sys
+import threading
+import time
+
+from campus_core import (
+    APP_NAME, Monitor, AccountPool, ConfigWatcher, ControlServer, LogRecord, account_profiles,
+    config_path, load_config, format_log_record, dump_journal, control_address, control_client
+)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="campusd.py", description=f"{APP_NAME}（无界面）")
+    parser.add_argument("--config", help="配置文件路径（默认使用托盘程序的 config.json）")
+    parser.add_argument("--once", action="store_true", help="只执行一轮检测 / 认证后退出")
+    parser.add_argument("--quiet", action="store_true", help="只输出 WARN / ERROR 日志")
+    return parser.parse_args(argv)
+
+
+def write_records(batch, quiet=False):
+    for rec in batch:
+        if quiet and rec.level == 'INFO':
+            continue
+        if rec.level != 'INFO':
+            rec = rec._replace(message=f"{rec.level} {rec.message}")
+        sys.stdout.write(format_log_record(rec) + "\n")
+    sys.stdout.flush()
+
+
+def run(args):
+    path = args.config or config_path()
+    state = {'cfg': load_config(path)}
+    if args.once:
+        state['cfg']["metrics_port"] = 0  # 单轮模式不需要常驻的指标端口
+    pooled = bool(account_profiles(state['cfg']))
+    total = len(account_profiles(state['cfg'])) if pooled else 1
+    loop = asyncio.new_event_loop()
+    lock = threading.Lock()
+    online = {}
+
+    def cfg_getter():
+        return state['cfg']
+
+    def on_log_batch(batch):
+        with lock:  # 多账号时从各工作线程回调
+            write_records(batch, args.quiet)
+
+    def on_schedule(name, snap):
+        # 每轮结束时排期；uptime_sec 不为 None 表示本轮外网可达
+        with lock:
+            online[name] = snap.get('uptime_sec') is not None
+            if args.once and len(online) >= total:
+                loop.call_soon_threadsafe(shutdown)
+
+    server = None
+    on_status = None
+    if not args.once and state['cfg'].get("control_api", True):
+        def command(cmd):
+            if pooled:
+                return lambda account: engine.command(cmd, account)
+
+            def post(account):
+                if cmd in ('probe', 'reauth') and not engine.running:
+                    return "监控未运行"
+                action = {'probe': 'probe_now', 'reauth': 'reauth_now'}.get(cmd, cmd)
+                loop.call_soon_threadsafe(getattr(engine, action))
+            return post
+        server = ControlServer(control_address(state['cfg']),
+                               {cmd: command(cmd) for cmd in ControlServer.COMMANDS})
+        on_status = server.publish
+
+    if pooled:
+        engine = AccountPool(cfg_getter, on_log_batch=on_log_batch, on_schedule=on_schedule,
+                             on_status=on_status)
+    else:
+        engine = Monitor(cfg_getter, loop, on_log_batch=on_log_batch,
+                         on_schedule=lambda snap: on_schedule(None, snap),
+                         on_status=(lambda snap: on_status(None, snap)) if on_status else None)
+
+    def on_config_change(new_cfg):
+        old_cfg = state['cfg']
+        if new_cfg == old_cfg:
+            return
+        if bool(account_profiles(new_cfg)) != pooled:
+            on_log_batch([LogRecord(time.time(), 'WARN', '', "单账号 / 多账号模式切换需重启后生效")])
+            return
+        state['cfg'] = new_cfg
+        engine.reload(old_cfg)
+
+    watcher = None
+    if not args.once and state['cfg'].get("config_watch", True):
+        watcher = ConfigWatcher(path, loop, on_config_change)
+
+    def shutdown():
+        # 监控可能已被控制接口停止，这里只看是否已在退出
+        if state.get('closing'):
+            return
+        state['closing'] = True
+        if watcher is not None:
+            watcher.stop()
+        if server is not None:
+            server.stop()
+        engine.stop()
+        loop.stop()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, shutdown)
+        except (NotImplementedError, AttributeError, ValueError):
+            pass  # Windows：由 KeyboardInterrupt 兜底
+
+    if server is not None:
+        try:
+            server.start()
+        except OSError as e:
+            on_log_batch([LogRecord(time.time(), 'WARN', '', f"本机控制接口未启动：{e}")])
+            server = None
+    engine.start()
+    if watcher is not None:
+        watcher.start()
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        shutdown()
+    finally:
+        loop.close()
+    if args.once:
+        return 0 if online and all(online.values()) else 1
+    return 0
+
+
+def main():
+    if sys.argv[1:2] == ["journal"]:
+        dump_journal(sys.argv[2:], prog="campusd.py journal")
+        return
+    if sys.argv[1:2] == ["ctl"]:
+        control_client(sys.argv[2:], prog="campusd.py ctl")
+        return
+    sys.exit(run(parse_args(sys.argv[1:])))
+
+
+if __name__ == "__main__":
+    main()
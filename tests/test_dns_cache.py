@@ -0,0 +1,78 @@
+import os
+import socket
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import campus_core
+from campus_core import DnsCache
+
+
+@pytest.fixture
+def resolver(monkeypatch):
+    """假解析：answers 中的域名返回对应 IP，其余解析失败"""
+    answers = {'probe.example': '10.0.0.1'}
+    calls = []
+
+    def getaddrinfo(host, port, family=0, socktype=0, *args):
+        calls.append(host)
+        if host not in answers:
+            raise socket.gaierror('no such host')
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', (answers[host], port or 0))]
+
+    monkeypatch.setattr(campus_core.socket, 'getaddrinfo', getaddrinfo)
+    return answers, calls
+
+
+def age(cache, host, seconds):
+    family, ip, _ = cache._entries[host]
+    cache._entries[host] = (family, ip, time.monotonic() - seconds)
+
+
+def test_literal_and_miss(resolver):
+    cache = DnsCache()
+    assert cache.lookup('10.1.2.3') is None
+    assert cache.lookup('probe.example') is None
+    assert cache.due(['10.1.2.3', 'probe.example', '']) == ['probe.example']
+
+
+def test_hit_within_ttl(resolver):
+    cache = DnsCache(ttl_sec=60)
+    assert cache.resolve('probe.example') == (socket.AF_INET, '10.0.0.1')
+    assert cache.lookup('probe.example') == (socket.AF_INET, '10.0.0.1')
+    assert cache.due(['probe.example']) == []
+
+
+def test_stale_entry_still_served_but_due(resolver):
+    cache = DnsCache(ttl_sec=60, max_stale_sec=600)
+    cache.resolve('probe.example')
+    age(cache, 'probe.example', 120)
+    assert cache.lookup('probe.example') == (socket.AF_INET, '10.0.0.1')
+    assert cache.due(['probe.example']) == ['probe.example']
+    age(cache, 'probe.example', 661)
+    assert cache.lookup('probe.example') is None
+
+
+def test_failed_resolve_keeps_old_entry(resolver):
+    answers, _ = resolver
+    cache = DnsCache(ttl_sec=60)
+    cache.resolve('probe.example')
+    del answers['probe.example']
+    assert cache.resolve('probe.example') is None
+    assert cache.lookup('probe.example') == (socket.AF_INET, '10.0.0.1')
+
+
+def test_refresh_async_resolves_only_due_hosts(resolver):
+    _, calls = resolver
+    cache = DnsCache(ttl_sec=60)
+    cache.resolve('probe.example')
+    calls.clear()
+    cache.refresh_async(['probe.example', 'gone.example'])
+    deadline = time.monotonic() + 2
+    while cache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert calls == ['gone.example']
+    assert 'gone.example' not in cache.snapshot()
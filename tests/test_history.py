@@ -0,0 +1,102 @@
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from campus_core import ProbeHistory, _BucketRing, _SampleRing
+
+T0 = 86400.0 * 20000  # 整天对齐，分钟 / 小时 / 天桶边界都落在 T0 上
+
+
+# -----------------------------
+# 原始样本环
+# -----------------------------
+def test_sample_ring_wraparound_keeps_newest_in_order():
+    ring = _SampleRing(4)
+    for i in range(6):
+        ring.add(T0 + i, i, 10.0 + i, True)
+    assert len(ring) == 4
+    assert ring.oldest() == T0 + 2
+    assert [row[1] for row in ring.rows(T0, T0 + 100)] == [2, 3, 4, 5]
+    assert [row[1] for row in ring.rows(T0 + 3, T0 + 5)] == [3, 4]
+
+
+def test_sample_ring_lower_bound_across_wrap():
+    ring = _SampleRing(5)
+    for i in range(12):
+        ring.add(T0 + i * 10, 0, 1.0, True)
+    assert ring.lower_bound(T0) == 0
+    assert ring.lower_bound(T0 + 75) == 1  # 最旧为 T0+70
+    assert ring.lower_bound(T0 + 110) == 4
+    assert ring.lower_bound(T0 + 1000) == 5
+
+
+def test_sample_ring_clamps_clock_going_back():
+    ring = _SampleRing(3)
+    ring.add(T0 + 10, 0, 1.0, True)
+    ring.add(T0 + 5, 0, float('nan'), False)
+    rows = list(ring.rows(T0, T0 + 100))
+    assert [ts for ts, _, _, _ in rows] == [T0 + 10, T0 + 10]
+    assert rows[1][3] is False and math.isnan(rows[1][2])
+
+
+# -----------------------------
+# 降采样桶
+# -----------------------------
+def test_bucket_ring_aggregates_and_wraps():
+    ring = _BucketRing(60, 2)
+    ring.add(T0 + 1, 10.0, True)
+    ring.add(T0 + 30, 30.0, True)
+    ring.add(T0 + 31, float('nan'), False)
+    ring.add(T0 + 61, float('nan'), False)
+    rows = list(ring.rows(T0, T0 + 120))
+    assert rows[0][:6] == (T0, 3, 2, 20.0, 10.0, 30.0)
+    assert rows[1][:3] == (T0 + 60, 1, 0) and math.isnan(rows[1][3]) and math.isnan(rows[1][4])
+    ring.add(T0 + 125, 5.0, True)
+    assert len(ring) == 2 and ring.oldest() == T0 + 60
+
+
+# -----------------------------
+# ProbeHistory
+# -----------------------------
+def test_history_query_uses_raw_until_wrapped_out():
+    history = ProbeHistory(raw_capacity=10)
+    for i in range(25):
+        history.add(T0 + i, 'www.baidu.com', 5.0, True)
+    assert len(history) == 10
+    res, points = history.query(T0 + 20, T0 + 25)
+    assert res == 'raw' and [p[0] for p in points] == [T0 + 20 + i for i in range(5)]
+    # 起点已被覆盖的原始样本之前：改用分钟桶
+    res, points = history.query(T0, T0 + 25)
+    assert res == 'minute' and points[0][:3] == (T0, 25, 25)
+
+
+def test_history_samples_and_failures():
+    history = ProbeHistory(raw_capacity=4)
+    history.add(T0, 'a', 3.0, True)
+    history.add(T0 + 1, 'b', None, True)  # 成功但没有 RTT：按失败记
+    history.add(T0 + 2, 'a', 4.0, False)
+    rows = history.samples(T0, T0 + 10)
+    assert [(t, ok) for _, t, _, ok in rows] == [('a', True), ('b', False), ('a', False)]
+    assert all(math.isnan(rtt) for _, _, rtt, _ in rows[1:])
+
+
+def test_history_target_table_overflow():
+    history = ProbeHistory(raw_capacity=4)
+    history.MAX_TARGETS = 2
+    history.add(T0, 'first', 1.0, True)
+    history.add(T0 + 1, 'second', 1.0, True)
+    assert [t for _, t, _, _ in history.samples(T0, T0 + 10)] == ['first', '']
+
+
+def test_history_resize_keeps_newest_samples():
+    history = ProbeHistory(raw_capacity=8)
+    for i in range(8):
+        history.add(T0 + i, 't%d' % i, float(i), True)
+    history.resize(3)
+    assert [t for _, t, _, _ in history.samples(T0, T0 + 100)] == ['t5', 't6', 't7']
+    history.resize(6)
+    history.add(T0 + 8, 't8', 8.0, True)
+    assert [t for _, t, _, _ in history.samples(T0, T0 + 100)] == ['t5', 't6', 't7', 't8']
+    assert history.query(T0, T0 + 9)[0] == 'minute'
@@ -0,0 +1,101 @@
+import gzip
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from campus_core import EventJournal, list_journal_segments, read_journal
+
+PAD = 'x' * 200
+
+
+def write_events(journal, events):
+    """按给定时间戳逐条入队（write() 总是取当前时间），每条等写线程取走，多数各成一批"""
+    for e in events:
+        journal._queue.put(e)
+        while not journal._queue.empty():
+            time.sleep(0.001)
+
+
+def run_journal(path, events, **kwargs):
+    journal = EventJournal(path=str(path), segment_bytes=4096, **kwargs)
+    journal.start()
+    write_events(journal, events)
+    journal.close()
+    return journal
+
+
+def events(n, start=1000.0, kind='probe'):
+    return [{'ts': start + i, 'kind': kind, 'n': i, 'pad': PAD} for i in range(n)]
+
+
+def test_rotation_names_segments_by_time_range(tmp_path):
+    run_journal(tmp_path, events(60))
+    segments = list_journal_segments(str(tmp_path))
+    assert len(segments) >= 2
+    first, last, path = segments[0]
+    assert first == 1000.0
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert len(lines) == last - first + 1
+    assert not [n for n in os.listdir(tmp_path) if n.endswith('.tmp')]
+    assert [e['n'] for e in read_journal(path=str(tmp_path))] == list(range(60))
+
+
+def test_prune_keeps_newest_segments(tmp_path):
+    run_journal(tmp_path, events(200), max_segments=2)
+    segments = list_journal_segments(str(tmp_path))
+    assert len(segments) == 2
+    remaining = [e['n'] for e in read_journal(path=str(tmp_path))]
+    assert remaining[-1] == 199 and remaining[0] > 0
+    assert remaining == list(range(remaining[0], 200))
+
+
+def test_read_journal_range_and_kinds(tmp_path):
+    run_journal(tmp_path, events(40) + events(40, start=1040.0, kind='login'))
+    got = list(read_journal(start=1030.0, end=1045.0, path=str(tmp_path)))
+    assert [e['ts'] for e in got] == [1030.0 + i for i in range(16)]
+    logins = list(read_journal(kinds=['login'], path=str(tmp_path)))
+    assert len(logins) == 40 and all(e['kind'] == 'login' for e in logins)
+
+
+def test_read_journal_skips_truncated_line(tmp_path):
+    with open(tmp_path / EventJournal.CURRENT, 'w', encoding='utf-8') as f:
+        f.write('{"ts": 1.0, "kind": "probe"}\n{"ts": 2.0, "ki')
+    assert [e['ts'] for e in read_journal(path=str(tmp_path))] == [1.0]
+
+
+def test_resumes_existing_current_segment(tmp_path):
+    run_journal(tmp_path, events(3))
+    run_journal(tmp_path, events(3, start=2000.0))
+    assert [e['ts'] for e in read_journal(path=str(tmp_path))] == [1000.0, 1001.0, 1002.0,
+                                                                    2000.0, 2001.0, 2002.0]
+
+
+def test_write_failure_reported_once_and_writer_survives(tmp_path):
+    errors = []
+    journal = EventJournal(path=str(tmp_path), on_error=errors.append)
+    append = journal._append
+    failures = [OSError(28, 'No space left on device')] * 2
+    done = threading.Event()
+
+    def flaky(batch):
+        try:
+            if failures:
+                raise failures.pop()
+            append(batch)
+        finally:
+            done.set()
+
+    journal._append = flaky
+    journal.start()
+    for e in events(3):
+        done.clear()
+        journal._queue.put(e)
+        assert done.wait(2)
+    journal.close()
+    assert len(errors) == 1 and 'No space left' in errors[0]
+    assert journal.dropped == 2
+    assert [e['n'] for e in read_journal(path=str(tmp_path))] == [2]
@@ -0,0 +1,97 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from campus_core import LoginContext, Main
+
+
+# -----------------------------
+# LoginContext
+# -----------------------------
+def test_fresh_only_with_query_string_and_matching_service():
+    ctx = LoginContext(ttl_sec=60)
+    assert not ctx.is_fresh()
+    ctx.update(query_string='wlanuserip=1.2.3.4', service='svc', user_index='abc')
+    assert ctx.is_fresh() and ctx.is_fresh('svc')
+    assert not ctx.is_fresh('other')
+
+
+def test_expires_after_ttl():
+    ctx = LoginContext(ttl_sec=60)
+    ctx.update(query_string='q', service='svc')
+    ctx.updated_at = time.monotonic() - 61
+    assert not ctx.is_fresh('svc')
+
+
+def test_update_without_query_string_keeps_timestamp():
+    ctx = LoginContext()
+    ctx.update(query_string='q')
+    stamp = ctx.updated_at
+    ctx.update(user_index='abc')
+    assert ctx.updated_at == stamp and ctx.user_index == 'abc'
+    ctx.update(user_index='')
+    assert ctx.user_index is None
+
+
+def test_invalidate():
+    ctx = LoginContext()
+    ctx.update(query_string='q', service='svc', user_index='abc')
+    ctx.invalidate()
+    assert not ctx.is_fresh()
+    assert (ctx.query_string, ctx.service, ctx.user_index, ctx.age()) == ('', None, None, None)
+
+
+# -----------------------------
+# 缓存路径：只有参数失效 / 在线冲突才作废上下文
+# -----------------------------
+class FakeMain(Main):
+    def __init__(self, info, ok=False):
+        super().__init__()
+        self.posts = []
+        self.fallbacks = 0
+        self._reply = (ok, info)
+        service = self.services['校园网']
+        self.context.update(query_string='q', service=service, user_index='old')
+
+    def _post_login_resolving(self, user, pwd, service, query_string, code):
+        self.posts.append(query_string)
+        ok, self.info = self._reply
+        self.userindex = 'new' if ok else None
+        return ok
+
+    def _login_smart(self, user, pwd, service, code, portal_res=None):
+        self.fallbacks += 1
+        return (False, 'smart')
+
+
+def test_cached_success_is_one_post():
+    main = FakeMain('', ok=True)
+    assert main.login('u', 'p', '校园网') == (True, '认证成功')
+    assert main.posts == ['q'] and main.fallbacks == 0
+    assert main.last_login_path == 'cached'
+    assert main.context.user_index == 'new' and main.context.is_fresh()
+
+
+def test_cached_rejection_keeps_context():
+    main = FakeMain('密码错误')
+    assert main.login('u', 'p', '校园网') == (False, '密码错误')
+    assert main.fallbacks == 0
+    assert main.context.is_fresh()
+
+
+def test_stale_context_falls_back_and_invalidates():
+    main = FakeMain('认证参数已失效，请重新打开认证页')
+    assert main.login('u', 'p', '校园网') == (False, 'smart')
+    assert main.fallbacks == 1
+    assert not main.context.is_fresh()
+
+
+def test_rejected_by_portal():
+    main = Main()
+    assert main.rejected_by_portal('密码错误')
+    assert main.rejected_by_portal('账户欠费')
+    assert not main.rejected_by_portal('')
+    assert not main.rejected_by_portal('queryString 参数无效')
+    assert not main.rejected_by_portal('该账号已在线')
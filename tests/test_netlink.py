@@ -0,0 +1,94 @@
+import os
+import socket
+import struct
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from campus_core import NetlinkMonitor as NL
+
+
+def nlmsg(msg_type, body):
+    """nlmsghdr + 消息体，按 4 字节对齐"""
+    length = 16 + len(body)
+    data = struct.pack('=IHHII', length, msg_type, 0, 0, 0) + body
+    return data + b'\0' * (((length + 3) & ~3) - length)
+
+
+def link(msg_type, index, flags):
+    return nlmsg(msg_type, struct.pack('=BxHiII', socket.AF_UNSPEC, 1, index, flags, 0))
+
+
+def rtattr(rta_type, payload):
+    length = 4 + len(payload)
+    return struct.pack('=HH', length, rta_type) + payload + b'\0' * (((length + 3) & ~3) - length)
+
+
+def addr(msg_type, index, ip, family=socket.AF_INET, scope=0, local=True):
+    prefix = 64 if family == socket.AF_INET6 else 24
+    attrs = rtattr(NL.IFA_ADDRESS, socket.inet_pton(family, ip))
+    if local:
+        attrs += rtattr(NL.IFA_LOCAL, socket.inet_pton(family, ip))
+    return nlmsg(msg_type, struct.pack('=BBBBI', family, prefix, 0, scope, index) + attrs)
+
+
+def route(msg_type, dst_len=0, table=NL.RT_TABLE_MAIN, family=socket.AF_INET):
+    return nlmsg(msg_type, struct.pack('=BBBBBBBBI', family, dst_len, 0, 0, table, 4, 0, 1, 0))
+
+
+UP = NL.IFF_UP | NL.IFF_RUNNING | NL.IFF_LOWER_UP
+
+
+@pytest.fixture
+def nl():
+    return NL()
+
+
+def kinds(events):
+    return [(kind, action, index, address) for kind, action, index, address, _ in events]
+
+
+def test_link_transitions_and_duplicate_updates(nl):
+    data = link(NL.RTM_NEWLINK, 3, UP) + link(NL.RTM_NEWLINK, 3, UP | 0x1000)  # 只多了无关标志位
+    assert kinds(nl._parse(data)) == [('link', 'up', 3, None)]
+    assert kinds(nl._parse(link(NL.RTM_NEWLINK, 3, NL.IFF_UP))) == [('link', 'down', 3, None)]
+    assert kinds(nl._parse(link(NL.RTM_NEWLINK, 3, UP | NL.IFF_DORMANT))) == [('link', 'down', 3, None)]
+    assert kinds(nl._parse(link(NL.RTM_DELLINK, 3, 0))) == [('link', 'del', 3, None)]
+
+
+def test_loopback_ignored(nl):
+    assert nl._parse(link(NL.RTM_NEWLINK, 1, UP | NL.IFF_LOOPBACK)) == []
+
+
+def test_address_new_renew_del(nl):
+    assert kinds(nl._parse(addr(NL.RTM_NEWADDR, 3, '10.1.2.3'))) == [('addr', 'new', 3, '10.1.2.3')]
+    assert kinds(nl._parse(addr(NL.RTM_NEWADDR, 3, '10.1.2.3'))) == [('addr', 'renew', 3, '10.1.2.3')]
+    assert kinds(nl._parse(addr(NL.RTM_DELADDR, 3, '10.1.2.3'))) == [('addr', 'del', 3, '10.1.2.3')]
+    assert kinds(nl._parse(addr(NL.RTM_NEWADDR, 3, '10.1.2.3'))) == [('addr', 'new', 3, '10.1.2.3')]
+
+
+def test_link_removal_forgets_addresses(nl):
+    nl._parse(addr(NL.RTM_NEWADDR, 3, '10.1.2.3'))
+    nl._parse(link(NL.RTM_DELLINK, 3, 0))
+    assert kinds(nl._parse(addr(NL.RTM_NEWADDR, 3, '10.1.2.3'))) == [('addr', 'new', 3, '10.1.2.3')]
+
+
+def test_address_attrs(nl):
+    assert kinds(nl._parse(addr(NL.RTM_NEWADDR, 4, '2001:db8::5', family=socket.AF_INET6))) == \
+        [('addr', 'new', 4, '2001:db8::5')]
+    assert kinds(nl._parse(addr(NL.RTM_NEWADDR, 4, '10.9.9.9', local=False))) == [('addr', 'new', 4, '10.9.9.9')]
+    assert nl._parse(addr(NL.RTM_NEWADDR, 4, 'fe80::1', family=socket.AF_INET6, scope=NL.RT_SCOPE_LINK)) == []
+
+
+def test_default_route_only(nl):
+    data = route(NL.RTM_NEWROUTE) + route(NL.RTM_NEWROUTE, dst_len=24) + route(NL.RTM_DELROUTE, table=255)
+    assert kinds(nl._parse(data)) == [('route', 'new', None, None)]
+    assert kinds(nl._parse(route(NL.RTM_DELROUTE, family=socket.AF_INET6))) == [('route', 'del', None, None)]
+
+
+def test_overrun_and_truncated_messages(nl):
+    data = nlmsg(NL.NLMSG_OVERRUN, b'') + link(NL.RTM_NEWLINK, 5, UP)[:20]
+    assert kinds(nl._parse(data)) == [('link', 'overrun', None, None)]
+    assert nl._parse(struct.pack('=IHHII', 8, NL.RTM_NEWLINK, 0, 0, 0)) == []
@@ -0,0 +1,196 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from campus_core import LoginBreaker, PortalGate, PortalUnavailable
+
+
+def cool_down(breaker):
+    """跳过冷却时间，下一次请求即为试探"""
+    breaker._open_until = time.monotonic() - 1
+
+
+# -----------------------------
+# 令牌桶
+# -----------------------------
+def test_burst_then_throttled():
+    gate = PortalGate(max_concurrent=4, rate_per_sec=0.5, burst=2, max_wait_sec=0.05)
+    for _ in range(2):
+        with gate:
+            pass
+    with pytest.raises(PortalUnavailable) as err:
+        with gate:
+            pass
+    assert err.value.reason == 'throttled'
+    assert err.value.retry_after > 0
+    assert gate.rejected == 1
+
+
+def test_waits_for_refill_within_max_wait():
+    gate = PortalGate(rate_per_sec=50.0, burst=1, max_wait_sec=1.0)
+    with gate:
+        pass
+    t0 = time.monotonic()
+    with gate:
+        pass
+    assert 0.005 < time.monotonic() - t0 < 0.5
+
+
+def test_unlimited_rate():
+    gate = PortalGate(rate_per_sec=0, burst=1, max_wait_sec=0.01)
+    for _ in range(20):
+        with gate:
+            pass
+    assert gate.snapshot()['tokens'] is None
+
+
+# -----------------------------
+# 传输熔断与半开试探
+# -----------------------------
+def open_gate(threshold=2, open_sec=10.0):
+    gate = PortalGate(rate_per_sec=0, failure_threshold=threshold, open_sec=open_sec,
+                      open_max_sec=100.0, max_wait_sec=0.05)
+    for _ in range(threshold):
+        gate.record_transport(False, 'HTTP 502')
+    return gate
+
+
+def test_opens_after_threshold_and_rejects():
+    gate = PortalGate(rate_per_sec=0, failure_threshold=3)
+    gate.record_transport(False)
+    gate.record_transport(False)
+    assert gate.state == 'closed'
+    gate.record_transport(False, 'HTTP 502')
+    assert gate.state == 'open'
+    assert gate.snapshot()['last_failure'] == 'HTTP 502'
+    with pytest.raises(PortalUnavailable) as err:
+        with gate:
+            pass
+    assert err.value.reason == 'open'
+
+
+def test_success_resets_failure_count():
+    gate = PortalGate(rate_per_sec=0, failure_threshold=2)
+    gate.record_transport(False)
+    gate.record_transport(True)
+    gate.record_transport(False)
+    assert gate.state == 'closed'
+
+
+def test_half_open_admits_a_single_trial():
+    gate = open_gate()
+    cool_down(gate)
+    entered, release = threading.Event(), threading.Event()
+
+    def trial():
+        with gate:
+            entered.set()
+            release.wait(2)
+
+    t = threading.Thread(target=trial)
+    t.start()
+    try:
+        assert entered.wait(2)
+        assert gate.state == 'half_open'
+        with pytest.raises(PortalUnavailable) as err:
+            with gate:
+                pass
+        assert err.value.reason == 'throttled'
+    finally:
+        release.set()
+        t.join(2)
+    # 试探结束后才放行下一个
+    with gate:
+        pass
+
+
+def test_trial_success_closes_and_failure_doubles_cooldown():
+    gate = open_gate(open_sec=10.0)
+    cool_down(gate)
+    with gate:
+        gate.record_transport(False, 'timeout')
+    assert gate.state == 'open'
+    assert 15.0 < gate.snapshot()['retry_after_sec'] <= 20.0
+
+    cool_down(gate)
+    with gate:
+        gate.record_transport(True)
+    assert gate.state == 'closed'
+    assert gate.pop_change()['state'] == 'closed'
+    assert gate.pop_change() is None
+
+
+def test_request_admitted_before_open_does_not_free_trial_slot():
+    gate = PortalGate(rate_per_sec=0, failure_threshold=1, open_sec=10.0, max_wait_sec=0.05)
+    old_in, old_out = threading.Event(), threading.Event()
+
+    def old_request():
+        with gate:
+            old_in.set()
+            old_out.wait(2)
+
+    t = threading.Thread(target=old_request)
+    t.start()
+    assert old_in.wait(2)
+    gate.record_transport(False)
+    cool_down(gate)
+    with gate:  # 本线程成为试探请求
+        old_out.set()
+        t.join(2)
+        assert gate._trial == threading.get_ident()
+    assert gate._trial is None
+
+
+# -----------------------------
+# 单账号登录熔断
+# -----------------------------
+def test_login_breaker_threshold():
+    breaker = LoginBreaker(failure_threshold=3, open_sec=10.0, open_max_sec=100.0)
+    for _ in range(2):
+        breaker.record(False, '密码错误')
+        breaker.check()
+    assert breaker.state == 'closed'
+    breaker.record(False, '密码错误')
+    assert breaker.state == 'open'
+    with pytest.raises(PortalUnavailable) as err:
+        breaker.check()
+    assert err.value.reason == 'auth'
+    assert breaker.snapshot()['last_failure'] == '密码错误'
+
+
+def test_login_breaker_trial_backoff_and_reset():
+    breaker = LoginBreaker(failure_threshold=1, open_sec=10.0, open_max_sec=30.0)
+    breaker.record(False)
+    for expected in (20.0, 30.0, 30.0):
+        cool_down(breaker)
+        breaker.check()
+        assert breaker.state == 'half_open'
+        breaker.record(False)
+        assert expected - 1 < breaker.snapshot()['retry_after_sec'] <= expected
+    cool_down(breaker)
+    breaker.check()
+    breaker.record(True)
+    assert breaker.state == 'closed' and breaker.failures == 0
+    breaker.record(False)
+    assert 9.0 < breaker.snapshot()['retry_after_sec'] <= 10.0
+
+
+def test_login_breaker_disabled():
+    breaker = LoginBreaker(failure_threshold=0)
+    for _ in range(10):
+        breaker.record(False)
+        breaker.check()
+    assert breaker.state == 'closed'
+
+
+def test_login_breakers_are_independent():
+    a, b = LoginBreaker(failure_threshold=1), LoginBreaker(failure_threshold=1)
+    a.record(False)
+    with pytest.raises(PortalUnavailable):
+        a.check()
+    b.check()
@@ -0,0 +1,74 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from campus_core import ProbeScheduler
+
+
+@pytest.fixture
+def sched():
+    s = ProbeScheduler()
+    s.configure({"check_interval_sec": 30, "fast_recheck_sec": 2, "fast_recheck_count": 3,
+                 "portal_backoff_max_sec": 60, "steady_after_sec": 600, "schedule_jitter": 0})
+    return s
+
+
+def delays(sched, outcomes):
+    out = []
+    for outcome in outcomes:
+        sched.on_result(outcome)
+        out.append(sched.next_delay())
+    return out
+
+
+def test_fail_rechecks_then_backs_off(sched):
+    assert delays(sched, ['fail'] * 7) == [2, 2, 2, 2, 4, 8, 16]
+    assert sched.state == 'retry' and sched.fail_streak == 7
+
+
+def test_fail_backoff_is_capped(sched):
+    assert delays(sched, ['fail'] * 12)[-1] == 60
+
+
+def test_rejected_backs_off_from_base_interval(sched):
+    assert delays(sched, ['rejected'] * 3) == [30, 60, 60]
+    assert sched.state == 'rejected' and sched.recheck_left == 0
+
+
+def test_rejected_after_fails_keeps_backing_off(sched):
+    delays(sched, ['fail', 'fail'])
+    assert delays(sched, ['rejected']) == [30]
+    assert sched.fail_streak == 3
+
+
+def test_portal_down_backs_off_from_fast_interval(sched):
+    assert delays(sched, ['portal_down'] * 7) == [2, 4, 8, 16, 32, 60, 60]
+    assert sched.state == 'backoff'
+
+
+def test_upstream_is_capped_at_base_interval(sched):
+    assert delays(sched, ['upstream'] * 6)[-1] == 30
+    assert sched.state == 'upstream'
+
+
+def test_recovery_resets_backoff_and_rechecks(sched):
+    delays(sched, ['fail'] * 6)
+    assert delays(sched, ['ok'] * 4) == [2, 2, 2, 30]
+    assert sched.backoff_level == 0 and sched.fail_streak == 0
+    assert sched.state == 'normal'
+
+
+def test_jitter_only_on_backoff_and_steady():
+    s = ProbeScheduler()
+    s.configure({"check_interval_sec": 30, "portal_backoff_max_sec": 300, "schedule_jitter": 0.2})
+    s.on_result('ok')
+    s.recheck_left = 0
+    s.on_result('ok')
+    assert s.next_delay() == 30
+    for _ in range(20):
+        s.on_result('rejected')
+        s.backoff_level = 1
+        assert 24 <= s.next_delay() <= 36
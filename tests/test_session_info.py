@@ -0,0 +1,61 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from campus_core import SessionInfo
+
+
+@pytest.mark.parametrize('value, expected', [
+    (3600, 3600.0),
+    ('7200', 7200.0),
+    ('01:02:03', 3723.0),
+    ('1天2小时3分4秒', 93784.0),
+    ('5分钟', 300.0),
+    ('', None),
+    ('unknown', None),
+    (-1, None),
+    (True, None),
+    (None, None),
+])
+def test_parse_duration(value, expected):
+    assert SessionInfo.parse_duration(value) == expected
+
+
+@pytest.mark.parametrize('value, expected', [
+    (512, 512.0),
+    ('512M', 512.0),
+    ('1.5G', 1536.0),
+    ('300KB', 300 / 1024.0),
+    ('2 GB', 2048.0),
+    ('lots', None),
+    (None, None),
+])
+def test_parse_flow(value, expected):
+    if expected is None:
+        assert SessionInfo.parse_flow(value) is None
+    else:
+        assert SessionInfo.parse_flow(value) == pytest.approx(expected)
+
+
+def test_parse_online_user_info():
+    info = SessionInfo.parse({'result': 'success', 'userIndex': 'abc', 'onlineTime': '00:10:00',
+                              'maxLeftTime': '', 'leftTime': '2小时', 'leftFlow': '1G'})
+    assert info.online and info.user_index == 'abc'
+    assert info.online_sec == 600.0
+    assert info.left_sec == 7200.0  # 第一个字段为空时取下一个
+    assert info.left_flow_mb == 1024.0
+
+
+def test_parse_offline_and_garbage():
+    info = SessionInfo.parse({'result': 'fail', 'userIndex': ''})
+    assert not info.online and info.user_index is None and info.left_sec is None
+    assert not SessionInfo.parse(None).online
+
+
+def test_left_at_counts_down_from_fetch():
+    info = SessionInfo.parse({'userIndex': 'abc', 'leftTime': 100})
+    assert info.left_at(info.fetched_at + 30) == 70.0
+    assert SessionInfo.parse({}).left_at() is None